@@ -0,0 +1,54 @@
+from wikigraph import wikitext
+from wikigraph.experiments import benchmark
+
+
+def test_corpora():
+    """
+    test that the corpora are the same for the same seed and are laid out like the dumps
+    """
+    corpora = benchmark.get_corpora()
+    assert corpora == benchmark.get_corpora()
+    assert corpora != benchmark.get_corpora(seed=1)
+    assert set(corpora) == {'small', 'median', 'pathological'}
+
+    assert wikitext.get_title(corpora['small'][1]) == 'Stub 1'
+    assert wikitext.parse_redirect(corpora['small'][0]) == 'Stub 1'
+    assert wikitext.char_count(corpora['median'][0]) > 0
+    assert len(wikitext.collect_links(corpora['pathological'][0])) >= 5000
+
+
+def test_run_benchmarks(tmp_path):
+    """
+    test that every case is timed on every corpus, and that the results survive being saved
+    """
+    pages = benchmark.get_corpora()['small'][:5]
+    results = benchmark.run_benchmarks({'small': pages}, repeat=1, min_time=0.0)
+
+    assert set(results['results']) == {'parse_page', 'collect_links_batch', 'collect_links',
+                                       'parse_wikilink', 'char_count', 'last_revision',
+                                       'get_title', 'parse_redirect', benchmark.BASELINE_CASE}
+    assert results['results']['get_title']['small']['items'] == 5
+    assert results['results']['collect_links_batch']['small']['items'] == 1
+    assert results['speedups']['small'] > 0
+
+    benchmark.save_results(results, str(tmp_path / 'benchmark.json'))
+    assert benchmark.load_results(str(tmp_path / 'benchmark.json')) == results
+
+
+def test_find_regressions():
+    """
+    test that only our cases that are slower than the threshold are regressions
+    """
+    def results(seconds: dict) -> dict:
+        return {'version': benchmark.BENCHMARK_VERSION,
+                'results': {case: {'small': {'seconds': s}} for case, s in seconds.items()}}
+
+    baseline = results({'collect_links': 1.0, 'get_title': 1.0, benchmark.BASELINE_CASE: 1.0})
+    current = results({'collect_links': 1.2, 'get_title': 1.5, benchmark.BASELINE_CASE: 9.0,
+                       'char_count': 5.0})
+
+    regressions = benchmark.find_regressions(current, baseline, threshold=0.25)
+    assert len(regressions) == 1
+    assert regressions[0].startswith('get_title on the small corpus')
+    assert benchmark.find_regressions(current, baseline, threshold=0.1)[0].startswith(
+        'collect_links')
@@ -0,0 +1,269 @@
+import os
+import sys
+import concurrent.futures
+
+import pytest
+
+from wikigraph import csr_graph, process_wikitext, redirects, title_ids
+from wikigraph.graph_implementation import Graph
+
+# graph_analysis imports graph_implementation as a top level module
+sys.path.append('wikigraph')
+import graph_analysis  # noqa: E402
+
+VERTICES = [('first', 100, 111), ('second', 100, 32), ('third', 30, 38),
+            ('fourth', 400, 411), ('fifth', 500, 50)]
+EDGES = [('first', 'second'), ('first', 'third'), ('fourth', 'fifth'),
+         ('second', 'first'), ('third', 'fifth')]
+
+
+@pytest.fixture
+def graphs():
+    """The same small graph as a Graph and as a CSRGraph"""
+    g = Graph()
+    for item, char_count, last_edit in VERTICES:
+        g.add_vertex(item, char_count, last_edit)
+    for item1, item2 in EDGES:
+        g.add_edge(item1, item2)
+
+    return g, csr_graph.CSRGraph.from_graph(g)
+
+
+def test_same_queries(graphs):
+    """
+    test that every query gives the same answer on both graphs
+    """
+    g, csr = graphs
+    assert csr.get_all_vertices() == g.get_all_vertices()
+
+    for item in g.get_all_vertices():
+        assert csr.get_neighbours(item) == g.get_neighbours(item)
+        assert csr.get_vertex_degree(item) == g.get_vertex_degree(item)
+        assert csr.get_vertex_char_count(item) == g.get_vertex_char_count(item)
+        assert csr.get_vertex_edit_time(item) == g.get_vertex_edit_time(item)
+        for other in g.get_all_vertices():
+            assert csr.adjacent(item, other) == g.adjacent(item, other)
+
+    assert not csr.adjacent('first', 'missing')
+    with pytest.raises(ValueError):
+        csr.get_neighbours('missing')
+
+
+def test_scores(graphs):
+    """
+    test that scores set through the vertex views or all at once match Graph
+    """
+    g, csr = graphs
+    for v in g.get_all_vertex_values():
+        v.set_score()
+    for v in csr.get_all_vertex_values():
+        v.set_score()
+
+    for item in g.get_all_vertices():
+        assert csr.get_vertex_score(item) == pytest.approx(g.get_vertex_score(item))
+
+    csr.scores = csr_graph.array('d', bytes(8 * len(csr.items)))
+    csr.set_scores()
+    for item in g.get_all_vertices():
+        assert csr.get_vertex_score(item) == pytest.approx(g.get_vertex_score(item))
+
+
+def test_graph_analysis(graphs):
+    """
+    test that graph_analysis runs unchanged on a CSRGraph
+    """
+    g, csr = graphs
+    assert graph_analysis.find_oldest_edits(csr, 3) == graph_analysis.find_oldest_edits(g, 3)
+    assert graph_analysis.find_fewest_edges_threshold(csr, 1) == \
+        graph_analysis.find_fewest_edges_threshold(g, 1)
+    assert [csr.get_vertex_degree(item)
+            for item in graph_analysis.find_fewest_edges_no_threshold(csr, 3)] == [1, 1, 2]
+
+
+def test_load_csr_graph(tmp_path):
+    """
+    test that loading from the save files skips unknown links, duplicates and self links,
+    and reads the files as UTF-8
+    """
+    (tmp_path / 'info.tsv').write_text('a\t\t10\t5\nb\t\t20\t6\nc\t\t30\t7\nZürich\t\t1\t1\n',
+                                       encoding='utf-8')
+    (tmp_path / 'links.tsv').write_text('a\tb\tb\ta\tmissing\nb\tc\nmissing\ta\nc\t\n'
+                                        'Zürich\ta\n', encoding='utf-8')
+
+    csr = csr_graph.load_csr_graph(str(tmp_path / 'info.tsv'), str(tmp_path / 'links.tsv'))
+    assert csr.get_neighbours('Zürich') == {'a'}
+    csr = csr_graph.load_csr_graph_parallel(str(tmp_path / 'info.tsv'),
+                                            str(tmp_path / 'links.tsv'), max_workers=1)
+    assert csr.get_neighbours('Zürich') == {'a'}
+    assert csr.get_neighbours('a') == {'b', 'Zürich'}
+
+    csr = csr_graph.load_csr_graph(str(tmp_path / 'info.tsv'), str(tmp_path / 'links.tsv'))
+    assert csr.get_neighbours('a') == {'b', 'Zürich'}
+    assert csr.get_neighbours('b') == {'a', 'c'}
+    assert csr.get_vertex_char_count('c') == 30
+    assert csr.get_vertex_edit_time('c') == 7
+    assert list(csr.offsets) == [0, 2, 4, 5, 6]
+
+
+def test_load_csr_graph_parallel(tmp_path):
+    """
+    test that the parallel loader builds the same graph as the sequential one
+    """
+    (tmp_path / 'info.tsv').write_text(''.join(f'v{i}\t\t{i}\t{i % 5}\n' for i in range(30)))
+    (tmp_path / 'links.tsv').write_text(''.join(
+        f'v{i}\t' + '\t'.join(f'v{(i * j) % 31}' for j in range(1, 6)) + '\n'
+        for i in range(30)))
+
+    sequential = csr_graph.load_csr_graph(str(tmp_path / 'info.tsv'),
+                                          str(tmp_path / 'links.tsv'))
+    parallel = csr_graph.load_csr_graph_parallel(str(tmp_path / 'info.tsv'),
+                                                 str(tmp_path / 'links.tsv'),
+                                                 num_ranges=4, max_workers=2)
+
+    assert parallel.get_all_vertices() == sequential.get_all_vertices()
+    for item in sequential.get_all_vertices():
+        assert parallel.get_neighbours(item) == sequential.get_neighbours(item)
+        assert parallel.get_vertex_char_count(item) == sequential.get_vertex_char_count(item)
+        assert parallel.get_vertex_edit_time(item) == sequential.get_vertex_edit_time(item)
+
+
+def test_load_csr_graph_interned(tmp_path):
+    """
+    test that collapsing the redirects on the interned edges gives the same graph as
+    collapsing the links files and loading them
+    """
+    (tmp_path / 'info-0001.tsv').write_text('a\t\t10\t1\nb\t\t20\t2\nr1\tr2\t0\t0\n'
+                                            'r2\tb\t0\t0\nloop1\tloop2\t0\t0\n'
+                                            'loop2\tloop1\t0\t0\n')
+    (tmp_path / 'info-0002.tsv').write_text('c\t\t30\t3\ndead\tnowhere\t0\t0\na\t\t99\t9\n')
+    (tmp_path / 'links-0001.tsv').write_text('a\tr1\tb\tloop1\tmissing\ta\nb\tdead\nr1\tc\n')
+    (tmp_path / 'links-0002.tsv').write_text('c\tr2\n')
+    (tmp_path / 'redirects-0001.tsv').write_text('r1\tr2\nr2\tb\nloop1\tloop2\nloop2\tloop1\n')
+    (tmp_path / 'redirects-0002.tsv').write_text('dead\tnowhere\n')
+    process_wikitext.write_manifests(str(tmp_path))
+
+    title_ids.intern_shards(str(tmp_path), max_workers=2)
+    resolver = redirects.build_from_shards(str(tmp_path))
+    interned = csr_graph.load_csr_graph_interned(str(tmp_path / 'wiki-info.manifest'),
+                                                 str(tmp_path / 'wiki-titles.bin'),
+                                                 str(tmp_path / 'wiki-edges.manifest'),
+                                                 resolver, str(tmp_path / 'vertices.bin'),
+                                                 max_workers=2)
+
+    process_wikitext.collapse_redirects(str(tmp_path / 'wiki-info.manifest'),
+                                        str(tmp_path / 'wiki-links.manifest'), None,
+                                        str(tmp_path / 'info-collapsed.tsv'),
+                                        str(tmp_path / 'links-collapsed.tsv'), resolver)
+    expected = csr_graph.load_csr_graph(str(tmp_path / 'info-collapsed.tsv'),
+                                        str(tmp_path / 'links-collapsed.tsv'))
+
+    assert interned.get_all_vertices() == expected.get_all_vertices() == {'a', 'b', 'c'}
+    for item in expected.get_all_vertices():
+        assert interned.get_neighbours(item) == expected.get_neighbours(item)
+        assert interned.get_vertex_char_count(item) == expected.get_vertex_char_count(item)
+        assert interned.get_vertex_edit_time(item) == expected.get_vertex_edit_time(item)
+    assert interned.get_neighbours('b') == {'a', 'c'}
+    assert interned.get_vertex_char_count('a') == 10
+
+
+def test_map_bounded():
+    """
+    test that the results come back in order with at most max_pending tasks submitted and
+    not yet returned
+    """
+    taken = []
+
+    def tasks():
+        for i in range(20):
+            taken.append(i)
+            yield i, 3
+
+    results = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+        for result in csr_graph._map_bounded(executor, pow, tasks(), 4):
+            assert len(taken) - len(results) <= 4
+            results.append(result)
+
+    assert results == [i ** 3 for i in range(20)]
+
+
+def test_snapshot(tmp_path, graphs):
+    """
+    test that a saved graph loads with the same vertices, edges and attributes
+    """
+    g, _ = graphs
+    g.save(str(tmp_path / 'snapshot'))
+    loaded = Graph.load(str(tmp_path / 'snapshot'))
+
+    assert loaded.get_all_vertices() == g.get_all_vertices()
+    for item in g.get_all_vertices():
+        assert loaded.get_neighbours(item) == g.get_neighbours(item)
+        assert loaded.get_vertex_char_count(item) == g.get_vertex_char_count(item)
+        assert loaded.get_vertex_edit_time(item) == g.get_vertex_edit_time(item)
+    assert loaded.adjacent('first', 'second') and not loaded.adjacent('first', 'fifth')
+
+    # Scores can be set on a loaded snapshot, and saved again
+    loaded.set_scores()
+    loaded.save(str(tmp_path / 'snapshot'))
+    reloaded = csr_graph.CSRGraph.load(str(tmp_path / 'snapshot'))
+    assert reloaded.get_vertex_score('fifth') == loaded.get_vertex_score('fifth') > 0
+
+
+def test_snapshot_version(tmp_path, graphs):
+    """
+    test that a snapshot of another version is rejected
+    """
+    _, csr = graphs
+    csr.save(str(tmp_path / 'snapshot'))
+    with open(tmp_path / 'snapshot' / 'graph.bin', 'r+b') as f:
+        f.seek(6)
+        f.write(bytes([csr_graph.SNAPSHOT_VERSION + 1]))
+
+    with pytest.raises(ValueError):
+        csr_graph.CSRGraph.load(str(tmp_path / 'snapshot'))
+
+
+def test_snapshot_failed_save(tmp_path, graphs, monkeypatch):
+    """
+    test that a save that fails while writing the graph file keeps the old snapshot whole,
+    and that a snapshot saved from a graph numbered by another title table copies it
+    """
+    _, csr = graphs
+    csr.save(str(tmp_path / 'snapshot'))
+
+    (tmp_path / 'info.tsv').write_text('x\t\t1\t1\ny\t\t2\t2\n')
+    (tmp_path / 'links.tsv').write_text('x\ty\n')
+    other = csr_graph.load_csr_graph_parallel(str(tmp_path / 'info.tsv'),
+                                              str(tmp_path / 'links.tsv'), max_workers=1)
+
+    def fail(*args, **kwargs):
+        raise RuntimeError('disk full')
+
+    with monkeypatch.context() as m:
+        m.setattr(csr_graph, 'tqdm', fail)
+        with pytest.raises(RuntimeError):
+            other.save(str(tmp_path / 'snapshot'))
+
+    loaded = csr_graph.CSRGraph.load(str(tmp_path / 'snapshot'))
+    assert loaded.get_all_vertices() == csr.get_all_vertices()
+
+    other.save(str(tmp_path / 'snapshot'))
+    loaded = csr_graph.CSRGraph.load(str(tmp_path / 'snapshot'))
+    assert loaded.get_neighbours('x') == {'y'}
+    assert os.path.exists(tmp_path / 'info-titles.bin')
+
+
+def test_snapshot_title_mismatch(tmp_path, graphs):
+    """
+    test that a snapshot whose title table does not match its graph file is rejected
+    """
+    _, csr = graphs
+    csr.save(str(tmp_path / 'snapshot'))
+    title_ids.TitleTable.build(['first', 'second'], str(tmp_path / 'snapshot' / 'titles.bin'))
+
+    with pytest.raises(ValueError, match='2 titles for 5 vertices'):
+        csr_graph.CSRGraph.load(str(tmp_path / 'snapshot'))
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
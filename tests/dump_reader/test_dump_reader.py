@@ -0,0 +1,78 @@
+import pytest
+
+import mmap
+
+from wikigraph import partition_data, wikitext, dump_reader
+from wikigraph.dump_reader import DumpReader
+
+SAMPLE_DUMP = 'tests/dump_reader/sample.xml'
+
+byte_index = partition_data.create_byte_index(SAMPLE_DUMP)
+
+
+def test_create_byte_index():
+    """
+    test that every <page> element is indexed from its opening tag to its closing tag
+    """
+    with open(SAMPLE_DUMP, 'rb') as reader:
+        dump = reader.read()
+
+    assert len(byte_index) == dump.count(b'<page>')
+    assert all(dump[offset:offset + length].startswith(b'<page>') and
+               dump[offset:offset + length].endswith(b'</page>')
+               for offset, length in byte_index)
+
+
+def test_byte_index_round_trip(tmp_path):
+    """
+    test that a written byte index reads back unchanged
+    """
+    index_file = str(tmp_path / 'byte-index.txt')
+    partition_data.write_byte_index(byte_index, index_file)
+
+    assert partition_data.read_byte_index(index_file) == byte_index
+
+
+def test_get_page():
+    """
+    test that pages are sliced out of the dump and decoded in file order
+    """
+    with DumpReader(SAMPLE_DUMP, byte_index) as dump:
+        titles = [wikitext.get_title(page) for page in dump.iter_pages()]
+        anarchism = dump.get_page(1)
+
+    assert titles == ['AccessibleComputing', 'Anarchism', 'Computer accessibility']
+    assert wikitext.extract_content(anarchism).endswith('[[Computer accessibility]]é')
+
+
+
+@pytest.mark.parametrize('num_ranges', [1, 2, 3, 50])
+def test_aligned_ranges_cover_every_page_once(num_ranges):
+    """
+    test that page aligned byte ranges split the dump without losing or repeating pages
+    """
+    ranges = dump_reader.get_aligned_ranges(SAMPLE_DUMP, num_ranges)
+
+    with open(SAMPLE_DUMP, 'rb') as reader:
+        buffer = mmap.mmap(reader.fileno(), 0, access=mmap.ACCESS_READ)
+        spans = [span for start, end in ranges
+                 for span in dump_reader.iter_page_spans(buffer, start, end)]
+        buffer.close()
+
+    assert len(ranges) <= num_ranges
+    assert spans == byte_index
+
+
+def test_page_spans_unterminated_page():
+    """
+    test that a page without a </page> tag raises instead of yielding a negative length
+    """
+    buffer = b'<mediawiki><page><title>x</title>'
+    with pytest.raises(ValueError, match='offset 11'):
+        list(dump_reader.iter_page_spans(buffer))
+
+    assert list(dump_reader.iter_page_spans(b'<x><page>a</page>' + buffer, 0, 17)) == [(3, 14)]
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,135 @@
+import random
+import sys
+
+import pytest
+
+from wikigraph import csr_graph
+from wikigraph.graph_implementation import Graph
+
+# graph_analysis imports graph_implementation as a top level module
+sys.path.append('wikigraph')
+import graph_analysis  # noqa: E402
+
+
+def random_graph(num_vertices, seed):
+    """A random graph with many repeated attribute values, so that ties are common"""
+    rng = random.Random(seed)
+    g = Graph()
+    for i in range(num_vertices):
+        g.add_vertex(f'v{i}', rng.randrange(10), rng.randrange(10))
+    for _ in range(2 * num_vertices):
+        item1, item2 = f'v{rng.randrange(num_vertices)}', f'v{rng.randrange(num_vertices)}'
+        if item1 != item2:
+            g.add_edge(item1, item2)
+    for v in g.get_all_vertex_values():
+        v.set_score()
+    return g
+
+
+def expected_smallest(g, value, n):
+    """The first n items of g ordered by (value, item)"""
+    return sorted(g.get_all_vertices(), key=lambda item: (value(item), item))[:n]
+
+
+@pytest.mark.parametrize('backend', ['graph', 'csr'])
+@pytest.mark.parametrize('n', [0, 1, 7, 50])
+def test_reports_match_sorting(backend, n):
+    """
+    test that every report gives the same vertices, in the same order, as sorting all of
+    them by (value, item), on both graph backends
+    """
+    g = random_graph(50, n)
+    analysed = g if backend == 'graph' else csr_graph.CSRGraph.from_graph(g)
+    if backend == 'csr':
+        analysed.set_scores()
+
+    assert graph_analysis.find_smallest_char_counts(analysed, n) == \
+        expected_smallest(g, g.get_vertex_char_count, n)
+    assert graph_analysis.find_fewest_edges_no_threshold(analysed, n) == \
+        expected_smallest(g, g.get_vertex_degree, n)
+    assert graph_analysis.find_smallest_score(analysed, n) == \
+        expected_smallest(g, g.get_vertex_score, n)
+
+    oldest = sorted(g.get_all_vertices(), key=lambda item: (g.get_vertex_edit_time(item), item))
+    assert graph_analysis.find_oldest_edits(analysed, n) == (oldest[-n:] if n else [])
+
+    assert graph_analysis.find_fewest_edges_threshold(analysed, 2) == \
+        {item for item in g.get_all_vertices() if g.get_vertex_degree(item) <= 2}
+    assert graph_analysis.find_fewest_edges_threshold(analysed, 2, n) == \
+        set(item for item in expected_smallest(g, g.get_vertex_degree, n)
+            if g.get_vertex_degree(item) <= 2)
+
+
+def test_sorted_input():
+    """
+    test that already sorted and constant attributes, which made the recursive quickselect
+    quadratic and exceed the recursion limit, are handled
+    """
+    g = Graph()
+    for i in range(5000):
+        g.add_vertex('v%05d' % i, i, 0)
+
+    assert graph_analysis.find_smallest_char_counts(g, 3) == ['v00000', 'v00001', 'v00002']
+    assert graph_analysis.find_oldest_edits(g, 2) == ['v04998', 'v04999']
+    assert graph_analysis.find_fewest_edges_no_threshold(g, 2) == ['v00000', 'v00001']
+
+
+@pytest.mark.parametrize('backend', ['graph', 'csr'])
+def test_analysis(tmp_path, backend):
+    """
+    test that analysis writes the same reports as the find functions, and times each metric
+    """
+    g = random_graph(40, 3)
+    analysed = g if backend == 'graph' else csr_graph.CSRGraph.from_graph(g)
+    if backend == 'csr':
+        analysed.set_scores()
+
+    metrics = graph_analysis.METRICS + [
+        graph_analysis.Metric('few_links', 'degree', threshold=1)]
+    timings = graph_analysis.analysis(analysed, str(tmp_path / 'analysis'), 5, metrics)
+
+    assert set(timings) == {'columns', 'oldest_edits', 'shortest_text', 'least_links',
+                            'lowest_score', 'few_links'}
+    expected = {'oldest_edits': graph_analysis.find_oldest_edits(g, 5),
+                'shortest_text': graph_analysis.find_smallest_char_counts(g, 5),
+                'least_links': graph_analysis.find_fewest_edges_no_threshold(g, 5),
+                'lowest_score': graph_analysis.find_smallest_score(g, 5)}
+    for name, report in expected.items():
+        assert (tmp_path / 'analysis' / (name + '.txt')).read_text().split('\n') == report
+
+    few_links = (tmp_path / 'analysis' / 'few_links.txt').read_text().split('\n')
+    assert set(few_links) == graph_analysis.find_fewest_edges_threshold(g, 1, 5)
+
+
+def test_stream_analysis(tmp_path):
+    """
+    test that the streaming reports match the graph reports, with the degree of each
+    article counted from its own links row
+    """
+    g = random_graph(40, 4)
+    info = ''.join(f'{item}\t\t{g.get_vertex_char_count(item)}\t{g.get_vertex_edit_time(item)}\n'
+                   for item in sorted(g.get_all_vertices()))
+    # Write every edge from both ends, with a repeated link and a self link that are ignored
+    links = ''.join(item + '\t' + '\t'.join(sorted(g.get_neighbours(item)) + [item]) + '\t\n'
+                    for item in sorted(g.get_all_vertices()))
+    (tmp_path / 'info.tsv').write_text(info)
+    (tmp_path / 'links.tsv').write_text(links)
+
+    timings = graph_analysis.stream_analysis(str(tmp_path / 'info.tsv'),
+                                             str(tmp_path / 'links.tsv'),
+                                             str(tmp_path / 'analysis'), 6)
+    assert set(timings) == {'info', 'links'}
+
+    expected = {'oldest_edits': graph_analysis.find_oldest_edits(g, 6),
+                'shortest_text': graph_analysis.find_smallest_char_counts(g, 6),
+                'least_links': graph_analysis.find_fewest_edges_no_threshold(g, 6)}
+    for name, report in expected.items():
+        assert (tmp_path / 'analysis' / (name + '.txt')).read_text().split('\n') == report
+
+    with pytest.raises(ValueError):
+        graph_analysis.stream_analysis(str(tmp_path / 'info.tsv'), str(tmp_path / 'links.tsv'),
+                                       str(tmp_path / 'analysis'), 6, graph_analysis.METRICS)
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,105 @@
+import bz2
+
+import pytest
+
+from wikigraph import partition_data, multistream, process_wikitext
+from wikigraph.dump_reader import DumpReader
+
+SAMPLE_DUMP = 'tests/dump_reader/sample.xml'
+
+with open(SAMPLE_DUMP, 'rb') as reader:
+    sample_xml = reader.read()
+
+byte_index = partition_data.create_byte_index(SAMPLE_DUMP)
+with DumpReader(SAMPLE_DUMP, byte_index) as dump:
+    sample_pages = list(dump.iter_pages())
+
+
+@pytest.fixture
+def multistream_dump(tmp_path):
+    """Compress the sample dump into a header stream, a stream holding the first two pages
+    and a stream holding the last page and the footer, like the real multistream dump"""
+    split_points = [0, byte_index[0][0], byte_index[2][0], len(sample_xml)]
+
+    dump_file = str(tmp_path / 'sample-multistream.xml.bz2')
+    index_file = str(tmp_path / 'sample-multistream-index.txt')
+    stream_offsets = []
+
+    with open(dump_file, 'wb') as f:
+        for i in range(len(split_points) - 1):
+            stream_offsets.append(f.tell())
+            f.write(bz2.compress(sample_xml[split_points[i]:split_points[i + 1]]))
+
+    with open(index_file, 'w', encoding='utf-8') as f:
+        f.write(f'{stream_offsets[1]}:10:AccessibleComputing\n'
+                f'{stream_offsets[1]}:12:Anarchism\n'
+                f'{stream_offsets[2]}:13:Computer accessibility\n')
+
+    return dump_file, index_file, stream_offsets
+
+
+def test_read_stream_offsets(multistream_dump):
+    """
+    test that each stream offset is read once, in order
+    """
+    _, index_file, stream_offsets = multistream_dump
+
+    assert multistream.read_stream_offsets(index_file) == stream_offsets[1:]
+
+
+@pytest.mark.parametrize('num_batches', [1, 2, 5])
+def test_iter_stream_pages(multistream_dump, num_batches):
+    """
+    test that decompressing batches of streams yields every page exactly once
+    """
+    dump_file, index_file, _ = multistream_dump
+    ranges = multistream.get_stream_ranges(dump_file,
+                                           multistream.read_stream_offsets(index_file))
+
+    pages = [page for batch in multistream.split_stream_ranges(ranges, num_batches)
+             for page in multistream.iter_stream_pages(dump_file, batch)]
+
+    assert pages == sample_pages
+
+
+
+def test_process_streams(multistream_dump, tmp_path):
+    """
+    test that extracting from the compressed streams gives the same rows as extracting from
+    the uncompressed dump
+    """
+    dump_file, index_file, _ = multistream_dump
+    ranges = multistream.get_stream_ranges(dump_file,
+                                           multistream.read_stream_offsets(index_file))
+
+    process_wikitext.process_streams(dump_file, ranges, 1, str(tmp_path / 'ms-links.tsv'),
+                                     str(tmp_path / 'ms-info.tsv'))
+    process_wikitext.process_pages(SAMPLE_DUMP, byte_index, 1, str(tmp_path / 'links.tsv'),
+                                   str(tmp_path / 'info.tsv'))
+
+    for name in ['info', 'links']:
+        with open(tmp_path / f'ms-{name}-0001.tsv') as actual, \
+                open(tmp_path / f'{name}-0001.tsv') as expected:
+            assert actual.read() == expected.read()
+
+
+def test_parallel_process_multistream_failure(multistream_dump, tmp_path):
+    """
+    test that a batch of streams that cannot be decompressed is named instead of silently
+    leaving its shard out
+    """
+    dump_file, index_file, stream_offsets = multistream_dump
+    with open(dump_file, 'r+b') as f:
+        f.seek(stream_offsets[2] + 10)
+        f.write(b'\x00' * 16)
+    (tmp_path / 'graph').mkdir()
+
+    with pytest.raises(RuntimeError, match='Shards 0002 failed'):
+        process_wikitext.parallel_process_multistream(dump_file, index_file, 2,
+                                                      str(tmp_path / 'graph'), max_workers=2)
+
+    assert (tmp_path / 'graph' / 'info-0001.tsv').read_text() != ''
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,205 @@
+import pickle
+
+import pytest
+
+from wikigraph import partition_data
+
+SAMPLE_DUMP = 'tests/dump_reader/sample.xml'
+
+line_index = partition_data.create_index(SAMPLE_DUMP)
+byte_index = partition_data.create_byte_index(SAMPLE_DUMP)
+
+
+@pytest.mark.parametrize('index', [line_index, byte_index])
+def test_binary_index_round_trip(tmp_path, index):
+    """
+    test that line and byte indexes read back unchanged from the binary format
+    """
+    index_file = str(tmp_path / 'index.bin')
+    partition_data.write_index_binary(index, index_file)
+    loaded = partition_data.load_index(index_file)
+
+    assert isinstance(loaded, partition_data.BinaryIndex)
+    assert list(loaded) == index
+    assert list(loaded[1:]) == index[1:]
+    assert loaded[-1] == index[-1]
+
+
+def test_convert_index(tmp_path):
+    """
+    test that converting a text index gives the same entries as the text index
+    """
+    text_file = str(tmp_path / 'byte-index.txt')
+    binary_file = str(tmp_path / 'byte-index.bin')
+    partition_data.write_byte_index(byte_index, text_file)
+    partition_data.convert_index(text_file, binary_file)
+
+    assert partition_data.is_binary_index(binary_file)
+    assert not partition_data.is_binary_index(text_file)
+    assert list(partition_data.load_index(binary_file)) == partition_data.load_index(text_file)
+
+
+def test_binary_index_pickles_by_reference(tmp_path):
+    """
+    test that pickling a binary index sends its path rather than its contents
+    """
+    index_file = str(tmp_path / 'index.bin')
+    partition_data.write_index_binary(list(range(100000)), index_file)
+    view = partition_data.load_index(index_file)[10:20]
+
+    pickled = pickle.dumps(view)
+
+    assert len(pickled) < 1000
+    assert list(pickle.loads(pickled)) == list(range(10, 20))
+
+
+
+def test_count_lines():
+    """
+    test that the detected line count matches the file
+    """
+    with open(SAMPLE_DUMP, 'rb') as reader:
+        assert partition_data.count_lines(SAMPLE_DUMP) == len(reader.readlines())
+
+
+def test_get_line_count(tmp_path, monkeypatch):
+    """
+    test that the line count found from the index and the tail of the file matches
+    count_lines, whether or not the file ends with a newline or the last page spans chunks
+    """
+    index = partition_data.create_index(SAMPLE_DUMP)
+    assert partition_data.get_line_count(SAMPLE_DUMP, index) == \
+        partition_data.count_lines(SAMPLE_DUMP)
+
+    monkeypatch.setattr(partition_data, 'COUNT_CHUNK_SIZE', 7)
+    with open(SAMPLE_DUMP, 'rb') as reader:
+        (tmp_path / 'dump.xml').write_bytes(reader.read().rstrip(b'\n'))
+    filename = str(tmp_path / 'dump.xml')
+    assert partition_data.get_line_count(filename, index) == \
+        partition_data.count_lines(filename)
+
+
+def test_get_line_ranges(tmp_path):
+    """
+    test that line ranges cover the file exactly and start on line boundaries
+    """
+    data = b''.join(b'line %d\t' % i + b'x' * (i % 7) + b'\n' for i in range(100))
+    data += b'no newline'
+    (tmp_path / 'lines.tsv').write_bytes(data)
+
+    for num_ranges in (1, 3, 8, 1000):
+        ranges = partition_data.get_line_ranges(str(tmp_path / 'lines.tsv'), num_ranges)
+        assert len(ranges) <= num_ranges
+        assert b''.join(data[start:end] for start, end in ranges) == data
+        assert all(start == 0 or data[start - 1:start] == b'\n' for start, _ in ranges)
+
+
+def test_round_to_list_matches_linear_scan():
+    """
+    test that the binary search rounds down exactly like scanning the index would
+    """
+    index = [1, 20, 23, 25, 40]
+    for number in range(1, 45):
+        scanned = max((i for i in index if i <= number))
+        assert partition_data.round_to_list(number, index) == (-1 if number >= 40 else scanned)
+
+
+@pytest.mark.parametrize('num_partitions', [1, 2, 3, 7])
+def test_plan_byte_partitions(num_partitions):
+    """
+    test that a partition plan covers every page exactly once and in order
+    """
+    index = [(i * 100, 50 + (i * 37) % 400) for i in range(200)]
+    plan = partition_data.plan_byte_partitions(index, num_partitions)
+    stats = partition_data.get_byte_partition_stats(plan, index)
+
+    assert len(plan) == num_partitions
+    assert [page for first, end in plan for page in range(first, end)] == list(range(200))
+    assert sum(row[2] for row in stats) == 200
+
+
+
+def test_partition_writes_every_line(tmp_path):
+    """
+    test that the partitions concatenate back into the dataset, split at the partition points
+    """
+    output = str(tmp_path / 'sample')
+    partition_points = [line_index[1], line_index[2], partition_data.count_lines(SAMPLE_DUMP) + 1]
+    partition_data.partition(SAMPLE_DUMP, partition_points, output)
+
+    partitions = []
+    for n in range(1, 4):
+        with open(output + '-%04d.xml' % n, 'rb') as reader:
+            partitions.append(reader.read())
+
+    with open(SAMPLE_DUMP, 'rb') as reader:
+        assert b''.join(partitions) == reader.read()
+    assert partitions[1].startswith(b'  <page>')
+    assert not (tmp_path / 'sample-checkpoint.txt').exists()
+
+
+def test_partition_normalizes_points(tmp_path):
+    """
+    test that duplicate, out of order and negative partition points split the dataset at
+    each distinct point once, as get_partition_points_num returns such points for small dumps
+    """
+    output = str(tmp_path / 'sample')
+    line_count = partition_data.count_lines(SAMPLE_DUMP)
+    partition_points = partition_data.get_partition_points_num(20, line_index, line_count)
+    partition_data.partition(SAMPLE_DUMP, partition_points, output)
+
+    with open(SAMPLE_DUMP, 'rb') as reader:
+        lines = reader.readlines()
+    starts = [1] + list(line_index) + [line_count + 1]
+    for n in range(1, len(starts)):
+        with open(output + '-%04d.xml' % n, 'rb') as reader:
+            assert reader.read() == b''.join(lines[starts[n - 1] - 1:starts[n] - 1])
+    assert not (tmp_path / ('sample-%04d.xml' % len(starts))).exists()
+
+
+def test_partition_resumes_from_checkpoint(tmp_path):
+    """
+    test that partitioning resumes after the last completed partition
+    """
+    output = str(tmp_path / 'sample')
+    partition_points = [line_index[1], line_index[2]]
+    with open(SAMPLE_DUMP, 'rb') as reader:
+        lines = reader.readlines()
+    byte_offset = sum(len(line) for line in lines[:line_index[2] - 1])
+
+    # Pretend that a previous run finished the first two partitions
+    partition_data.write_partition_checkpoint(
+        output + '-checkpoint.txt', 3, line_index[2], byte_offset,
+        partition_data.get_checkpoint_key(SAMPLE_DUMP, partition_points))
+    partition_data.partition(SAMPLE_DUMP, partition_points, output)
+
+    assert not (tmp_path / 'sample-0001.xml').exists()
+    with open(output + '-0003.xml', 'rb') as reader:
+        assert reader.read() == b''.join(lines[line_index[2] - 1:])
+
+
+@pytest.mark.parametrize('stale', ['points', 'dataset', 'unkeyed'])
+def test_partition_ignores_stale_checkpoint(tmp_path, stale):
+    """
+    test that a checkpoint written for other partition points or another dataset, or without
+    a key, is not resumed from
+    """
+    output = str(tmp_path / 'sample')
+    partition_points = [line_index[1], line_index[2]]
+    keys = {'points': partition_data.get_checkpoint_key(SAMPLE_DUMP, [line_index[2]]),
+            'dataset': partition_data.get_checkpoint_key(__file__, partition_points),
+            'unkeyed': ''}
+    partition_data.write_partition_checkpoint(output + '-checkpoint.txt', 3, line_index[2],
+                                              1000, keys[stale])
+    partition_data.partition(SAMPLE_DUMP, partition_points, output)
+
+    partitions = []
+    for n in range(1, 4):
+        with open(output + '-%04d.xml' % n, 'rb') as reader:
+            partitions.append(reader.read())
+    with open(SAMPLE_DUMP, 'rb') as reader:
+        assert b''.join(partitions) == reader.read()
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
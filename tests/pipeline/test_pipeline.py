@@ -0,0 +1,204 @@
+import os
+import threading
+import concurrent.futures
+
+import pytest
+
+from wikigraph import pipeline, process_dump
+
+# Lets the two branches of the diamond below prove that they run at the same time. Once it
+# is aborted, they no longer wait for each other.
+barrier = threading.Barrier(2)
+
+
+def copy_upper(source, output):
+    """Write the contents of source to output in upper case"""
+    with open(source, 'r') as f, open(output, 'w') as g:
+        g.write(f.read().upper())
+
+
+def join_files(first, second, output):
+    """Write the contents of first and second to output"""
+    with open(first, 'r') as f, open(second, 'r') as g, open(output, 'w') as h:
+        h.write(f.read() + g.read())
+
+
+def repeat(source, times, output):
+    """Write the contents of source times times to output, once both branches have started"""
+    try:
+        barrier.wait(timeout=10)
+    except threading.BrokenBarrierError:
+        pass
+    with open(source, 'r') as f, open(output, 'w') as g:
+        g.write(f.read() * times)
+
+
+def count_in_pool(source, output):
+    """Write the length of every line of source to output, computed in a process pool"""
+    with open(source, 'r') as f:
+        lines = f.read().splitlines()
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=2, mp_context=pipeline.get_process_context()) as executor:
+        lengths = list(executor.map(len, lines))
+    with open(output, 'w') as g:
+        g.write(''.join(f'{length}\n' for length in lengths))
+
+
+def fail(source, output):
+    """Raise a ValueError"""
+    raise ValueError('this stage always fails')
+
+
+def diamond(tmp_path, times=2):
+    """Return four stages: upper reads source.txt, left and right both read its output, and
+    join reads theirs"""
+    path = lambda name: str(tmp_path / name)
+    return [pipeline.Stage('join', join_files, (path('left.txt'), path('right.txt'),
+                                                path('joined.txt')),
+                           (path('left.txt'), path('right.txt')), (path('joined.txt'),)),
+            pipeline.Stage('left', repeat, (path('upper.txt'), times, path('left.txt')),
+                           (path('upper.txt'),), (path('left.txt'),)),
+            pipeline.Stage('right', repeat, (path('upper.txt'), 1, path('right.txt')),
+                           (path('upper.txt'),), (path('right.txt'),)),
+            pipeline.Stage('upper', copy_upper, (path('source.txt'), path('upper.txt')),
+                           (path('source.txt'),), (path('upper.txt'),))]
+
+
+def test_run_stages(tmp_path):
+    """
+    test that stages run in dependency order with independent stages running at the same
+    time, and that only the stages affected by a change run again
+    """
+    (tmp_path / 'source.txt').write_text('a')
+    cache = str(tmp_path / 'cache.tsv')
+
+    barrier.reset()
+    ran = pipeline.run_stages(diamond(tmp_path), cache)
+    assert not barrier.broken
+    barrier.abort()
+    assert ran[0] == 'upper' and sorted(ran[1:3]) == ['left', 'right'] and ran[3] == 'join'
+    assert (tmp_path / 'joined.txt').read_text() == 'AAA'
+
+    assert pipeline.run_stages(diamond(tmp_path), cache) == []
+
+    # A changed parameter reruns the stage, but its output is an input of join which is
+    # represented by the key of left, so join runs again too
+    assert pipeline.run_stages(diamond(tmp_path, times=3), cache, max_workers=1) == \
+        ['left', 'join']
+    assert (tmp_path / 'joined.txt').read_text() == 'AAAA'
+
+    # A changed source file reruns everything below it, and a missing output reruns its
+    # stage
+    (tmp_path / 'source.txt').write_text('bb')
+    os.remove(tmp_path / 'joined.txt')
+    assert len(pipeline.run_stages(diamond(tmp_path, times=3), cache)) == 4
+    assert (tmp_path / 'joined.txt').read_text() == 'BBBBBBBB'
+
+    os.remove(tmp_path / 'joined.txt')
+    assert pipeline.run_stages(diamond(tmp_path, times=3), cache) == ['join']
+    assert pipeline.run_stages(diamond(tmp_path, times=3), cache, force=['upper']) == \
+        ['upper']
+
+
+def test_run_stages_failure(tmp_path):
+    """
+    test that the stages after a failed stage do not run, but the others do
+    """
+    (tmp_path / 'source.txt').write_text('a')
+    barrier.abort()
+    stages = diamond(tmp_path)
+    stages[1] = pipeline.Stage('left', fail, stages[1].args[::2], stages[1].inputs,
+                               stages[1].outputs)
+    stages[2] = pipeline.Stage('right', copy_upper, stages[2].args[::2], stages[2].inputs,
+                               stages[2].outputs)
+
+    with pytest.raises(RuntimeError, match='left failed, so join did not run'):
+        pipeline.run_stages(stages, str(tmp_path / 'cache.tsv'))
+
+    assert sorted(pipeline.read_cache(str(tmp_path / 'cache.tsv'))) == ['right', 'upper']
+
+
+def test_process_pools_in_stages(tmp_path):
+    """
+    test that stages running at the same time can each start a process pool, whose workers
+    are not forked from the threads of the pipeline
+    """
+    assert pipeline.get_process_context().get_start_method() != 'fork'
+
+    (tmp_path / 'source.txt').write_text('a\nbb\nccc\n')
+    source = str(tmp_path / 'source.txt')
+    stages = [pipeline.Stage(f'count{n}', count_in_pool, (source, str(tmp_path / f'{n}.txt')),
+                             (source,), (str(tmp_path / f'{n}.txt'),))
+              for n in range(2)]
+
+    assert sorted(pipeline.run_stages(stages, str(tmp_path / 'cache.tsv'))) == \
+        ['count0', 'count1']
+    for n in range(2):
+        assert (tmp_path / f'{n}.txt').read_text() == '1\n2\n3\n'
+
+
+def test_invalid_stages(tmp_path):
+    """
+    test that cycles, outputs written twice and missing inputs are rejected
+    """
+    path = lambda name: str(tmp_path / name)
+    a = pipeline.Stage('a', copy_upper, (), (path('b.txt'),), (path('a.txt'),))
+    b = pipeline.Stage('b', copy_upper, (), (path('a.txt'),), (path('b.txt'),))
+    with pytest.raises(ValueError, match='cycle'):
+        pipeline.get_producers([a, b])
+
+    with pytest.raises(ValueError, match='written by both'):
+        pipeline.get_producers([a, b._replace(name='c', outputs=(path('a.txt'),))])
+
+    with pytest.raises(ValueError, match='does not exist'):
+        pipeline.get_stage_keys([a])
+
+
+def test_stage_keys_code_version(tmp_path, monkeypatch):
+    """
+    test that editing a module that the stage function imports changes the stage key, but
+    editing an unrelated module does not
+    """
+    package = tmp_path / 'code_version_package'
+    package.mkdir()
+    (package / '__init__.py').write_text('')
+    (package / 'stage.py').write_text('from code_version_package import helper\n\n\n'
+                                      'def run(output):\n    helper.write(output)\n')
+    (package / 'helper.py').write_text('def write(output):\n    open(output, "w").close()\n')
+    (package / 'other.py').write_text('')
+    monkeypatch.syspath_prepend(str(tmp_path))
+    from code_version_package import stage, other  # noqa: F401
+
+    stages = [pipeline.Stage('run', stage.run, (str(tmp_path / 'a.txt'),), (),
+                             (str(tmp_path / 'a.txt'),))]
+    key = pipeline.get_stage_keys(stages)['run']
+
+    (package / 'other.py').write_text('# changed\n')
+    assert pipeline.get_stage_keys(stages)['run'] == key
+
+    (package / 'helper.py').write_text('def write(output):\n    open(output, "a").close()\n')
+    assert pipeline.get_stage_keys(stages)['run'] != key
+
+
+def test_process_xml_stages():
+    """
+    test that the stages of process_xml form a graph in which the title table is built
+    independently of the redirect stages, and the graph is loaded from the interned edges
+    """
+    for xml_path, partition_free in [('data/raw/dump.xml', False), ('data/raw/dump.xml', True),
+                                     ('data/raw/dump.xml.bz2', False)]:
+        stages = process_dump.get_stages(xml_path, 4, partition_free, True, None)
+        producers = pipeline.get_producers(stages)
+        by_name = {stage.name: stage for stage in stages}
+
+        assert by_name['extract'].outputs == by_name['intern_titles'].inputs
+        assert not any(producers[path].name == 'resolve_redirects'
+                       for path in by_name['intern_titles'].inputs)
+        assert by_name['visualize'].outputs == ('graph.html',)
+
+        assert 'collapse_redirects' not in by_name
+        if 'partition' in by_name:
+            assert producers[process_dump.PARTITIONED_DIR].name == 'partition'
+            assert process_dump.PARTITIONED_DIR in by_name['extract'].inputs
+        assert {producers[path].name for path in by_name['load_graph'].inputs} == \
+            {'extract', 'intern_titles', 'resolve_redirects'}
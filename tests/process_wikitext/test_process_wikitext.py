@@ -0,0 +1,152 @@
+import os
+
+import pytest
+
+from wikigraph import partition_data, process_wikitext
+
+SAMPLE_DUMP = 'tests/dump_reader/sample.xml'
+
+line_index = partition_data.create_index(SAMPLE_DUMP)
+byte_index = partition_data.create_byte_index(SAMPLE_DUMP)
+
+
+def read_shards(directory, name, count):
+    """Return the concatenated contents of the first count shards of name in directory"""
+    contents = ''
+    for n in range(1, count + 1):
+        with open(f'{directory}/{name}-%04d.tsv' % n, 'r') as reader:
+            contents += reader.read()
+    return contents
+
+
+@pytest.fixture
+def expected(tmp_path):
+    """The info and links rows of the sample dump, extracted without partitioning"""
+    process_wikitext.process_pages(SAMPLE_DUMP, byte_index, 1,
+                                   str(tmp_path / 'links.tsv'), str(tmp_path / 'info.tsv'))
+    return read_shards(tmp_path, 'info', 1), read_shards(tmp_path, 'links', 1)
+
+
+def test_process_partition(tmp_path, expected):
+    """
+    test that processing partitions gives the same rows as processing the whole dump
+    """
+    p_points = [line_index[1], partition_data.count_lines(SAMPLE_DUMP) + 1]
+    partition_data.partition(SAMPLE_DUMP, p_points, str(tmp_path / 'sample'))
+
+    for n in range(1, 3):
+        process_wikitext.process_partition(str(tmp_path / ('sample-%04d.xml' % n)),
+                                           line_index, p_points,
+                                           str(tmp_path / 'graph-links.tsv'),
+                                           str(tmp_path / 'graph-info.tsv'))
+
+    assert read_shards(tmp_path, 'graph-info', 2) == expected[0]
+    assert read_shards(tmp_path, 'graph-links', 2) == expected[1]
+
+
+def test_process_byte_range(tmp_path, expected):
+    """
+    test that processing page aligned byte ranges gives the same rows as processing the
+    whole dump
+    """
+    for n, (start, end) in enumerate(process_wikitext.dump_reader.get_aligned_ranges(
+            SAMPLE_DUMP, 3), start=1):
+        process_wikitext.process_byte_range(SAMPLE_DUMP, start, end, n,
+                                            str(tmp_path / 'graph-links.tsv'),
+                                            str(tmp_path / 'graph-info.tsv'))
+
+    assert read_shards(tmp_path, 'graph-info', 3) == expected[0]
+    assert read_shards(tmp_path, 'graph-links', 3) == expected[1]
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    """A data directory with the sample dump split into two partitions and its indexes"""
+    (tmp_path / 'partitioned').mkdir()
+    (tmp_path / 'graph').mkdir()
+    p_points = [line_index[1], partition_data.count_lines(SAMPLE_DUMP) + 1]
+    partition_data.partition(SAMPLE_DUMP, p_points, str(tmp_path / 'partitioned' / 'sample'))
+    partition_data.write_index(line_index, str(tmp_path / 'wiki-index.txt'))
+    partition_data.write_index(p_points, str(tmp_path / 'partitioned' / 'partition-index.txt'))
+    return tmp_path
+
+
+def test_parallel_process_partition_resume(data_dir, expected):
+    """
+    test that a rerun only processes the partitions that are missing or have changed, and
+    that the manifest records every processed partition
+    """
+    process_wikitext.parallel_process_partition(str(data_dir), 'partitioned', max_workers=2)
+
+    graph_dir = data_dir / 'graph'
+    assert read_shards(graph_dir, 'info', 2) == expected[0]
+    assert read_shards(graph_dir, 'links', 2) == expected[1]
+
+    records = process_wikitext.read_partition_manifest(str(graph_dir / 'partition-manifest.tsv'))
+    assert sorted(records) == ['0001', '0002']
+    assert sum(record.pages for record in records.values()) == len(byte_index)
+    assert records['0002'].checksum == \
+        process_wikitext.get_checksum(str(data_dir / 'partitioned' / 'sample-0002.xml'))
+
+    # Rewriting a partition with the same contents does not make it stale, but removing a
+    # shard or changing a partition does
+    partition_2 = data_dir / 'partitioned' / 'sample-0002.xml'
+    partition_2.write_bytes(partition_2.read_bytes())
+    os.remove(graph_dir / 'links-0001.tsv')
+    mtimes = {name: os.stat(graph_dir / f'info-{name}.tsv').st_mtime_ns
+              for name in ['0001', '0002']}
+
+    process_wikitext.parallel_process_partition(str(data_dir), 'partitioned', max_workers=2)
+
+    assert os.stat(graph_dir / 'info-0001.tsv').st_mtime_ns != mtimes['0001']
+    assert os.stat(graph_dir / 'info-0002.tsv').st_mtime_ns == mtimes['0002']
+    assert read_shards(graph_dir, 'links', 2) == expected[1]
+
+
+def test_parallel_process_partition_failure(data_dir):
+    """
+    test that a failed partition is named, and left out of the manifest, while the others
+    are still processed
+    """
+    (data_dir / 'partitioned' / 'sample-0002.xml').write_bytes(b'<page>\xff</page>\n')
+
+    with pytest.raises(RuntimeError, match='0002'):
+        process_wikitext.parallel_process_partition(str(data_dir), 'partitioned',
+                                                    max_workers=2)
+
+    records = process_wikitext.read_partition_manifest(
+        str(data_dir / 'graph' / 'partition-manifest.tsv'))
+    assert sorted(records) == ['0001']
+    assert not os.path.exists(data_dir / 'graph' / 'info-0002.tsv')
+
+
+def test_parallel_process_dump_failure(tmp_path):
+    """
+    test that a byte range whose worker fails is named instead of silently leaving its shard
+    out
+    """
+    with open(SAMPLE_DUMP, 'rb') as reader:
+        dump = reader.read()
+    end = dump.rindex(b'</mediawiki>')
+    (tmp_path / 'dump.xml').write_bytes(dump[:end] + b'  <page>\xff</page>\n' + dump[end:])
+    (tmp_path / 'graph').mkdir()
+
+    with pytest.raises(RuntimeError, match='Shards 0002 failed'):
+        process_wikitext.parallel_process_dump(str(tmp_path / 'dump.xml'), 2,
+                                               str(tmp_path / 'graph'), max_workers=2)
+
+    assert os.path.exists(tmp_path / 'graph' / 'info-0001.tsv')
+
+
+def test_write_chunk_unterminated_page(tmp_path):
+    """
+    test that a chunk whose last page has no </page> tag raises instead of looping forever
+    """
+    chunk = '<page><title>A</title></page>\n<page><title>B</title>'
+    with open(tmp_path / 'info.tsv', 'w') as f, open(tmp_path / 'links.tsv', 'w') as g:
+        with pytest.raises(ValueError, match='offset 30'):
+            process_wikitext._write_chunk(chunk, f, g)
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
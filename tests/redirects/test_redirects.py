@@ -0,0 +1,148 @@
+import pickle
+
+import pytest
+
+from wikigraph import partition_data, redirects, process_wikitext
+
+SAMPLE_DUMP = 'tests/dump_reader/sample.xml'
+
+INFO = ('Article\t\t10\t1\n'
+        'Other\t\t20\t2\n'
+        'Chain1\tChain2\t\t\n'
+        'Chain2\tArticle\t\t\n'
+        'Loop1\tLoop2\t\t\n'
+        'Loop2\tLoop1\t\t\n'
+        'Self\tSelf\t\t\n'
+        'Broken\tMissing page\t\t\n')
+
+LINKS = ('Article\tChain1\tOther\tArticle\tLoop1\tBroken\tUnknown\n'
+         'Other\t\n'
+         'Chain1\t\n'
+         'Chain2\t\n'
+         'Loop1\t\n'
+         'Loop2\t\n'
+         'Self\t\n'
+         'Broken\t\n')
+
+
+@pytest.fixture
+def graph_dir(tmp_path):
+    """A graph directory with the info and links files above and their redirects file"""
+    (tmp_path / 'wiki-info.tsv').write_text(INFO)
+    (tmp_path / 'wiki-links.tsv').write_text(LINKS)
+    process_wikitext.get_redirects(str(tmp_path / 'wiki-info.tsv'),
+                                   str(tmp_path / 'redirects.tsv'))
+    return tmp_path
+
+
+def test_resolve(graph_dir):
+    """
+    test that chains resolve to their article and that cycles and broken chains lead nowhere
+    """
+    resolver = redirects.RedirectResolver.build([str(graph_dir / 'wiki-info.tsv')],
+                                                [str(graph_dir / 'redirects.tsv')],
+                                                str(graph_dir / 'redirects'))
+
+    assert resolver.resolve('Article') == 'Article'
+    assert resolver.resolve('Chain1') == 'Article'
+    assert resolver.resolve('Chain2') == 'Article'
+    for title in ['Loop1', 'Loop2', 'Self', 'Broken', 'Missing page', 'Unknown']:
+        assert resolver.resolve(title) is None
+
+    copy = pickle.loads(pickle.dumps(resolver))
+    assert copy.resolve('Chain1') == 'Article'
+
+
+def test_collapse_redirects(graph_dir):
+    """
+    test that every link to a redirect is rewritten, and that redirect rows are dropped
+    """
+    counts = process_wikitext.collapse_redirects(str(graph_dir / 'wiki-info.tsv'),
+                                                 str(graph_dir / 'wiki-links.tsv'),
+                                                 str(graph_dir / 'redirects.tsv'),
+                                                 str(graph_dir / 'info-collapsed.tsv'),
+                                                 str(graph_dir / 'links-collapsed.tsv'))
+
+    # Chain1 is resolved; Loop1, Broken and Unknown lead nowhere
+    assert counts == (1, 3)
+    assert (graph_dir / 'links-collapsed.tsv').read_text() == \
+        'Article\tArticle\tOther\tLoop1\tBroken\tUnknown\nOther\t\n'
+    assert (graph_dir / 'info-collapsed.tsv').read_text() == 'Article\t\t10\t1\nOther\t\t20\t2\n'
+
+
+def test_resolve_incomplete(graph_dir):
+    """
+    test that a resolver built only from redirects passes unknown titles through
+    """
+    resolver = redirects.RedirectResolver.build([], [str(graph_dir / 'redirects.tsv')],
+                                                str(graph_dir / 'redirects'))
+
+    assert not resolver.complete
+    assert resolver.resolve('Chain1') == 'Article'
+    assert resolver.resolve('Unknown') == 'Unknown'
+    assert resolver.resolve('Loop1') is None
+    assert resolver.is_redirect('Broken') and not resolver.is_redirect('Article')
+
+
+def test_build_from_shards(tmp_path, monkeypatch):
+    """
+    test that the redirect shards written during extraction give the same collapsed files
+    as rereading the concatenated info file
+    """
+    byte_index = partition_data.create_byte_index(SAMPLE_DUMP)
+    for shard, spans in enumerate([byte_index[:1], byte_index[1:]], start=1):
+        process_wikitext.process_pages(SAMPLE_DUMP, spans, shard,
+                                       str(tmp_path / 'links.tsv'), str(tmp_path / 'info.tsv'),
+                                       str(tmp_path / 'redirects.tsv'))
+    assert (tmp_path / 'redirects-0001.tsv').read_text() == \
+        'AccessibleComputing\tComputer accessibility\n'
+    assert (tmp_path / 'redirects-0002.tsv').read_text() == ''
+
+    # The files below are given relative to the graph directory
+    monkeypatch.chdir(tmp_path)
+    process_wikitext.concatenate_files('.')
+    process_wikitext.get_redirects('wiki-info.tsv', 'redirects.tsv')
+    expected = process_wikitext.collapse_redirects('wiki-info.tsv', 'wiki-links.tsv',
+                                                   'redirects.tsv', 'expected-info.tsv',
+                                                   'expected-links.tsv')
+
+    # Without a manifest, the resolver reads the info shards
+    resolver = redirects.build_from_shards('.')
+    assert resolver.complete
+    assert process_wikitext.collapse_redirects('wiki-info.tsv', 'wiki-links.tsv', None,
+                                               'collapsed-info.tsv', 'collapsed-links.tsv',
+                                               resolver) == expected
+    assert expected[1] > 0
+    for name in ['info', 'links']:
+        assert (tmp_path / f'collapsed-{name}.tsv').read_text() == \
+            (tmp_path / f'expected-{name}.tsv').read_text()
+
+
+def test_collapse_redirects_external(graph_dir):
+    """
+    test that the external mode writes the same files and counts as collapse_redirects,
+    including links to missing pages, even when every run is spilled to disk
+    """
+    expected = process_wikitext.collapse_redirects(str(graph_dir / 'wiki-info.tsv'),
+                                                   str(graph_dir / 'wiki-links.tsv'),
+                                                   str(graph_dir / 'redirects.tsv'),
+                                                   str(graph_dir / 'info-expected.tsv'),
+                                                   str(graph_dir / 'links-expected.tsv'))
+
+    counts = redirects.collapse_redirects_external(str(graph_dir / 'wiki-info.tsv'),
+                                                   str(graph_dir / 'wiki-links.tsv'),
+                                                   [str(graph_dir / 'redirects.tsv')],
+                                                   str(graph_dir / 'info-external.tsv'),
+                                                   str(graph_dir / 'links-external.tsv'),
+                                                   memory_budget=1000, tmp_dir=str(graph_dir))
+
+    assert counts == expected == (1, 3)
+    assert (graph_dir / 'links-external.tsv').read_text() == \
+        (graph_dir / 'links-expected.tsv').read_text()
+    assert (graph_dir / 'info-external.tsv').read_text() == \
+        (graph_dir / 'info-expected.tsv').read_text()
+    assert [path.name for path in graph_dir.iterdir() if path.is_dir()] == []
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,145 @@
+import os
+
+import pytest
+
+from wikigraph import shards, process_wikitext, csr_graph, graph_implementation
+
+INFO_SHARDS = ['A\t\t10\t1\nB\t\t20\t2\n', '', 'C\t\t30\t3\nR\tA\t\t\n']
+LINKS_SHARDS = ['A\tB\tR\nB\tC\n', '', 'C\tA\nR\t\n']
+
+
+@pytest.fixture
+def graph_dir(tmp_path):
+    """A graph directory with three info and links shards, the second of them empty"""
+    for shard, (info, links) in enumerate(zip(INFO_SHARDS, LINKS_SHARDS), start=1):
+        (tmp_path / f'info-{shard:04d}.tsv').write_text(info)
+        (tmp_path / f'links-{shard:04d}.tsv').write_text(links)
+    (tmp_path / 'info-summary.txt').write_text('not a shard')
+    return tmp_path
+
+
+def test_manifest(graph_dir):
+    """
+    test that a manifest lists the shards in order and reads back as their concatenation
+    """
+    files = shards.write_manifest(str(graph_dir), 'info', str(graph_dir / 'wiki-info.manifest'))
+
+    assert [os.path.basename(file) for file in files] == \
+        ['info-0001.tsv', 'info-0002.tsv', 'info-0003.tsv']
+    assert shards.get_files(str(graph_dir / 'wiki-info.manifest')) == files
+    assert ''.join(shards.iter_lines(str(graph_dir / 'wiki-info.manifest'))) == \
+        ''.join(INFO_SHARDS)
+    assert shards.get_files('wiki-info.tsv') == ['wiki-info.tsv']
+
+    (graph_dir / 'info-0003.tsv').write_text('changed')
+    with pytest.raises(ValueError):
+        shards.read_manifest(str(graph_dir / 'wiki-info.manifest'))
+
+
+def test_get_line_ranges(graph_dir):
+    """
+    test that the ranges of a manifest cover every line of every shard exactly once
+    """
+    shards.write_manifest(str(graph_dir), 'links', str(graph_dir / 'wiki-links.manifest'))
+    for num_ranges in range(1, 6):
+        text = ''
+        for file, start, end in shards.get_line_ranges(str(graph_dir / 'wiki-links.manifest'),
+                                                       num_ranges):
+            with open(file, 'r') as f:
+                f.seek(start)
+                text += f.read(end - start)
+        assert text == ''.join(LINKS_SHARDS)
+
+
+def test_concatenate_files(graph_dir):
+    """
+    test that concatenate_files writes the shards into one file each, in order, without
+    picking up files that are not shards
+    """
+    cwd = os.getcwd()
+    process_wikitext.concatenate_files(str(graph_dir))
+
+    assert os.getcwd() == cwd
+    assert (graph_dir / 'wiki-info.tsv').read_text() == ''.join(INFO_SHARDS)
+    assert (graph_dir / 'wiki-links.tsv').read_text() == ''.join(LINKS_SHARDS)
+
+
+@pytest.mark.parametrize('broken', [(), ('copy_file_range',),
+                                    ('copy_file_range', 'sendfile')])
+def test_concatenate_falls_back(graph_dir, monkeypatch, broken):
+    """
+    test that a copy method that copies nothing without an error falls back to the next one
+    """
+    for name in broken:
+        if hasattr(os, name):
+            monkeypatch.setattr(os, name, lambda *args: 0)
+
+    files = shards.get_shards(str(graph_dir), 'info')
+    shards.concatenate(files, str(graph_dir / 'wiki-info.tsv'))
+    assert (graph_dir / 'wiki-info.tsv').read_text() == ''.join(INFO_SHARDS)
+
+
+def test_concatenate_shrunk_file(graph_dir, monkeypatch):
+    """
+    test that a file which ends before its size raises an error instead of being truncated
+    """
+    monkeypatch.setattr(os.path, 'getsize', lambda file: 1000)
+
+    with pytest.raises(OSError, match='ended after'):
+        shards.concatenate(shards.get_shards(str(graph_dir), 'info'),
+                           str(graph_dir / 'wiki-info.tsv'))
+
+
+def test_collapse_redirects_reads_manifests(graph_dir):
+    """
+    test that get_redirects and collapse_redirects give the same results from manifests as
+    from the concatenated files
+    """
+    process_wikitext.concatenate_files(str(graph_dir))
+    process_wikitext.write_manifests(str(graph_dir))
+
+    outputs = {}
+    for kind in ['tsv', 'manifest']:
+        info = str(graph_dir / f'wiki-info.{kind}')
+        links = str(graph_dir / f'wiki-links.{kind}')
+        process_wikitext.get_redirects(info, str(graph_dir / f'redirects-{kind}.tsv'))
+        counts = process_wikitext.collapse_redirects(info, links,
+                                                     str(graph_dir / f'redirects-{kind}.tsv'),
+                                                     str(graph_dir / f'info-{kind}.out'),
+                                                     str(graph_dir / f'links-{kind}.out'))
+        outputs[kind] = (counts,
+                         (graph_dir / f'info-{kind}.out').read_text(),
+                         (graph_dir / f'links-{kind}.out').read_text())
+
+    assert outputs['tsv'] == outputs['manifest']
+    assert outputs['tsv'][0] == (1, 0)
+
+
+def test_load_graph_reads_manifests(tmp_path):
+    """
+    test that the graph loaders give the same graph from manifests as from the concatenated
+    files
+    """
+    # Collapsed shards: no redirects
+    for shard, (info, links) in enumerate([('A\t\t10\t1\nB\t\t20\t2\n', 'A\tB\nB\tC\n'),
+                                           ('', ''),
+                                           ('C\t\t30\t3\n', 'C\tA\n')], start=1):
+        (tmp_path / f'info-{shard:04d}.tsv').write_text(info)
+        (tmp_path / f'links-{shard:04d}.tsv').write_text(links)
+    process_wikitext.concatenate_files(str(tmp_path))
+    process_wikitext.write_manifests(str(tmp_path))
+
+    graphs = {}
+    for kind in ['tsv', 'manifest']:
+        info = str(tmp_path / f'wiki-info.{kind}')
+        links = str(tmp_path / f'wiki-links.{kind}')
+        g = graph_implementation.load_graph(info, links)
+        csr = csr_graph.load_csr_graph_parallel(info, links, num_ranges=3, max_workers=1)
+        graphs[kind] = (sorted((item, sorted(g.get_neighbours(item)))
+                               for item in g.get_all_vertices()),
+                        sorted((item, sorted(csr.get_neighbours(item)))
+                               for item in csr.get_all_vertices()))
+
+    assert graphs['tsv'] == graphs['manifest']
+    assert graphs['tsv'][1] == \
+        [('A', ['B', 'C']), ('B', ['A', 'C']), ('C', ['A', 'B'])]
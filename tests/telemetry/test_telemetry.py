@@ -0,0 +1,80 @@
+import os
+
+import pytest
+
+from wikigraph import telemetry, wikitext, partition_data, process_wikitext, pipeline
+
+SAMPLE_DUMP = 'tests/dump_reader/sample.xml'
+
+
+@pytest.fixture
+def telemetry_file(tmp_path, monkeypatch):
+    """Enable telemetry to a file in tmp_path for the duration of a test"""
+    monkeypatch.setenv(telemetry.TELEMETRY_ENV, str(tmp_path / 'telemetry.jsonl'))
+    monkeypatch.setenv(telemetry.RUN_ENV, 'test-run')
+    return str(tmp_path / 'telemetry.jsonl')
+
+
+def test_measure(telemetry_file):
+    """
+    test that a measure block writes one record with its throughput and the errors
+    recovered from inside it, including when it fails
+    """
+    wikitext.parse_wikilink(5)
+    with telemetry.measure('parse', worker='0001') as measurement:
+        measurement.add(pages=2, num_bytes=100)
+        assert wikitext.parse_wikilink(5) is None
+        assert wikitext.revision_ages(['', 'invalid'], default=0) == [0, 0]
+
+    with pytest.raises(ValueError):
+        with telemetry.measure('fail'):
+            raise ValueError
+
+    records = telemetry.read_records(telemetry_file)
+    assert [record['name'] for record in records] == ['parse', 'fail']
+
+    record = records[0]
+    assert record['run'] == 'test-run' and record['worker'] == '0001'
+    assert record['pages'] == 2 and record['bytes'] == 100
+    assert record['pages_per_s'] > 0 and record['wall'] >= 0 and record['cpu'] >= 0
+    assert record['errors'] == {'parse_wikilink': 1, 'char_count': 0, 'last_revision': 2}
+    assert record['status'] == 'ok' and records[1]['status'] == 'failed'
+    if telemetry.resource is not None:
+        assert record['peak_rss'] > 0
+
+    summary = telemetry.summarize(records)
+    assert summary['parse']['pages'] == 2 and summary['fail']['failed'] == 1
+
+
+def test_measure_disabled(tmp_path, monkeypatch):
+    """
+    test that nothing is written when telemetry is not enabled
+    """
+    monkeypatch.delenv(telemetry.TELEMETRY_ENV, raising=False)
+    monkeypatch.chdir(tmp_path)
+    with telemetry.measure('parse') as measurement:
+        measurement.add(pages=1)
+    assert os.listdir(tmp_path) == []
+
+
+def test_workers_and_stages(tmp_path, telemetry_file):
+    """
+    test that extraction workers and pipeline stages record themselves, and that a page
+    without a </text> tag is counted rather than given a negative character count
+    """
+    byte_index = partition_data.create_byte_index(SAMPLE_DUMP)
+    stages = [pipeline.Stage('extract', process_wikitext.process_pages,
+                             (SAMPLE_DUMP, byte_index, 1, str(tmp_path / 'links.tsv'),
+                              str(tmp_path / 'info.tsv')),
+                             (SAMPLE_DUMP,), (str(tmp_path / 'info-0001.tsv'),))]
+    pipeline.run_stages(stages, str(tmp_path / 'cache.tsv'))
+
+    records = {record['name']: record for record in telemetry.read_records(telemetry_file)}
+    assert records['process_pages']['pages'] == len(byte_index)
+    assert records['process_pages']['bytes'] == sum(length for _, length in byte_index)
+    assert records['extract']['status'] == 'ok'
+
+    with open(tmp_path / 'info.tsv', 'w') as f, open(tmp_path / 'links.tsv', 'w') as g:
+        process_wikitext._write_page('<page>\n<title>A</title>\n<revision>\n<timestamp>'
+                                     '</timestamp>\n<text bytes="3">[[B]]\n</page>', f, g)
+    assert (tmp_path / 'info.tsv').read_text() == 'A\t\t0\t0\n'
@@ -0,0 +1,76 @@
+import pickle
+
+import pytest
+
+from wikigraph import partition_data, process_wikitext, title_ids
+
+SAMPLE_DUMP = 'tests/dump_reader/sample.xml'
+
+byte_index = partition_data.create_byte_index(SAMPLE_DUMP)
+
+
+@pytest.fixture
+def graph_dir(tmp_path):
+    """A graph directory holding the sample dump extracted into two shards"""
+    process_wikitext.process_pages(SAMPLE_DUMP, byte_index[:2], 1,
+                                   str(tmp_path / 'links.tsv'), str(tmp_path / 'info.tsv'))
+    process_wikitext.process_pages(SAMPLE_DUMP, byte_index[2:], 2,
+                                   str(tmp_path / 'links.tsv'), str(tmp_path / 'info.tsv'))
+    return tmp_path
+
+
+def test_title_table_round_trip(tmp_path):
+    """
+    test that every title maps to a dense id in sorted order and back
+    """
+    titles = ['Zebra', 'Anarchism', 'Café', 'Anarchism', 'A: b']
+    table = title_ids.TitleTable.build(titles, str(tmp_path / 'titles.bin'))
+
+    assert list(table.titles()) == sorted(set(titles))
+    assert all(table.title(table.id(title)) == title for title in titles)
+    assert table.id('Missing') == -1
+    assert 'Café' in table and 'Cafe' not in table
+
+    with pytest.raises(IndexError):
+        table.title(len(table))
+
+
+def test_title_table_pickle(tmp_path):
+    """
+    test that a pickled title table reopens the same file
+    """
+    table = title_ids.TitleTable.build(['a', 'b'], str(tmp_path / 'titles.bin'))
+    copy = pickle.loads(pickle.dumps(table))
+
+    assert copy.filename == table.filename
+    assert list(copy.titles()) == ['a', 'b']
+
+
+def test_title_table_bad_file(tmp_path):
+    """
+    test that a file that is not a title table is rejected
+    """
+    (tmp_path / 'titles.bin').write_bytes(b'not a title table')
+    with pytest.raises(ValueError):
+        title_ids.TitleTable(str(tmp_path / 'titles.bin'))
+
+
+def test_intern_shards(graph_dir):
+    """
+    test that the links shards are encoded as edges between known titles only
+    """
+    table = title_ids.intern_shards(str(graph_dir), max_workers=2)
+    assert list(table.titles()) == ['AccessibleComputing', 'Anarchism',
+                                    'Computer accessibility']
+
+    edges = []
+    for n in range(1, 3):
+        ids = title_ids.read_edges(str(graph_dir / ('edges-%04d.bin' % n)))
+        edges += [(table.title(ids[i]), table.title(ids[i + 1])) for i in range(0, len(ids), 2)]
+
+    assert edges == [('Anarchism', 'Computer accessibility'),
+                     ('Computer accessibility', 'Anarchism')]
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,112 @@
+import pytest
+
+from wikigraph import wikitext
+
+# Unlike test_wikitext.py, these tests only use the sample dump in the repository, so they
+# run without the reduced dumps in data/raw/reduced
+SAMPLE_DUMP = 'tests/dump_reader/sample.xml'
+
+with open(SAMPLE_DUMP, 'r') as reader:
+    sample_dump = reader.read()
+sample_pages = [sample_dump[start:sample_dump.index('</page>', start) + len('</page>')]
+                for start in range(len(sample_dump)) if sample_dump.startswith('<page>', start)]
+
+
+def test_last_revision():
+    """
+    test that the last revision is measured in whole seconds before 2021-01-01T00:00:01Z,
+    without wrapping around at 24 hours
+    """
+    with open(SAMPLE_DUMP, 'r') as reader:
+        pages = reader.read().split('</page>')[:3]
+
+    # 2018-08-14T06:47:24Z, 2020-12-31T12:30:00Z and 2019-01-01T00:00:01Z
+    assert [wikitext.last_revision(page) for page in pages] == [75229957, 41401, 63158400]
+
+
+def test_parse_timestamp():
+    """
+    test that timestamps are converted to the same epoch seconds as the calendar module,
+    across days, months, leap years and centuries
+    """
+    import calendar
+    from datetime import datetime, timedelta
+
+    moment = datetime(1899, 12, 31, 23, 59, 59)
+    while moment.year < 2101:
+        timestamp = moment.strftime('%Y-%m-%dT%H:%M:%SZ')
+        assert wikitext.parse_timestamp(timestamp) == calendar.timegm(moment.timetuple())
+        moment += timedelta(days=3, seconds=3721)
+
+
+@pytest.mark.parametrize('timestamp', ['2021-02-29T00:00:00Z', '1900-02-29T00:00:00Z',
+                                       '2021-04-31T00:00:00Z', '2021-13-01T00:00:00Z',
+                                       '2021-01-00T00:00:00Z', '2021-01-01T24:00:00Z',
+                                       '2021-01-01T23:60:00Z', '2021-01-01T23:59:60Z',
+                                       '2021-02-31T99:99:99Z', '2021-01-01T00-00-00Z'])
+def test_parse_timestamp_invalid(timestamp):
+    """
+    test that dates that are not in their month and times that are not in a day are rejected
+    instead of being converted to wrong epoch seconds
+    """
+    with pytest.raises(ValueError):
+        wikitext.parse_timestamp(timestamp)
+
+
+def test_revision_ages():
+    """
+    test that revision ages are total seconds and that the reference date can be changed
+    """
+    timestamps = ['2020-12-31T00:00:01Z', '2019-01-01T00:00:01Z', 'not a timestamp']
+
+    assert wikitext.revision_ages(timestamps, default=-1) == [86400, 731 * 86400, -1]
+    assert wikitext.revision_ages(timestamps[:2], wikitext.parse_timestamp(
+        '2022-01-01T00:00:01Z')) == [366 * 86400, 1096 * 86400]
+    with pytest.raises(ValueError):
+        wikitext.revision_ages(timestamps)
+
+
+def test_parse_page():
+    """
+    test that the fused extractor agrees with the individual extractors
+    """
+    for page in sample_pages:
+        record = wikitext.parse_page(page)
+
+        assert record.title == wikitext.get_title(page)
+        assert record.redirect == wikitext.parse_redirect(page)
+        assert wikitext.collect_record_links(page, record) == wikitext.collect_links(page)
+        assert record.timestamp == page[page.index('<timestamp>') + 11:page.index('</timestamp>')]
+
+
+def test_parse_page_text_bounds():
+    """
+    test that the text bounds are exact even when the text contains a > on its first line
+    """
+    for page in sample_pages:
+        record = wikitext.parse_page(page)
+        text = page[record.text_start:record.text_end]
+
+        assert page[:record.text_start].endswith('xml:space="preserve">')
+        assert page[record.text_end:].startswith('</text>')
+        assert '<text' not in text and '</text>' not in text
+
+
+def test_parse_page_ignores_comment_links():
+    """
+    test that only the text of a page is searched for links, not the edit summary in the
+    <comment> of its revision
+    """
+    page = ('<page>\n<title>A</title>\n<revision>\n<timestamp>2020-12-31T00:00:00Z'
+            '</timestamp>\n<comment>Moved from [[Old title]]</comment>\n'
+            '<text bytes="9">[[B|b]] [[C]]</text>\n</revision>\n</page>')
+    record = wikitext.parse_page(page)
+
+    assert wikitext.collect_record_links(page, record) == ['B', 'C']
+    assert wikitext.collect_links_batch(page, [record.text_start], [record.text_end]) == \
+        [['B', 'C']]
+    assert 'Old title' in wikitext.collect_links(page)
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
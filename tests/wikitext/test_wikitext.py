@@ -88,11 +88,6 @@ def test_char_count():
                      len("[[Category:Film and video technology]]"):len(extracted)] == "[[Category:Film and video technology]]"
 
 
-def test_last_revision():
-    from datetime import datetime
-    assert wikitext.last_revision(
-        animation_page) == 45100
-
 
 if __name__ == '__main__':
     pytest.main([__file__, '-v'])
@@ -0,0 +1,849 @@
+"""A compressed sparse row (CSR) implementation of the Wikipedia graph
+
+graph_implementation.Graph keeps one _Vertex object and one set of neighbours per article,
+which takes tens of gigabytes for the full dump. CSRGraph stores the same graph in a few
+flat typed arrays instead: the neighbours of every vertex are stored consecutively, in
+sorted order, in a single array of vertex ids, and the character counts, last edits and
+scores are stored as one column each.
+
+CSRGraph has the same query methods as Graph, so the functions in graph_analysis can be
+run on it unchanged. It is read-only once built.
+
+Specifications:
+ - load_csr_graph('path/to/wiki-info-collapsed.tsv', 'path/to/wiki-links-collapsed.tsv'):
+    Same as graph_implementation.load_graph, but returns a CSRGraph.
+ - load_csr_graph_parallel('path/to/wiki-info-collapsed.tsv',
+                           'path/to/wiki-links-collapsed.tsv'):
+    Same as load_csr_graph, but parses the links file in concurrent processes.
+ - load_csr_graph_interned('path/to/wiki-info.manifest', 'path/to/wiki-titles.bin',
+                           'path/to/wiki-edges.manifest', resolver, 'path/to/titles.bin'):
+    Builds the same graph from the integer id edges of title_ids.intern_shards, collapsing
+    the redirects on the ids instead of rewriting the links files.
+ - CSRGraph.from_graph(graph):
+    Converts a graph_implementation.Graph.
+ - CSRGraph.from_edges(items, char_counts, last_edits, edges):
+    Builds a graph from its vertex columns and a flat array of (source id, target id) pairs,
+    e.g. the edges written by title_ids.encode_links.
+ - g.save('path/to/snapshot'), CSRGraph.load('path/to/snapshot'):
+    Writes the graph to a snapshot directory, and memory-maps it back. Loading only maps the
+    files, so a new process can query the full graph within seconds.
+
+Example of use:
+>>> g = load_csr_graph('data/processed/graph/wiki-info-collapsed.tsv',
+...                    'data/processed/graph/wiki-links-collapsed.tsv')
+>>> g.set_scores()
+>>> from wikigraph.graph_analysis import analysis
+>>> analysis(g, 'data/processed/analysis/', 100)
+"""
+from __future__ import annotations
+
+import os
+import sys
+import math
+import mmap
+import tempfile
+import fileinput
+import operator
+import itertools
+import collections
+import concurrent.futures
+from array import array
+from bisect import bisect_left
+from collections.abc import Sequence as SequenceABC
+from typing import Any, Callable, Iterable, Iterator, Sequence
+
+from tqdm import tqdm
+from pyvis.network import Network
+
+from wikigraph import title_ids, shards, pipeline, redirects
+from wikigraph.graph_implementation import Graph
+
+# A snapshot is a directory holding a title_ids title table (titles.bin), which numbers the
+# vertices, and a graph file (graph.bin). The graph file starts with an 8 byte header (this
+# magic string, then the format version and a padding byte) followed by the number of
+# vertices and the length of the neighbours array as 64-bit integers. Then come the offsets,
+# the neighbours (padded to a multiple of 8 bytes), the char counts, the last edits and the
+# scores, all little-endian.
+SNAPSHOT_MAGIC = b'WGGRF\x00'
+SNAPSHOT_VERSION = 1
+SNAPSHOT_HEADER_SIZE = 24
+
+
+class _ItemTable:
+    """An in-memory table between vertex items and their ids, with the same lookup methods
+    as title_ids.TitleTable"""
+    # Private Instance Attributes:
+    #     - _items: The item of every id.
+    #     - _ids: Maps each item to its id.
+    _items: list
+    _ids: dict[Any, int]
+
+    def __init__(self, items: Iterable, ids: dict[Any, int] = None) -> None:
+        """Initialize the table of items, numbered in order. ids may be given if the mapping
+        from each item to its index has already been built."""
+        self._items = list(items)
+        self._ids = ids if ids is not None else {item: i for i, item in enumerate(self._items)}
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, item: Any) -> bool:
+        return item in self._ids
+
+    def title(self, i: int) -> Any:
+        """Return the item with id i"""
+        return self._items[i]
+
+    def id(self, item: Any) -> int:
+        """Return the id of item, or -1 if it is not in the table"""
+        return self._ids.get(item, -1)
+
+    def titles(self) -> Iterable:
+        """Return every item, in id order"""
+        return iter(self._items)
+
+
+class _ItemSequence(SequenceABC):
+    """The items of an item table as a read-only sequence, indexed by id"""
+    # Private Instance Attributes:
+    #     - _table: The title_ids.TitleTable or _ItemTable holding the items.
+    _table: Any
+
+    def __init__(self, table: Any) -> None:
+        self._table = table
+
+    def __len__(self) -> int:
+        return len(self._table)
+
+    def __getitem__(self, i: int) -> Any:
+        if isinstance(i, slice):
+            return [self._table.title(j) for j in range(*i.indices(len(self)))]
+        return self._table.title(i)
+
+
+class _CSRVertex:
+    """A lightweight view of one vertex of a CSRGraph, with the same attributes and methods
+    as graph_implementation._Vertex. Its data lives in the columns of the graph.
+    """
+    __slots__ = ('_graph', '_id')
+    _graph: CSRGraph
+    _id: int
+
+    def __init__(self, graph: CSRGraph, i: int) -> None:
+        self._graph = graph
+        self._id = i
+
+    @property
+    def item(self) -> Any:
+        return self._graph.items.title(self._id)
+
+    @property
+    def neighbours(self) -> set[_CSRVertex]:
+        graph = self._graph
+        return {_CSRVertex(graph, j) for j in graph.neighbour_ids(self._id)}
+
+    @property
+    def char_count(self) -> int:
+        return self._graph.char_counts[self._id]
+
+    @property
+    def last_edit(self) -> int:
+        return self._graph.last_edits[self._id]
+
+    @property
+    def score(self) -> float:
+        return self._graph.scores[self._id]
+
+    def degree(self) -> int:
+        """Return the degree of this vertex."""
+        return self._graph.offsets[self._id + 1] - self._graph.offsets[self._id]
+
+    def set_score(self) -> None:
+        """Compute and store the score of this vertex, as in _Vertex.set_score"""
+        self._graph.scores[self._id] = _score(self.char_count, self.degree(), self.last_edit)
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, _CSRVertex) and other._graph is self._graph \
+            and other._id == self._id
+
+    def __hash__(self) -> int:
+        return hash(self._id)
+
+
+class CSRGraph:
+    """A read-only graph used to represent the Wikipedia article network, stored in
+    compressed sparse row form.
+
+    Vertex i is the item items.title(i). Its neighbours are the ids
+    neighbours[offsets[i]:offsets[i + 1]], in increasing order.
+
+    Instance Attributes:
+        - items: The table between vertex items and ids (a title_ids.TitleTable, or an
+                 in-memory table with the same methods).
+        - offsets: Where the neighbours of each vertex start in neighbours, plus the total
+                   length of neighbours.
+        - neighbours: The ids of the neighbours of every vertex, concatenated.
+        - char_counts: The character count of every vertex.
+        - last_edits: The seconds between the last revision of every vertex and the day the
+                      data was collected.
+        - scores: The score of every vertex, or 0.0 if it has not been set.
+
+    The columns are either arrays, or memoryviews of a snapshot file when the graph was
+    created by load.
+
+    Representation Invariants:
+        - len(self.offsets) == len(self.items) + 1
+        - self.offsets[-1] == len(self.neighbours)
+        - len(self.char_counts) == len(self.last_edits) == len(self.scores) == len(self.items)
+        - no vertex is its own neighbour, and every edge is stored in both directions
+    """
+    items: Any
+    offsets: Sequence[int]
+    neighbours: Sequence[int]
+    char_counts: Sequence[int]
+    last_edits: Sequence[int]
+    scores: Sequence[float]
+
+    # Private Instance Attributes:
+    #     - _map: The memory map of the snapshot the columns are views of, or None.
+    _map: Any = None
+
+    def __init__(self, items: Any, offsets: Sequence[int], neighbours: Sequence[int],
+                 char_counts: Sequence[int], last_edits: Sequence[int],
+                 scores: Sequence[float] = None) -> None:
+        """Initialize a graph from its columns. Use from_edges or from_graph to build one."""
+        self.items = items
+        self.offsets = offsets
+        self.neighbours = neighbours
+        self.char_counts = char_counts
+        self.last_edits = last_edits
+        self.scores = scores if scores is not None else array('d', bytes(8 * len(items)))
+
+    @staticmethod
+    def from_edges(items: Any, char_counts: Sequence[int], last_edits: Sequence[int],
+                   edges: Sequence[int]) -> CSRGraph:
+        """Return the graph with the given vertex columns and the undirected edges given by
+        edges, a flat sequence of source, target, source, target, ... ids.
+
+        items is either a title_ids.TitleTable or a list of the item of every vertex.
+        Duplicate edges and edges from a vertex to itself are ignored.
+
+        >>> g = CSRGraph.from_edges(['a', 'b', 'c'], [1, 2, 3], [0, 0, 0], [0, 1, 1, 0, 2, 1])
+        >>> sorted(g.get_neighbours('b'))
+        ['a', 'c']
+        """
+        if isinstance(items, list):
+            items = _ItemTable(items)
+        n = len(items)
+
+        # Count the edges of every vertex, then turn the counts into offsets
+        offsets = array('q', bytes(8 * (n + 1)))
+        pairs = iter(edges)
+        for source, target in zip(pairs, pairs):
+            if source != target:
+                offsets[source + 1] += 1
+                offsets[target + 1] += 1
+
+        for i in range(n):
+            offsets[i + 1] += offsets[i]
+
+        # Place each edge in both of its vertices' rows
+        neighbours = array('I', bytes(4 * offsets[n]))
+        fill = offsets[:-1]
+        pairs = iter(edges)
+        for source, target in zip(pairs, pairs):
+            if source != target:
+                neighbours[fill[source]] = target
+                fill[source] += 1
+                neighbours[fill[target]] = source
+                fill[target] += 1
+
+        # Sort every row and remove duplicate edges, compacting the rows in place
+        end = 0
+        for i in range(n):
+            row = sorted(set(neighbours[offsets[i]:offsets[i + 1]]))
+            neighbours[end:end + len(row)] = array('I', row)
+            offsets[i] = end
+            end += len(row)
+        offsets[n] = end
+        del neighbours[end:]
+
+        return CSRGraph(items, offsets, neighbours, array('q', char_counts),
+                        array('q', last_edits))
+
+    @staticmethod
+    def from_graph(graph: Graph) -> CSRGraph:
+        """Return a CSRGraph with the same vertices, edges and attributes as graph"""
+        vertices = list(graph.get_all_vertex_values())
+        ids = {v: i for i, v in enumerate(vertices)}
+
+        edges = array('I')
+        for i, v in enumerate(vertices):
+            for u in v.neighbours:
+                edges.append(i)
+                edges.append(ids[u])
+
+        return CSRGraph.from_edges([v.item for v in vertices],
+                                   [v.char_count for v in vertices],
+                                   [v.last_edit for v in vertices], edges)
+
+    def save(self, path: str) -> None:
+        """Write this graph to a snapshot directory at path, replacing any snapshot there.
+
+        The vertices are renumbered in sorted title order, the order of title_ids.TitleTable.
+
+        Preconditions:
+            - every item of this graph is a string
+        """
+        os.makedirs(path, exist_ok=True)
+        n = len(self.items)
+
+        # Both files are written to temporary files, and the title table is only moved into
+        # place after the graph file, so a failed save never leaves a new table next to an
+        # old graph file
+        titles_file = f'{path}/titles.bin'
+        new_titles = True
+        if isinstance(self.items, title_ids.TitleTable):
+            # Already numbered by a title table; keep its ids
+            if os.path.realpath(self.items.filename) == os.path.realpath(titles_file):
+                new_titles = False
+            else:
+                shards.concatenate([self.items.filename], titles_file + '.tmp')
+            order = range(n)
+            new_ids = range(n)
+        else:
+            table = title_ids.TitleTable.build(self.items.titles(), titles_file + '.tmp')
+            new_ids = array('I', (table.id(item) for item in self.items.titles()))
+            order = array('I', bytes(4 * n))
+            for i, j in enumerate(new_ids):
+                order[j] = i
+
+        offsets = array('q', [0])
+        neighbours = array('I')
+        print("Writing Graph Snapshot...")
+        for i in tqdm(order):
+            neighbours.extend(sorted(new_ids[j] for j in self.neighbour_ids(i)))
+            offsets.append(len(neighbours))
+        if len(neighbours) % 2:
+            neighbours.append(0)
+
+        columns = [offsets, neighbours, array('q', (self.char_counts[i] for i in order)),
+                   array('q', (self.last_edits[i] for i in order)),
+                   array('d', (self.scores[i] for i in order))]
+        if sys.byteorder != 'little':
+            for column in columns:
+                column.byteswap()
+
+        with open(f'{path}/graph.bin.tmp', 'wb') as f:
+            f.write(SNAPSHOT_MAGIC + bytes([SNAPSHOT_VERSION, 0]))
+            f.write(n.to_bytes(8, 'little') + offsets[n].to_bytes(8, 'little'))
+            for column in columns:
+                column.tofile(f)
+        os.replace(f'{path}/graph.bin.tmp', f'{path}/graph.bin')
+        if new_titles:
+            os.replace(titles_file + '.tmp', titles_file)
+
+    @staticmethod
+    def load(path: str) -> CSRGraph:
+        """Return the graph saved in the snapshot directory at path. The columns are
+        memory-mapped, not read, so this takes about the same time for any graph size.
+
+        Scores can still be set on the loaded graph; they are kept in memory and are not
+        written back to the snapshot.
+
+        Raise a ValueError if path does not hold a snapshot of this version, or if its title
+        table does not have one title per vertex.
+        """
+        with open(f'{path}/graph.bin', 'rb') as f:
+            header = f.read(8)
+            if header[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+                raise ValueError(f'{path} is not a graph snapshot')
+            if header[6] != SNAPSHOT_VERSION:
+                raise ValueError(f'{path} is a version {header[6]} graph snapshot, '
+                                 f'expected version {SNAPSHOT_VERSION}')
+
+            # Copy-on-write, so that scores can be set without touching the file
+            snapshot = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+        view = memoryview(snapshot)
+        n = int.from_bytes(view[8:16], 'little')
+        m = int.from_bytes(view[16:SNAPSHOT_HEADER_SIZE], 'little')
+
+        columns = []
+        start = SNAPSHOT_HEADER_SIZE
+        for fmt, length in (('q', n + 1), ('I', m + m % 2), ('q', n), ('q', n), ('d', n)):
+            end = start + length * (8 if fmt != 'I' else 4)
+            column = view[start:end].cast(fmt)
+            if sys.byteorder != 'little':
+                # Fall back to in-memory copies on big-endian machines
+                column = array(fmt, column)
+                column.byteswap()
+            columns.append(column)
+            start = end
+
+        table = title_ids.TitleTable(f'{path}/titles.bin')
+        if len(table) != n:
+            raise ValueError(f'{path} has {len(table)} titles for {n} vertices')
+
+        offsets, neighbours, char_counts, last_edits, scores = columns
+        graph = CSRGraph(table, offsets, neighbours[:m], char_counts, last_edits, scores)
+        graph._map = snapshot
+        return graph
+
+    def _id(self, item: Any) -> int:
+        """Return the id of item.
+
+        Raise a ValueError if item does not appear as a vertex in this graph."""
+        # A TitleTable can only hold strings
+        if not isinstance(item, str) and not isinstance(self.items, _ItemTable):
+            raise ValueError
+
+        i = self.items.id(item)
+        if i == -1:
+            raise ValueError
+        return i
+
+    def neighbour_ids(self, i: int) -> Sequence[int]:
+        """Return the ids of the neighbours of vertex i, in increasing order"""
+        return self.neighbours[self.offsets[i]:self.offsets[i + 1]]
+
+    def adjacent(self, item1: Any, item2: Any) -> bool:
+        """Return whether item1 and item2 are adjacent vertices in this graph.
+
+        Return False if item1 or item2 do not appear as vertices in this graph.
+        """
+        try:
+            i, j = self._id(item1), self._id(item2)
+        except ValueError:
+            return False
+
+        lo, hi = self.offsets[i], self.offsets[i + 1]
+        k = bisect_left(self.neighbours, j, lo, hi)
+        return k < hi and self.neighbours[k] == j
+
+    def get_neighbours(self, item: Any) -> set:
+        """Return a set of the neighbours of the given item.
+
+        Raise a ValueError if item does not appear as a vertex in this graph.
+        """
+        title = self.items.title
+        return {title(j) for j in self.neighbour_ids(self._id(item))}
+
+    def get_all_vertices(self) -> set:
+        """Return a set of all vertex items in this graph.
+        """
+        return set(self.items.titles())
+
+    def get_all_vertex_values(self) -> set:
+        """Return a set of views of all the vertices in this graph. Each view has the same
+        attributes and methods as graph_implementation._Vertex.
+        """
+        return {_CSRVertex(self, i) for i in range(len(self.items))}
+
+    def get_vertex_degree(self, item: Any) -> int:
+        """Return the degree of the vertex associated with item.
+
+        Raise a ValueError if item does not appear as a vertex in this graph."""
+        i = self._id(item)
+        return self.offsets[i + 1] - self.offsets[i]
+
+    def get_vertex_char_count(self, item: Any) -> int:
+        """Return the character count of the vertex associated with item.
+
+        Raise a ValueError if item does not appear as a vertex in this graph."""
+        return self.char_counts[self._id(item)]
+
+    def get_vertex_edit_time(self, item: Any) -> int:
+        """Return the last_edit of item.
+
+        Raise a ValueError if item does not appear as a vertex in this graph."""
+        return self.last_edits[self._id(item)]
+
+    def get_vertex_score(self, item: Any) -> float:
+        """Return the score of the vertex associated with item.
+
+        Raise a ValueError if item does not appear as a vertex in this graph."""
+        return self.scores[self._id(item)]
+
+    def get_vertex_column(self, attribute: str) -> tuple[Sequence, Sequence]:
+        """Return a sequence of all vertex items in this graph, and a sequence of the given
+        attribute of each of them, in the same order. Both are indexed by vertex id, and the
+        attribute columns are returned without being copied.
+
+        attribute is 'char_count', 'last_edit', 'score' or 'degree'.
+
+        Raise a ValueError if attribute is not one of these."""
+        items, columns = self.get_vertex_columns([attribute])
+        return items, columns[attribute]
+
+    def get_vertex_columns(self, attributes: Iterable[str]) -> tuple[Sequence, dict]:
+        """Return a sequence of all vertex items in this graph, and a dict mapping each of
+        attributes to the column of that attribute, as in get_vertex_column.
+
+        Raise a ValueError if an attribute is not one of those of get_vertex_column."""
+        stored = {'char_count': self.char_counts, 'last_edit': self.last_edits,
+                  'score': self.scores}
+        columns = {}
+        for attribute in attributes:
+            if attribute == 'degree':
+                columns[attribute] = array('q', map(operator.sub, self.offsets[1:],
+                                                    self.offsets[:-1]))
+            elif attribute in stored:
+                columns[attribute] = stored[attribute]
+            else:
+                raise ValueError
+
+        return _ItemSequence(self.items), columns
+
+    def set_scores(self) -> None:
+        """Compute and store the score of every vertex, as _Vertex.set_score does"""
+        offsets = self.offsets
+        for i in range(len(self.items)):
+            self.scores[i] = _score(self.char_counts[i], offsets[i + 1] - offsets[i],
+                                    self.last_edits[i])
+
+    def to_pyvis(self, max_vertices: int = 5000) -> Network:
+        """Convert this graph into a PyVis Network object.
+
+        max_vertices specifies the maximum number of vertices that can appear in the graph.
+        """
+        title = self.items.title
+        graph_pyvis = Network()
+        for i in range(len(self.items)):
+            graph_pyvis.add_node(title(i))
+
+            for j in self.neighbour_ids(i):
+                if graph_pyvis.num_nodes() < max_vertices:
+                    graph_pyvis.add_node(title(j))
+
+                if title(j) in graph_pyvis.get_nodes():
+                    graph_pyvis.add_edge(title(i), title(j))
+
+            if graph_pyvis.num_nodes() >= max_vertices:
+                break
+
+        return graph_pyvis
+
+
+def _score(char_count: int, degree: int, last_edit: int) -> float:
+    """Return the score of a vertex, as defined in _Vertex.set_score"""
+    return (char_count * degree) / math.log(last_edit + 10)
+
+
+def load_csr_graph(info_file: str, links_file: str) -> CSRGraph:
+    """Return a CSRGraph corresponding to the save files.
+
+    Like graph_implementation.load_graph, links to items that are not in info_file are
+    ignored, as are repeated rows of info_file. Either file can be a manifest of shards.
+    """
+    items = []
+    ids = {}
+    char_counts = array('q')
+    last_edits = array('q')
+
+    for line in tqdm(fileinput.input(shards.get_files(info_file),
+                                     openhook=fileinput.hook_encoded("utf-8"))):
+        row = line.split('\t')
+        if row[0] not in ids:
+            ids[row[0]] = len(items)
+            items.append(row[0])
+            char_counts.append(int(row[2]))
+            last_edits.append(int(row[3]))
+
+    edges = array('I')
+    for line in tqdm(fileinput.input(shards.get_files(links_file),
+                                     openhook=fileinput.hook_encoded("utf-8"))):
+        row = line.rstrip('\n').split('\t')
+        source = ids.get(row[0])
+        if source is None:
+            continue
+
+        for item in row[1:]:
+            target = ids.get(item)
+            if target is not None:
+                edges.append(source)
+                edges.append(target)
+
+    return CSRGraph.from_edges(_ItemTable(items, ids), char_counts, last_edits, edges)
+
+
+def load_csr_graph_parallel(info_file: str, links_file: str, titles_file: str = None,
+                            num_ranges: int = None, max_workers: int = None) -> CSRGraph:
+    """Return a CSRGraph corresponding to the save files, parsing the links file and
+    building the adjacency arrays in concurrent processes.
+
+    The vertices are numbered with a title table written to titles_file (by default, next to
+    info_file), which every process memory-maps instead of receiving a copy. The links file,
+    or the shards of a links manifest (see shards), is split into num_ranges line aligned
+    byte ranges (by default, 4 per worker), and each range is parsed into edge ids by one
+    of max_workers processes (by default, one per core).
+    The edges are grouped by the block of vertex ids they belong to, and the rows of each
+    block are then sorted and deduplicated by another process.
+
+    Example Run:
+    >>> g = load_csr_graph_parallel('data/processed/graph/wiki-info-collapsed.tsv',
+    ...                             'data/processed/graph/wiki-links-collapsed.tsv')
+    """
+    if titles_file is None:
+        titles_file = os.path.splitext(info_file)[0] + '-titles.bin'
+    if max_workers is None:
+        max_workers = os.cpu_count()
+    if num_ranges is None:
+        num_ranges = 4 * max_workers
+
+    table = title_ids.TitleTable.build(title_ids.read_info_titles(info_file), titles_file)
+    n = len(table)
+
+    # As in load_graph, the first row of a repeated item gives its attributes
+    char_counts = array('q', bytes(8 * n))
+    last_edits = array('q', bytes(8 * n))
+    seen = bytearray(n)
+    print("Reading vertex information...")
+    for line in tqdm(fileinput.input(shards.get_files(info_file),
+                                     openhook=fileinput.hook_encoded("utf-8"))):
+        row = line.split('\t')
+        i = table.id(row[0])
+        if not seen[i]:
+            seen[i] = 1
+            char_counts[i] = int(row[2])
+            last_edits[i] = int(row[3])
+
+    ranges = shards.get_line_ranges(links_file, num_ranges)
+    block_size = max(1, -(-n // num_ranges))
+    offsets, neighbours = _build_adjacency(
+        _read_links_range, [(file, start, end, table) for file, start, end in ranges],
+        n, block_size, max_workers)
+
+    return CSRGraph(table, offsets, neighbours, char_counts, last_edits)
+
+
+def load_csr_graph_interned(info_file: str, titles_file: str, edges_file: str,
+                            resolver: redirects.RedirectResolver, vertices_file: str,
+                            max_workers: int = None) -> CSRGraph:
+    """Return the same CSRGraph as load_csr_graph_parallel on the files written by
+    process_wikitext.collapse_redirects, but built from the uncollapsed info file, the title
+    table and edge shards written by title_ids.intern_shards, and resolver.
+
+    The redirects are collapsed on the integer ids: every title of the table is resolved
+    once, into the vertex id it leads to, and the edge shards are then mapped through that
+    array by max_workers processes (by default, one per core). No link is parsed or hashed
+    again. edges_file is an edges manifest, or a single edges file.
+
+    The vertices are the articles of info_file, numbered with a title table written to
+    vertices_file.
+
+    Example Run:
+    >>> g = load_csr_graph_interned('data/processed/graph/wiki-info.manifest',
+    ...                             'data/processed/graph/wiki-titles.bin',
+    ...                             'data/processed/graph/wiki-edges.manifest',
+    ...                             redirects.RedirectResolver('data/processed/graph/redirects'),
+    ...                             'data/processed/graph/wiki-graph-titles.bin')
+    """
+    if max_workers is None:
+        max_workers = os.cpu_count()
+
+    table = title_ids.TitleTable(titles_file)
+    num_titles = len(table)
+
+    # As in load_graph, the first row of a repeated article gives its attributes
+    is_article = bytearray(num_titles)
+    char_counts = array('q', bytes(8 * num_titles))
+    last_edits = array('q', bytes(8 * num_titles))
+    print("Reading vertex information...")
+    for line in tqdm(shards.iter_lines(info_file)):
+        row = line.split('\t')
+        i = table.id(row[0])
+        if row[1] == '' and not is_article[i]:
+            is_article[i] = 1
+            char_counts[i] = int(row[2])
+            last_edits[i] = int(row[3])
+
+    # Both tables are sorted, so the articles keep their relative order as vertices
+    items = title_ids.TitleTable.build((table.title(i) for i in range(num_titles)
+                                        if is_article[i]), vertices_file)
+    n = len(items)
+
+    # The vertex of every title if it is an article (-1 otherwise), followed by the vertex
+    # it leads to, which is also -1 if it leads nowhere
+    vertex_ids = array('i', [-1]) * (2 * num_titles)
+    vertex = 0
+    for i in range(num_titles):
+        if is_article[i]:
+            vertex_ids[i] = vertex_ids[num_titles + i] = vertex
+            vertex += 1
+
+    print("Resolving redirects...")
+    for i in tqdm(range(num_titles)):
+        if not is_article[i]:
+            target = resolver.resolve(table.title(i))
+            j = table.id(target) if target is not None else -1
+            if j != -1:
+                vertex_ids[num_titles + i] = vertex_ids[j]
+
+    # Each worker maps this file instead of receiving a copy of the array
+    fd, vertex_ids_file = tempfile.mkstemp(suffix='.bin',
+                                           dir=os.path.dirname(vertices_file) or None)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            vertex_ids.tofile(f)
+        del vertex_ids
+
+        files = shards.get_files(edges_file)
+        offsets, neighbours = _build_adjacency(
+            _read_edges_file, [(file, vertex_ids_file, n) for file in files], n,
+            max(1, -(-n // (4 * max_workers))), max_workers)
+    finally:
+        os.remove(vertex_ids_file)
+
+    articles = [i for i in range(num_titles) if is_article[i]]
+    return CSRGraph(items, offsets, neighbours, array('q', (char_counts[i] for i in articles)),
+                    array('q', (last_edits[i] for i in articles)))
+
+
+def _build_adjacency(function: Callable, tasks: list[tuple], n: int, block_size: int,
+                     max_workers: int) -> tuple[array, array]:
+    """Return the offsets and neighbours of the graph of n vertices whose edges are given by
+    calling function(*task, block_size) for every task of tasks in max_workers processes.
+
+    Each call returns one array of (vertex, neighbour) pairs per block of block_size vertex
+    ids. The rows of each block are then sorted and deduplicated by another process, and
+    the pairs of a block are released once its rows are built.
+    """
+    blocks = [(first, min(first + block_size, n)) for first in range(0, n, block_size)]
+    block_pairs = [[] for _ in blocks]
+    max_pending = 2 * max_workers
+
+    def build_tasks() -> Iterator[tuple[int, int, list[array]]]:
+        for k, (first, last) in enumerate(blocks):
+            pairs, block_pairs[k] = block_pairs[k], None
+            yield first, last, pairs
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers,
+                                                mp_context=pipeline.get_process_context()) as executor:
+        print("Reading links...")
+        for task_pairs in tqdm(_map_bounded(executor, function,
+                                            (task + (block_size,) for task in tasks),
+                                            max_pending), total=len(tasks)):
+            for pairs, block in zip(task_pairs, block_pairs):
+                block.append(pairs)
+
+        # Blocks are returned in order, so their rows can simply be concatenated
+        print("Building adjacency arrays...")
+        offsets = array('q', [0])
+        neighbours = array('I')
+        for degrees, block_neighbours in tqdm(_map_bounded(executor, _build_rows,
+                                                           build_tasks(), max_pending),
+                                              total=len(blocks)):
+            for degree in degrees:
+                offsets.append(offsets[-1] + degree)
+            neighbours.extend(block_neighbours)
+
+    return offsets, neighbours
+
+
+def _map_bounded(executor: concurrent.futures.Executor, function: Callable,
+                 tasks: Iterable[tuple], max_pending: int) -> Iterator:
+    """Yield function(*task) for every task of tasks, in order, computed by executor.
+
+    Unlike executor.map, at most max_pending tasks are submitted and not yet yielded at any
+    time, so the arguments and results of the other tasks are never all held in memory.
+    """
+    tasks = iter(tasks)
+    pending = collections.deque()
+    while True:
+        # A task is only taken from tasks once there is room for it
+        for task in itertools.islice(tasks, max_pending - len(pending)):
+            pending.append(executor.submit(function, *task))
+        if not pending:
+            return
+        yield pending.popleft().result()
+
+
+def _read_links_range(links_file: str, start: int, end: int, table: title_ids.TitleTable,
+                      block_size: int) -> list[array]:
+    """Return the edges of the rows of links_file in the byte range [start, end), in both
+    directions, as flat arrays of vertex, neighbour, ... ids: one array for every block of
+    block_size vertex ids, holding the pairs whose vertex is in that block.
+
+    Links to titles that are not in table, and links from a title to itself, are ignored."""
+    with open(links_file, 'rb') as f:
+        f.seek(start)
+        rows = f.read(end - start).decode('utf-8').split('\n')
+
+    blocks = [array('I') for _ in range(-(-len(table) // block_size))]
+    for line in rows:
+        row = line.split('\t')
+        source = table.id(row[0]) if line else -1
+        if source == -1:
+            continue
+
+        source_block = blocks[source // block_size]
+        for item in row[1:]:
+            target = table.id(item) if item else -1
+            if target != -1 and target != source:
+                source_block.append(source)
+                source_block.append(target)
+                target_block = blocks[target // block_size]
+                target_block.append(target)
+                target_block.append(source)
+
+    return blocks
+
+
+def _read_edges_file(edges_file: str, vertex_ids_file: str, n: int,
+                     block_size: int) -> list[array]:
+    """Return the edges of edges_file, written by title_ids.encode_links, collapsed onto the
+    n vertices of load_csr_graph_interned, in both directions, grouped into blocks as in
+    _read_links_range.
+
+    vertex_ids_file holds the vertex of every title, then the vertex every title leads to.
+    Edges from titles that are not articles, to titles that lead nowhere, and from a vertex
+    to itself are ignored."""
+    with open(vertex_ids_file, 'rb') as f:
+        vertex_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    vertex_ids = memoryview(vertex_map).cast('i')
+    num_titles = len(vertex_ids) // 2
+    edges = title_ids.read_edges(edges_file)
+
+    blocks = [array('I') for _ in range(-(-n // block_size))]
+    pairs = iter(edges)
+    for source, target in zip(pairs, pairs):
+        source = vertex_ids[source]
+        target = vertex_ids[num_titles + target]
+        if source != -1 and target != -1 and target != source:
+            source_block = blocks[source // block_size]
+            source_block.append(source)
+            source_block.append(target)
+            target_block = blocks[target // block_size]
+            target_block.append(target)
+            target_block.append(source)
+
+    vertex_ids.release()
+    vertex_map.close()
+    return blocks
+
+
+def _build_rows(first: int, last: int, block_pairs: list[array]) -> tuple[array, array]:
+    """Return the degrees of vertices first to last - 1, and their sorted and deduplicated
+    neighbours concatenated, given every (vertex, neighbour) pair of those vertices"""
+    rows = [[] for _ in range(last - first)]
+    for pairs in block_pairs:
+        pairs = iter(pairs)
+        for vertex, neighbour in zip(pairs, pairs):
+            rows[vertex - first].append(neighbour)
+
+    degrees = array('q')
+    neighbours = array('I')
+    for row in rows:
+        row = sorted(set(row))
+        degrees.append(len(row))
+        neighbours.extend(row)
+
+    return degrees, neighbours
+
+
+if __name__ == '__main__':
+    os.chdir(__file__[0:-len('wikigraph/csr_graph.py')])
+
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,228 @@
+"""Random access to the <page> elements of an xml dump using a byte index
+
+Specifications:
+ - DumpReader('path/to/enwiki.xml', byte_index):
+    Memory-maps the dump so that any page can be sliced out of it in O(1) using the
+    (offset, length) pairs produced by partition_data.create_byte_index.
+ - get_aligned_ranges('path/to/enwiki.xml', num_ranges):
+    Splits the dump into num_ranges byte ranges of roughly equal size, each of which starts
+    at a <page> tag, without needing an index.
+ - iter_page_spans(buffer, start, end):
+    Yields the (offset, length) of every page that starts within a byte range of a buffer.
+ - iter_pages(buffer, start, end):
+    Yields every page that starts within a byte range of a buffer as a memoryview, without
+    copying it.
+ - iter_page_chunks(buffer, start, end, chunk_size):
+    Like iter_pages, but yields views of many consecutive whole pages at a time.
+
+Example of use:
+We will assume that we are currently in the root directory. Modify paths as needed.
+
+>>> index = partition_data.read_byte_index('data/processed/wiki-byte-index.txt')
+>>> with DumpReader('data/raw/enwiki-20210101-pages-articles-multistream.xml', index) as dump:
+...     page = dump.get_page(12345)
+# page is the 12346th <page> element of the dump, from <page> to </page>
+"""
+from __future__ import annotations
+
+import os
+import mmap
+from typing import Iterator, Sequence, Union
+
+PAGE_START_TAG = b'<page>'
+PAGE_END_TAG = b'</page>'
+
+# Approximate size in bytes of the chunks yielded by iter_page_chunks
+CHUNK_SIZE = 1 << 25
+
+
+class DumpReader:
+    """A read-only view of the pages of an xml dump.
+
+    Instance Attributes:
+        - filename: The path of the xml dump.
+        - index: The (offset, length) pair of every page in the dump, in file order.
+
+    Representation Invariants:
+        - all(offset >= 0 and length > 0 for offset, length in self.index)
+    """
+    filename: str
+    index: Sequence[tuple[int, int]]
+
+    # Private Instance Attributes:
+    #     - _file: The open binary file object for the dump.
+    #     - _map: A read-only memory map of the whole dump.
+    _file: object
+    _map: mmap.mmap
+
+    def __init__(self, filename: str, index: Sequence[tuple[int, int]]) -> None:
+        """Open and memory-map the dump at filename. Nothing is read until a page is requested."""
+        self.filename = filename
+        self.index = index
+        self._file = open(filename, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self) -> int:
+        """Return the number of pages in the dump."""
+        return len(self.index)
+
+    def __enter__(self) -> DumpReader:
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Release the memory map and the underlying file."""
+        self._map.close()
+        self._file.close()
+
+    def get_page_bytes(self, i: int) -> bytes:
+        """Return the raw bytes of page i.
+
+        Raise an IndexError if i is not a valid page number."""
+        offset, length = self.index[i]
+        return self._map[offset:offset + length]
+
+    def get_page_view(self, i: int) -> memoryview:
+        """Return a memoryview of page i that shares memory with the dump. The view must be
+        released before the reader is closed.
+
+        Raise an IndexError if i is not a valid page number."""
+        offset, length = self.index[i]
+        return memoryview(self._map)[offset:offset + length]
+
+    def get_page(self, i: int) -> str:
+        """Return page i decoded as a string, from its <page> tag to its </page> tag.
+
+        Raise an IndexError if i is not a valid page number."""
+        return self.get_page_bytes(i).decode('utf-8')
+
+    def iter_pages(self, start: int = 0, stop: int = None) -> Iterator[str]:
+        """Yield pages start to stop - 1 (or to the end of the dump if stop is None)."""
+        if stop is None:
+            stop = len(self.index)
+
+        for i in range(start, stop):
+            yield self.get_page(i)
+
+
+def get_aligned_ranges(filename: str, num_ranges: int) -> list[tuple[int, int]]:
+    """Return a list of at most num_ranges (start, end) byte ranges that cover every page of
+    the dump at filename. Each range starts at a <page> tag, so every page lies in exactly
+    one range.
+
+    The ranges are found by jumping to evenly spaced offsets and searching forward for the
+    next <page> tag, so only a few kilobytes of the dump are read.
+
+    Preconditions:
+        - num_ranges > 0
+    """
+    size = os.path.getsize(filename)
+    with open(filename, 'rb') as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        starts = []
+        for i in range(num_ranges):
+            start = buffer.find(PAGE_START_TAG, size * i // num_ranges)
+            # Two evenly spaced offsets can land inside the same page, and the tail of the
+            # file (</mediawiki>) contains no pages at all
+            if start != -1 and (not starts or start != starts[-1]):
+                starts.append(start)
+
+        buffer.close()
+
+    return [(starts[i], starts[i + 1] if i + 1 < len(starts) else size)
+            for i in range(len(starts))]
+
+
+def iter_page_spans(buffer: Union[str, bytes, mmap.mmap], start: int = 0,
+                    end: int = None) -> Iterator[tuple[int, int]]:
+    """Yield the (offset, length) of every page in buffer whose <page> tag starts within
+    [start, end). A page starting before end is yielded in full even if it ends after end.
+    buffer may also be a str, in which case the offsets are character offsets.
+
+    Raise a ValueError if a page has no </page> tag, e.g. because the dump was truncated.
+
+    >>> list(iter_page_spans(b'<x><page>a</page>\\n<page>bc</page></x>'))
+    [(3, 14), (18, 15)]
+    >>> list(iter_page_spans(b'<x><page>a</page>\\n<page>bc</page></x>', 4))
+    [(18, 15)]
+    >>> list(iter_page_spans('<x><page>a</page></x>'))
+    [(3, 14)]
+    """
+    if end is None:
+        end = len(buffer)
+
+    if isinstance(buffer, str):
+        start_tag, end_tag = PAGE_START_TAG.decode(), PAGE_END_TAG.decode()
+    else:
+        start_tag, end_tag = PAGE_START_TAG, PAGE_END_TAG
+
+    page_start = buffer.find(start_tag, start, end)
+    while page_start != -1:
+        page_end = buffer.find(end_tag, page_start)
+        if page_end == -1:
+            raise ValueError(f'The page at offset {page_start} has no </page> tag')
+        page_end += len(end_tag)
+        yield page_start, page_end - page_start
+
+        page_start = buffer.find(start_tag, page_end, end)
+
+
+def iter_pages(buffer: Union[bytes, mmap.mmap], start: int = 0,
+               end: int = None) -> Iterator[memoryview]:
+    """Yield a memoryview of every page in buffer whose <page> tag starts within [start, end).
+
+    The views share memory with buffer, so no page is copied until it is decoded, e.g. with
+    str(page, 'utf-8'). A memory map cannot be closed while views of it are still alive, so
+    release each view (page.release()) once it has been used.
+
+    >>> [bytes(page) for page in iter_pages(b'<x><page>a</page>\\n<page>bc</page></x>')]
+    [b'<page>a</page>', b'<page>bc</page>']
+    """
+    view = memoryview(buffer)
+    try:
+        for offset, length in iter_page_spans(buffer, start, end):
+            yield view[offset:offset + length]
+    finally:
+        view.release()
+
+
+
+def iter_page_chunks(buffer: Union[bytes, mmap.mmap], start: int = 0, end: int = None,
+                     chunk_size: int = CHUNK_SIZE) -> Iterator[memoryview]:
+    """Yield memoryviews of consecutive whole pages of buffer whose <page> tags start within
+    [start, end). Each view runs from a <page> tag to a </page> tag and is about chunk_size
+    bytes long, unless a single page is longer than that.
+
+    As with iter_pages, release each view once it has been used.
+
+    >>> xml = b'<x><page>a</page>\\n<page>bc</page>\\n<page>d</page></x>'
+    >>> [bytes(chunk) for chunk in iter_page_chunks(xml, chunk_size=20)]
+    [b'<page>a</page>\\n<page>bc</page>', b'<page>d</page>']
+    """
+    view = memoryview(buffer)
+    chunk_start = -1
+    chunk_end = -1
+    try:
+        for offset, length in iter_page_spans(buffer, start, end):
+            if chunk_start == -1:
+                chunk_start = offset
+            chunk_end = offset + length
+
+            if chunk_end - chunk_start >= chunk_size:
+                yield view[chunk_start:chunk_end]
+                chunk_start = -1
+
+        if chunk_start != -1:
+            yield view[chunk_start:chunk_end]
+    finally:
+        view.release()
+
+
+if __name__ == '__main__':
+    os.chdir(__file__[0:-len('wikigraph/dump_reader.py')])
+
+    import doctest
+    doctest.testmod()
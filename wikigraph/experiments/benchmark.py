@@ -0,0 +1,359 @@
+"""Benchmark the wikitext extractors on fixed corpora, against the wikitextparser baseline,
+and catch changes that make them slower
+
+Specifications:
+ - get_corpora():
+    Returns three fixed corpora of <page> elements in the layout of the dumps: small pages,
+    pages of about the median article size, and pathological pages (thousands of links,
+    nested file captions, unclosed brackets).
+ - run_benchmarks():
+    Times every case (the parse_page and collect_links_batch paths of the extraction,
+    collect_links, parse_wikilink, char_count, last_revision, get_title, parse_redirect and
+    the wikitextparser baseline) on every corpus, and how many times faster collect_links
+    is than the baseline (see versus_wtp.time_versus).
+ - find_regressions(results, baseline_results, threshold):
+    Returns the cases that are more than threshold slower than in a previous run.
+ - main(['--output', 'benchmark.json', '--baseline', 'previous.json']):
+    Runs the benchmarks, saves the results as JSON, and returns 1 if there is a regression.
+
+Example of use:
+$ python -m wikigraph.experiments.benchmark --output data/processed/benchmark.json
+$ # ...change wikitext.py...
+$ python -m wikigraph.experiments.benchmark --baseline data/processed/benchmark.json
+"""
+from __future__ import annotations
+
+import os
+import sys
+import json
+import time
+import random
+import timeit
+import argparse
+import platform
+from typing import Callable, NamedTuple, Optional, Sequence
+
+import wikitextparser as wtp
+
+from wikigraph import wikitext, dump_reader
+from wikigraph.experiments import versus_wtp
+
+# Results are only compared with a baseline if both have this version
+BENCHMARK_VERSION = 1
+
+# By default, a case regresses if it is more than this much slower than in the baseline
+THRESHOLD = 0.25
+
+# The case that the others are compared with. It is not checked for regressions since it
+# is not our code.
+BASELINE_CASE = 'wikitextparser'
+
+_WORDS = ['the', 'of', 'and', 'in', 'was', 'is', 'for', 'as', 'on', 'with', 'by', 'he',
+          'at', 'from', 'his', 'an', 'were', 'are', 'which', 'this', 'also', 'be', 'had',
+          'first', 'one', 'their', 'its', 'new', 'after', 'who', 'they', 'two', 'her']
+
+_PAGE = ('  <page>\n'
+         '    <title>{title}</title>\n'
+         '    <ns>0</ns>\n'
+         '    <id>{id}</id>\n'
+         '{redirect}'
+         '    <revision>\n'
+         '      <id>{id}</id>\n'
+         '      <timestamp>{timestamp}</timestamp>\n'
+         '      <contributor>\n'
+         '        <username>Benchmark</username>\n'
+         '        <id>1</id>\n'
+         '      </contributor>\n'
+         '      <model>wikitext</model>\n'
+         '      <format>text/x-wiki</format>\n'
+         '      <text bytes="{size}" xml:space="preserve">{text}</text>\n'
+         '      <sha1>{sha1}</sha1>\n'
+         '    </revision>\n'
+         '  </page>')
+
+
+class Case(NamedTuple):
+    """A function to benchmark.
+
+    Instance Attributes:
+        - name: The name of the case in the results
+        - run: Runs the function once on every item of its inputs
+        - inputs: Returns the inputs of run, given the pages of a corpus
+    """
+    name: str
+    run: Callable[[list], None]
+    inputs: Callable[[list[str]], list]
+
+
+def make_page(n: int, title: str, text: str, timestamp: str, redirect: str = '') -> str:
+    """Return a <page> element laid out exactly like those of the dumps, so that functions
+    relying on fixed offsets (such as char_count) work on it"""
+    return _PAGE.format(title=title, id=n,
+                        redirect=f'    <redirect title="{redirect}" />\n' if redirect else '',
+                        timestamp=timestamp, size=len(text.encode('utf-8')), text=text,
+                        sha1=('%031d' % n)[-31:])
+
+
+def _random_link(rng: random.Random) -> str:
+    """Return a random wikilink in one of the forms found in articles"""
+    target = ' '.join(rng.choice(_WORDS) for _ in range(rng.randint(1, 3))).capitalize()
+    form = rng.random()
+    if form < 0.5:
+        return f'[[{target}]]'
+    if form < 0.8:
+        return f'[[{target}|{rng.choice(_WORDS)}]]'
+    if form < 0.9:
+        return f'[[{target}#{rng.choice(_WORDS).capitalize()}|{rng.choice(_WORDS)}]]'
+    return f'[[File:{target}.jpg|thumb|A [[{target}]] in {rng.choice(_WORDS)}]]'
+
+
+def _random_text(rng: random.Random, words: int, links: int) -> str:
+    """Return wikitext of about words words with links wikilinks spread through it"""
+    tokens = [rng.choice(_WORDS) for _ in range(words)]
+    for _ in range(links):
+        tokens.insert(rng.randrange(len(tokens) + 1), _random_link(rng))
+    return ' '.join(tokens).replace(' the ', ' the\n', words // 40)
+
+
+def _random_timestamp(rng: random.Random) -> str:
+    """Return a random timestamp in the layout of the dumps"""
+    return '%04d-%02d-%02dT%02d:%02d:%02dZ' % (
+        rng.randint(2002, 2020), rng.randint(1, 12), rng.randint(1, 28), rng.randint(0, 23),
+        rng.randint(0, 59), rng.randint(0, 59))
+
+
+def get_corpora(seed: int = 0) -> dict[str, list[str]]:
+    """Return the small, median and pathological corpora. The same seed always gives the
+    same pages.
+
+    - small: 200 stub-sized pages with a few links, one in five of them a redirect
+    - median: 50 pages of about the median article size (around 4 kB, 40 links)
+    - pathological: 4 pages that are slow to extract: thousands of links, file captions
+      with nested links, hundreds of unclosed [[ and a long page without any link
+    """
+    rng = random.Random(seed)
+
+    small = []
+    for n in range(200):
+        title = f'Stub {n}'
+        if n % 5 == 0:
+            small.append(make_page(n, title, f'#REDIRECT [[Stub {n + 1}]]',
+                                   _random_timestamp(rng), f'Stub {n + 1}'))
+        else:
+            small.append(make_page(n, title, _random_text(rng, 40, rng.randint(1, 5)),
+                                   _random_timestamp(rng)))
+
+    median = [make_page(n, f'Article {n}', _random_text(rng, 700, 40), _random_timestamp(rng))
+              for n in range(50)]
+
+    captions = ' '.join(f'[[File:Image {i}.png|thumb|left|A caption about [[{_WORDS[i % 33]}]]'
+                        f' and [[{_WORDS[(i + 1) % 33]}|more]]]]' for i in range(500))
+    unclosed = ' '.join(f'[[{rng.choice(_WORDS)} ' + ' '.join(rng.choice(_WORDS)
+                                                              for _ in range(20))
+                        for _ in range(400)) + ' [[closed]]'
+    pathological = [make_page(0, 'Many links', _random_text(rng, 20000, 5000),
+                              _random_timestamp(rng)),
+                    make_page(1, 'File captions', captions, _random_timestamp(rng)),
+                    make_page(2, 'Unclosed links', unclosed, _random_timestamp(rng)),
+                    make_page(3, 'No links', _random_text(rng, 50000, 0), '')]
+
+    return {'small': small, 'median': median, 'pathological': pathological}
+
+
+def _wikilinks(pages: list[str]) -> list[str]:
+    """Return the contents of every [[wikilink]] in pages, without the brackets"""
+    return [link[2:-2] for page in pages for link in wikitext.link_regex.findall(page)]
+
+
+def _run_each(function: Callable) -> Callable[[list], None]:
+    """Return a function that calls function on every item of a list"""
+    def run(items: list) -> None:
+        for item in items:
+            function(item)
+    return run
+
+
+def _last_revision(page: str) -> None:
+    """Call last_revision on page, the way the extraction tolerates invalid timestamps"""
+    try:
+        wikitext.last_revision(page)
+    except ValueError:
+        pass
+
+
+def _chunks(pages: list[str]) -> list[str]:
+    """Return pages as a single chunk of consecutive <page> elements, as the extraction
+    workers read them"""
+    return ['\n'.join(pages)]
+
+
+def _parse_page(page: str) -> None:
+    """Extract the record and links of page, the way process_wikitext._write_page does"""
+    record = wikitext.parse_page(page)
+    wikitext.collect_record_links(page, record)
+
+
+def _parse_chunk(chunk: str) -> None:
+    """Extract the records and links of every page of chunk, the way
+    process_wikitext._write_chunk does"""
+    records = [wikitext.parse_page(chunk, offset, offset + length, with_links=False)
+               for offset, length in dump_reader.iter_page_spans(chunk)]
+    wikitext.collect_links_batch(chunk, [record.text_start for record in records],
+                                 [record.text_end for record in records])
+
+
+def _wikitextparser_links(page: str) -> list[str]:
+    """Return the links of page with wikitextparser, the equivalent of collect_links"""
+    return [link.title for link in wtp.parse(page).wikilinks]
+
+
+def get_cases() -> list[Case]:
+    """Return every case of the benchmark, the wikitextparser baseline last"""
+    pages = lambda corpus: corpus
+    cases = [Case('parse_page', _run_each(_parse_page), pages),
+             Case('collect_links_batch', _run_each(_parse_chunk), _chunks),
+             Case('collect_links', _run_each(wikitext.collect_links), pages),
+             Case('parse_wikilink', _run_each(wikitext.parse_wikilink), _wikilinks),
+             Case('char_count', _run_each(wikitext.char_count), pages),
+             Case('last_revision', _run_each(_last_revision), pages),
+             Case('get_title', _run_each(wikitext.get_title), pages),
+             Case('parse_redirect', _run_each(wikitext.parse_redirect), pages),
+             Case(BASELINE_CASE, _run_each(_wikitextparser_links), pages)]
+
+    return cases
+
+
+def time_case(case: Case, pages: list[str], repeat: int = 5, min_time: float = 0.2) -> dict:
+    """Return the fastest of repeat timings of case on pages: the seconds that one pass over
+    its inputs takes, the number of inputs and the number of inputs per second.
+
+    Each timing runs case enough times to take at least min_time seconds."""
+    inputs = case.inputs(pages)
+    timer = timeit.Timer(lambda: case.run(inputs))
+
+    number = 1
+    while timer.timeit(number) < min_time:
+        number *= 2
+
+    seconds = min(timer.repeat(repeat, number)) / number
+    return {'seconds': seconds, 'items': len(inputs),
+            'items_per_s': len(inputs) / seconds if seconds > 0 else None}
+
+
+def run_benchmarks(corpora: Optional[dict[str, list[str]]] = None,
+                   cases: Optional[Sequence[Case]] = None, repeat: int = 5,
+                   min_time: float = 0.2) -> dict:
+    """Time every case on every corpus (by default, those of get_corpora and get_cases), and
+    return the results along with the environment they were measured in.
+
+    results['results'][case][corpus] is the time_case of the case on the corpus, and
+    results['speedups'][corpus] is how many times faster collect_links is than wikitextparser
+    on the corpus, timed with versus_wtp.time_versus.
+    """
+    if corpora is None:
+        corpora = get_corpora()
+    if cases is None:
+        cases = get_cases()
+
+    results = {'version': BENCHMARK_VERSION,
+               'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'python': platform.python_version(),
+               'platform': platform.platform(),
+               'results': {},
+               'speedups': {}}
+
+    for case in cases:
+        for name, pages in corpora.items():
+            print(f"Timing {case.name} on the {name} corpus...")
+            results['results'].setdefault(case.name, {})[name] = \
+                time_case(case, pages, repeat, min_time)
+
+    for name, pages in corpora.items():
+        print(f"Timing collect_links against wikitextparser on the {name} corpus...")
+        versus = versus_wtp.time_versus('collect(pages)', 'baseline(pages)',
+                                        {'no_io': True, 'times': repeat},
+                                        {'collect': _run_each(wikitext.collect_links),
+                                         'baseline': _run_each(_wikitextparser_links),
+                                         'pages': pages})
+        results['speedups'][name] = versus['laps']
+
+    return results
+
+
+def find_regressions(results: dict, baseline_results: dict,
+                     threshold: float = THRESHOLD) -> list[str]:
+    """Return a description of every case and corpus that is more than threshold (a
+    fraction) slower in results than in baseline_results. The baseline case is not checked.
+
+    Timings are only comparable if they were measured on the same machine.
+
+    Raise a ValueError if the results come from different versions of the benchmark."""
+    if results['version'] != baseline_results['version']:
+        raise ValueError('the results come from different versions of the benchmark')
+
+    regressions = []
+    for case, corpora in results['results'].items():
+        if case == BASELINE_CASE:
+            continue
+        for corpus, timing in corpora.items():
+            before = baseline_results['results'].get(case, {}).get(corpus)
+            if before is not None and timing['seconds'] > before['seconds'] * (1 + threshold):
+                regressions.append(f"{case} on the {corpus} corpus: {before['seconds']:.3g}s "
+                                   f"-> {timing['seconds']:.3g}s "
+                                   f"({timing['seconds'] / before['seconds']:.2f}x)")
+
+    return regressions
+
+
+def save_results(results: dict, filename: str) -> None:
+    """Write results to filename as JSON"""
+    with open(filename, 'w') as f:
+        json.dump(results, f, indent=2)
+
+
+def load_results(filename: str) -> dict:
+    """Return the results saved to filename by save_results"""
+    with open(filename, 'r') as f:
+        return json.load(f)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """Run the benchmarks with the command line arguments argv, print the results, and
+    return 1 if a case regressed compared to the baseline file, or 0 otherwise"""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--output', help='the file to save the results to, as JSON')
+    parser.add_argument('--baseline', help='the results of a previous run to compare with')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD,
+                        help='the fraction by which a case may be slower than the baseline')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(repeat=args.repeat, min_time=args.min_time)
+
+    print(f"\n{'case':<16}{'corpus':<14}{'seconds':>12}{'items/s':>14}")
+    for case, corpora in results['results'].items():
+        for corpus, timing in corpora.items():
+            print(f"{case:<16}{corpus:<14}{timing['seconds']:>12.6f}"
+                  f"{timing['items_per_s'] or 0:>14.0f}")
+    for corpus, speedup in results['speedups'].items():
+        print(f"collect_links is {speedup:.1f}x faster than wikitextparser on the "
+              f"{corpus} corpus")
+
+    if args.output:
+        save_results(results, args.output)
+
+    if args.baseline:
+        regressions = find_regressions(results, load_results(args.baseline), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regressions beyond {args.threshold:.0%}:")
+            for regression in regressions:
+                print('  ' + regression)
+            return 1
+        print(f"\nNo regressions beyond {args.threshold:.0%}")
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
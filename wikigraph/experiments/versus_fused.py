@@ -0,0 +1,46 @@
+"""Benchmark the fused wikitext.parse_page extractor against calling get_title,
+parse_redirect, char_count, last_revision and collect_links separately on every page."""
+import os
+
+from wikigraph import wikitext, partition_data
+from wikigraph.dump_reader import DumpReader
+from wikigraph.experiments import versus_wtp
+
+
+def per_function(pages: list[str]) -> None:
+    """Extract every page the way process_partition used to: one scan per function"""
+    for page in pages:
+        wikitext.get_title(page)
+        if not wikitext.parse_redirect(page):
+            wikitext.char_count(page)
+            wikitext.last_revision(page)
+            wikitext.collect_links(page)
+
+
+def fused(pages: list[str]) -> None:
+    """Extract every page with a single parse_page pass"""
+    for page in pages:
+        record = wikitext.parse_page(page)
+        if not record.redirect:
+            wikitext.revision_age(record.timestamp)
+            wikitext.collect_record_links(page, record)
+
+
+def time_fused(xml_file: str, times: int = 3) -> dict:
+    """Time both extraction paths over every page of xml_file
+
+    Example Run:
+    >>> time_fused('data/raw/reduced/hundredk.xml')
+    """
+    with DumpReader(xml_file, partition_data.create_byte_index(xml_file)) as dump:
+        pages = list(dump.iter_pages())
+
+    return versus_wtp.time_versus("fused(pages)", "per_function(pages)", {"times": times},
+                                  {"fused": fused, "per_function": per_function,
+                                   "pages": pages})
+
+
+if __name__ == "__main__":
+    os.chdir(__file__[0:-len('wikigraph/experiments/versus_fused.py')])
+
+    time_fused('data/raw/reduced/hundredk.xml')
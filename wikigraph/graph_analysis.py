@@ -1,16 +1,65 @@
-"""Functions for analysing the graph of Wikipedia data."""
+"""Functions for analysing the graph of Wikipedia data.
+
+Every report selects the n vertices with the smallest (or largest) value of one attribute.
+The attribute is first extracted as a column with get_vertex_column, in one pass over the
+vertices, and the n vertices are then selected from the column without sorting all of it.
+Ties are broken by comparing the vertex items, so the result is always the same: the
+vertices are ordered by (value, item), and a report takes the first n (or the last n) of
+that order.
+"""
 from __future__ import annotations
 import os
-from typing import Any, Optional
+import heapq
+import time
+from typing import Any, NamedTuple, Optional, Sequence
 from graph_implementation import Graph
 
 
+#################################################################################
+# Selection
+#################################################################################
+def _select(items: Sequence, values: Sequence, n: int, largest: bool = False) -> list:
+    """Return the n items with the smallest values (or the largest, if largest is True),
+    sorted by increasing value. items[i] has the value values[i].
+
+    Vertices are ordered by (value, item): the smallest take the first n of that order and
+    the largest take the last n, so ties at the boundary are broken by item.
+
+    >>> _select(['a', 'b', 'c', 'd'], [3, 1, 3, 2], 3)
+    ['b', 'd', 'a']
+    >>> _select(['a', 'b', 'c', 'd'], [3, 1, 3, 2], 2, largest=True)
+    ['a', 'c']
+    """
+    n = min(n, len(values))
+    if n <= 0:
+        return []
+
+    # Find the value of the nth vertex, then take every vertex strictly before it
+    if largest:
+        boundary = heapq.nlargest(n, values)[-1]
+        chosen = [i for i, value in enumerate(values) if value > boundary]
+    else:
+        boundary = heapq.nsmallest(n, values)[-1]
+        chosen = [i for i, value in enumerate(values) if value < boundary]
+
+    # Fill the rest with the vertices whose value equals the boundary, by item
+    ties = [i for i, value in enumerate(values) if value == boundary]
+    needed = n - len(chosen)
+    if largest:
+        chosen.extend(heapq.nlargest(needed, ties, key=items.__getitem__))
+    else:
+        chosen.extend(heapq.nsmallest(needed, ties, key=items.__getitem__))
+
+    chosen.sort(key=lambda i: (values[i], items[i]))
+    return [items[i] for i in chosen]
+
+
 #################################################################################
 # Last Edit Analysis
 #################################################################################
 def find_oldest_edits(g: Graph, n: int) -> list:
     """Return a list of n vertices whose associated articles have the longest
-    time since last edit.
+    time since last edit, sorted from shortest to longest time since last edit.
 
     Preconditions:
         - 0 <= n <= len(g.get_all_vertices())
@@ -28,84 +77,8 @@ def find_oldest_edits(g: Graph, n: int) -> list:
     >>> l
     ['fifth', 'first', 'fourth']
     """
-    lst = list(g.get_all_vertices())
-    sorted_oldest = _n_oldest_edits(g, lst, n)
-    return sorted_oldest
-
-
-def _n_oldest_edits(g: Graph, lst: list, n: int) -> list:
-    """Return a list of n vertices in lst whose associated articles have the
-    longest time since last edit.
-
-    Preconditions:
-        - lst contains no duplicates
-        - 0 <= n <= len(g.get_all_vertices())
-    """
-    if len(lst) < 2:
-        return lst.copy()
-    else:
-        pivot = g.get_vertex_edit_time(lst[0])
-        smaller, bigger = _partition_last_edit(g, lst[1:], pivot)
-
-        if len(lst) == n:
-            # if length of list is n, just return the sorted list
-            smaller_sorted = _n_oldest_edits(g, smaller, len(smaller))
-            bigger_sorted = _n_oldest_edits(g, bigger, len(bigger))
-
-            return smaller_sorted + [lst[0]] + bigger_sorted
-
-        elif len(bigger) == n - 1:
-            bigger_sorted = _sort_vertices_last_edit(g, bigger)
-            return [lst[0]] + bigger_sorted
-
-        elif len(bigger) < n:
-            # must recurse on both smaller and bigger
-            smaller_sorted = _n_oldest_edits(g, smaller, n - len(bigger) - 1)
-            bigger_sorted = _n_oldest_edits(g, bigger, len(bigger))
-
-            return smaller_sorted + [lst[0]] + bigger_sorted
-
-        else:  # if len(bigger) > n
-            return _n_oldest_edits(g, bigger, n)
-
-
-def _sort_vertices_last_edit(g: Graph, lst: list) -> list:
-    """Return a list of all the vertices contained in lst, sorted from
-    shortest time since last edit to longest time since last edit.
-
-    Preconditions:
-        - all items in lst are vertices in g
-    """
-    if len(lst) < 2:
-        return lst.copy()
-    else:
-        pivot = g.get_vertex_edit_time(lst[0])
-
-        smaller, bigger = _partition_last_edit(g, lst[1:], pivot)
-
-        sorted_smaller = _sort_vertices_last_edit(g, smaller)
-        sorted_bigger = _sort_vertices_last_edit(g, bigger)
-
-        # returning a list of ITEMS
-        return sorted_smaller + [lst[0]] + sorted_bigger
-
-
-def _partition_last_edit(g: Graph, lst: list, pivot: Any) -> tuple[list, list]:
-    """Return a partition of lst with the chosen pivot.
-
-    Return two lists, where the first contains the items in lst whose last edits are
-    <= pivot, and the second contains the items in lst with last_edit > pivot.
-    """
-    smaller = []
-    bigger = []
-
-    for item in lst:
-        if g.get_vertex_edit_time(item) <= pivot:
-            smaller.append(item)
-        else:
-            bigger.append(item)
-
-    return (smaller, bigger)
+    items, last_edits = g.get_vertex_column('last_edit')
+    return _select(items, last_edits, n, largest=True)
 
 
 #################################################################################
@@ -113,7 +86,7 @@ def _partition_last_edit(g: Graph, lst: list, pivot: Any) -> tuple[list, list]:
 #################################################################################
 def find_smallest_char_counts(g: Graph, n: int) -> list:
     """Return a list of n vertices whose associated articles have the smallest character
-    counts.
+    counts, sorted from lowest to highest character count.
 
     Preconditions:
         - 0 <= n <= len(g.get_all_vertices())
@@ -127,89 +100,11 @@ def find_smallest_char_counts(g: Graph, n: int) -> list:
     >>> g.add_edge('first', 'second')
     >>> g.add_edge('first', 'third')
     >>> g.add_edge('fourth', 'fifth')
-    >>> l = find_smallest_char_counts(g, 3)
-    >>> l == ['third', 'first', 'second'] or l == ['third', 'second', 'first']
-    True
-    """
-    lst = list(g.get_all_vertices())
-    sorted_small = _n_smallest_chars(g, lst, n)
-    return sorted_small
-
-
-def _n_smallest_chars(g: Graph, lst: list, n: int) -> list:
-    """Return a list of n vertices in lst whose associated articles have the
-    smallest character counts.
-
-    Preconditions:
-        - lst contains no duplicates
-        - 0 <= n <= len(g.get_all_vertices())
+    >>> find_smallest_char_counts(g, 3)
+    ['third', 'first', 'second']
     """
-    if len(lst) < 2:
-        return lst.copy()
-    else:
-        pivot = g.get_vertex_char_count(lst[0])
-        smaller, bigger = _partition_char_count(g, lst[1:], pivot)
-
-        if len(lst) == n:
-            # if length of list is n, just return the sorted list
-            smaller_sorted = _n_smallest_chars(g, smaller, len(smaller))
-            bigger_sorted = _n_smallest_chars(g, bigger, len(bigger))
-
-            return smaller_sorted + [lst[0]] + bigger_sorted
-
-        elif len(smaller) == n - 1:
-            smaller_sorted = _sort_vertices_char_count(g, smaller)
-            return smaller_sorted + [lst[0]]
-
-        elif len(smaller) < n:
-            # must recurse on both smaller and bigger
-            smaller_sorted = _n_smallest_chars(g, smaller, len(smaller))
-            bigger_sorted = _n_smallest_chars(g, bigger, n - len(smaller) - 1)
-
-            return smaller_sorted + [lst[0]] + bigger_sorted
-
-        else:  # if len(smaller) > n
-            return _n_smallest_chars(g, smaller, n)
-
-
-def _sort_vertices_char_count(g: Graph, lst: list) -> list:
-    """Return a list of the vertices contained in lst, sorted from lowest
-    to highest character counts.
-
-    Preconditions:
-        - all items in lst are vertices in g
-    """
-    if len(lst) < 2:
-        return lst.copy()
-    else:
-        pivot = g.get_vertex_char_count(lst[0])
-
-        smaller, bigger = _partition_char_count(g, lst[1:], pivot)
-
-        sorted_smaller = _sort_vertices_char_count(g, smaller)
-        sorted_bigger = _sort_vertices_char_count(g, bigger)
-
-        # returning a list of ITEMS
-        return sorted_smaller + [lst[0]] + sorted_bigger
-
-
-def _partition_char_count(g: Graph, lst: list, pivot: Any) -> tuple[list, list]:
-    """Return a partition of lst with the chosen pivot.
-
-    Return two lists, where the first contains the items in lst whose chararcter
-    counts are <= pivot, and the second contains the items in lst with character
-    counts > pivot.
-    """
-    smaller = []
-    bigger = []
-
-    for item in lst:
-        if g.get_vertex_char_count(item) <= pivot:
-            smaller.append(item)
-        else:
-            bigger.append(item)
-
-    return (smaller, bigger)
+    items, char_counts = g.get_vertex_column('char_count')
+    return _select(items, char_counts, n)
 
 
 #################################################################################
@@ -217,8 +112,8 @@ def _partition_char_count(g: Graph, lst: list, pivot: Any) -> tuple[list, list]:
 #################################################################################
 def find_fewest_edges_threshold(g: Graph, threshold: int, n: Optional[int] = None) -> set:
     """Return the set of vertices with fewer than or equal to threshold edges.
-    If n is given, return only the first n items below the threshold. If there are
-    fewer than n items with a degree below the threshold, fewer than n items will
+    If n is given, return only the n items with the fewest edges below the threshold. If
+    there are fewer than n items with a degree below the threshold, fewer than n items will
     be returned.
 
     Preconditions:
@@ -244,28 +139,16 @@ def find_fewest_edges_threshold(g: Graph, threshold: int, n: Optional[int] = Non
     >>> s1 == {'second'}
     True
     """
-    # the vertices, sorted by degree; contains vertex *items*
-    lst = list(g.get_all_vertices())
-    sorted_lst = _sort_vertices_by_degree(g, lst)
-    few_edges = set()
-
-    for i in range(len(sorted_lst)):
-        if n is not None and n <= 0:
-            return few_edges
+    items, degrees = g.get_vertex_column('degree')
+    if n is None:
+        return {item for item, degree in zip(items, degrees) if degree <= threshold}
 
-        item = sorted_lst[i]
-        if g.get_vertex_degree(item) <= threshold and n is None:
-            few_edges.add(item)
-        elif n is not None and g.get_vertex_degree(item) <= threshold:
-            if n > 0:
-                few_edges.add(item)
-                n = n - 1
-
-    return few_edges
+    return set(_run_metric(items, degrees, Metric('', 'degree', threshold=threshold), n))
 
 
 def find_fewest_edges_no_threshold(g: Graph, n: int) -> list:
-    """Return a list of n vertices with the smallest degrees in the graph.
+    """Return a list of n vertices with the smallest degrees in the graph, sorted from
+    lowest to highest degree.
 
     Preconditions:
         - 0 <= n <= len(g.get_all_vertices())
@@ -282,200 +165,214 @@ def find_fewest_edges_no_threshold(g: Graph, n: int) -> list:
     >>> g.add_edge('first', 'fifth')
     >>> g.add_edge('third', 'fifth')
     >>> g.add_edge('fourth', 'fifth')
-    >>> lst = find_fewest_edges_no_threshold(g, 3)
-    >>> lst == ['second', 'third', 'fourth'] or lst == ['second', 'fourth', 'third']
-    True
-    """
-    # the vertices, sorted by degree; contains vertex *items*
-    lst = list(g.get_all_vertices())
-    sorted_few = _n_smallest_degrees(g, lst, n)
-    return sorted_few
-
-
-def _n_smallest_degrees(g: Graph, lst: list, n: int) -> list:
-    """Return sorted list of first n items with the smallest degrees.
-
-    Preconditions:
-        - 0 <= n <= len(lst)
-        - No duplicates in lst
-    """
-    if len(lst) < 2:
-        return lst.copy()
-    else:
-        pivot = g.get_vertex_degree(lst[0])
-        smaller, bigger = _partition_by_degree(g, lst[1:], pivot)
-
-        if len(lst) == n:
-            # if length of list is n, just return the sorted list
-            smaller_sorted = _n_smallest_degrees(g, smaller, len(smaller))
-            bigger_sorted = _n_smallest_degrees(g, bigger, len(bigger))
-
-            return smaller_sorted + [lst[0]] + bigger_sorted
-
-        elif len(smaller) == n - 1:
-            smaller_sorted = _sort_vertices_by_degree(g, smaller)
-            return smaller_sorted + [lst[0]]
-
-        elif len(smaller) < n:
-            # must recurse on both smaller and bigger
-            smaller_sorted = _n_smallest_degrees(g, smaller, len(smaller))
-            bigger_sorted = _n_smallest_degrees(g, bigger, n - len(smaller) - 1)
-
-            return smaller_sorted + [lst[0]] + bigger_sorted
-
-        else:  # if len(smaller) > n
-            return _n_smallest_degrees(g, smaller, n)
-
-
-def _sort_vertices_by_degree(g: Graph, lst: list) -> list:
-    """Return a list of the vertices contained in lst, sorted from lowest
-    to highest degree.
-
-    Preconditions:
-        - all items in lst are vertices in g
-    """
-    if len(lst) < 2:
-        return lst.copy()
-    else:
-        pivot = g.get_vertex_degree(lst[0])
-
-        smaller, bigger = _partition_by_degree(g, lst[1:], pivot)
-
-        sorted_smaller = _sort_vertices_by_degree(g, smaller)
-        sorted_bigger = _sort_vertices_by_degree(g, bigger)
-
-        # returning a list of ITEMS
-        return sorted_smaller + [lst[0]] + sorted_bigger
-
-
-def _partition_by_degree(g: Graph, lst: list, pivot: Any) -> tuple[list, list]:
-    """Return a partition of lst with the chosen pivot.
-
-    Return two lists, where the first contains the items in lst whose degrees are
-    <= pivot, and the second contains the items in lst with degrees > pivot.
+    >>> find_fewest_edges_no_threshold(g, 3)
+    ['second', 'fourth', 'third']
     """
-    smaller = []
-    bigger = []
-
-    for item in lst:
-        if g.get_vertex_degree(item) <= pivot:
-            smaller.append(item)
-        else:
-            bigger.append(item)
-
-    return (smaller, bigger)
+    items, degrees = g.get_vertex_column('degree')
+    return _select(items, degrees, n)
 
 ################################################################################################
 # Score Analysis
 ################################################################################################
 
 def find_smallest_score(g: Graph, n: int) -> list:
-    """Return a list of n vertices whose associated articles have the smallest scores.
+    """Return a list of n vertices whose associated articles have the smallest scores,
+    sorted from lowest to highest score.
 
     Preconditions:
         - 0 <= n <= len(g.get_all_vertices())
+        - the score of every vertex has been set
     """
-    lst = list(g.get_all_vertices())
-    sorted_small = _n_smallest_scores(g, lst, n)
-    return sorted_small
-
+    items, scores = g.get_vertex_column('score')
+    return _select(items, scores, n)
 
-def _n_smallest_scores(g: Graph, lst: list, n: int) -> list:
-    """Return a list of n vertices in lst whose associated articles have the
-    smallest score.
 
-    Preconditions:
-        - lst contains no duplicates
-        - 0 <= n <= len(g.get_all_vertices())
+################################################################################################
+# Analysis Runner
+################################################################################################
+class Metric(NamedTuple):
+    """A report written by analysis: the n vertices with the smallest (or largest) value of
+    one attribute, optionally only among those whose value is <= threshold.
+
+    Instance Attributes:
+        - name: The name of the report. It is written to name + '.txt'.
+        - attribute: 'char_count', 'last_edit', 'score' or 'degree'.
+        - largest: Whether to report the largest values instead of the smallest.
+        - threshold: If not None, only vertices whose value is <= threshold are reported.
     """
-    if len(lst) < 2:
-        return lst.copy()
-    else:
-        pivot = g.get_vertex_score(lst[0])
-        smaller, bigger = _partition_score(g, lst[1:], pivot)
+    name: str
+    attribute: str
+    largest: bool = False
+    threshold: Optional[int] = None
 
-        if len(lst) == n:
-            # if length of list is n, just return the sorted list
-            smaller_sorted = _n_smallest_scores(g, smaller, len(smaller))
-            bigger_sorted = _n_smallest_scores(g, bigger, len(bigger))
 
-            return smaller_sorted + [lst[0]] + bigger_sorted
+# The reports written by analysis by default
+METRICS = [Metric('oldest_edits', 'last_edit', largest=True),
+           Metric('shortest_text', 'char_count'),
+           Metric('least_links', 'degree'),
+           Metric('lowest_score', 'score')]
 
-        elif len(smaller) == n - 1:
-            smaller_sorted = _sort_vertices_score(g, smaller)
-            return smaller_sorted + [lst[0]]
 
-        elif len(smaller) < n:
-            # must recurse on both smaller and bigger
-            smaller_sorted = _n_smallest_scores(g, smaller, len(smaller))
-            bigger_sorted = _n_smallest_scores(g, bigger, n - len(smaller) - 1)
+def _run_metric(items: Sequence, values: Sequence, metric: Metric, n: int) -> list:
+    """Return the report of metric on the given column, in the order of _select"""
+    if metric.threshold is not None:
+        below = [i for i, value in enumerate(values) if value <= metric.threshold]
+        items, values = [items[i] for i in below], [values[i] for i in below]
 
-            return smaller_sorted + [lst[0]] + bigger_sorted
+    return _select(items, values, n, metric.largest)
 
-        else:  # if len(smaller) > n
-            return _n_smallest_scores(g, smaller, n)
 
+def analysis(graph: Graph, analysis_dir: str, n: int = 100,
+             metrics: Sequence[Metric] = None) -> dict[str, float]:
+    """Run analysis in this file and export to analysis directory
 
-def _sort_vertices_score(g: Graph, lst: list) -> list:
-    """Return a list of the vertices contained in lst, sorted from lowest
-    to highest character counts.
-
-    Preconditions:
-        - all items in lst are vertices in g
+    Every attribute used by metrics (by default, METRICS) is extracted from the graph once,
+    every report is computed from those columns, and then all the reports are written out.
+    Return the time in seconds taken by each metric, and by the column extraction under
+    'columns'.
     """
-    if len(lst) < 2:
-        return lst.copy()
-    else:
-        pivot = g.get_vertex_score(lst[0])
+    if metrics is None:
+        metrics = METRICS
+    timings = {}
 
-        smaller, bigger = _partition_score(g, lst[1:], pivot)
+    start = time.perf_counter()
+    items, columns = graph.get_vertex_columns({metric.attribute for metric in metrics})
+    timings['columns'] = time.perf_counter() - start
 
-        sorted_smaller = _sort_vertices_score(g, smaller)
-        sorted_bigger = _sort_vertices_score(g, bigger)
+    reports = {}
+    for metric in metrics:
+        start = time.perf_counter()
+        reports[metric.name] = _run_metric(items, columns[metric.attribute], metric, n)
+        timings[metric.name] = time.perf_counter() - start
 
-        # returning a list of ITEMS
-        return sorted_smaller + [lst[0]] + sorted_bigger
+    os.makedirs(analysis_dir, exist_ok=True)
+    for name, report in reports.items():
+        with open(os.path.join(analysis_dir, name + '.txt'), 'w', encoding='utf8') as f:
+            f.write('\n'.join(report))
 
+    for name, seconds in timings.items():
+        print(f"{name}: {seconds:.3f}s")
 
-def _partition_score(g: Graph, lst: list, pivot: Any) -> tuple[list, list]:
-    """Return a partition of lst with the chosen pivot.
+    return timings
 
-    Return two lists, where the first contains the items in lst whose scores are
-     <= pivot, and the second contains the items in lst with scores > pivot.
-    """
-    smaller = []
-    bigger = []
-
-    for item in lst:
-        if g.get_vertex_score(item) <= pivot:
-            smaller.append(item)
-        else:
-            bigger.append(item)
-
-    return (smaller, bigger)
 
+################################################################################################
+# Streaming Analysis
+################################################################################################
+class _Reversed:
+    """Wraps a key so that it compares in reverse order, to use heapq as a max-heap"""
+    __slots__ = ('key',)
 
-def analysis(graph: Graph, analysis_dir: str, n: int = 100) -> None:
-    """Run analysis in this file and export to analysis directory"""
-    old_edit_w = open(analysis_dir + 'oldest_edits.txt', 'w', encoding='utf8')
-    old_edit_w.write('\n'.join(find_oldest_edits(graph, n)))
-    old_edit_w.close()
+    def __init__(self, key: Any) -> None:
+        self.key = key
 
-    smallest_text_w = open(analysis_dir + 'shortest_text.txt', 'w', encoding='utf8')
-    smallest_text_w.write('\n'.join(find_smallest_char_counts(graph, n)))
-    smallest_text_w.close()
+    def __lt__(self, other: _Reversed) -> bool:
+        return other.key < self.key
 
-    smallest_text_w = open(analysis_dir + 'shortest_text.txt', 'w', encoding='utf8')
-    smallest_text_w.write('\n'.join(find_smallest_char_counts(graph, n)))
-    smallest_text_w.close()
 
-    least_links_w = open(analysis_dir + 'least_links.txt', 'w', encoding='utf8')
-    least_links_w.write('\n'.join(find_fewest_edges_no_threshold(graph, n)))
-    least_links_w.close()
+class _TopN:
+    """The n items with the smallest (or largest) values among those pushed so far, keeping
+    at most n of them in memory. Ties are broken by item, as in _select.
 
-    lowest_score_w = open(analysis_dir + 'lowest_score.txt', 'w', encoding='utf8')
-    lowest_score_w.write('\n'.join(find_smallest_score(graph, n)))
-    lowest_score_w.close()
+    >>> top = _TopN(2)
+    >>> for value, item in [(3, 'a'), (1, 'b'), (3, 'c'), (2, 'd')]:
+    ...     top.push(value, item)
+    >>> top.result()
+    ['b', 'd']
+    """
+    # Private Instance Attributes:
+    #     - _n: The number of items to keep.
+    #     - _largest: Whether the largest values are kept instead of the smallest.
+    #     - _heap: The kept (value, item) pairs, with the first to be dropped on top. When
+    #              keeping the smallest values, the pairs are wrapped in _Reversed.
+    _n: int
+    _largest: bool
+    _heap: list
+
+    def __init__(self, n: int, largest: bool = False) -> None:
+        self._n = n
+        self._largest = largest
+        self._heap = []
+
+    def push(self, value: Any, item: Any) -> None:
+        """Offer item, with the given value"""
+        if self._n <= 0:
+            return
+
+        entry = (value, item) if self._largest else _Reversed((value, item))
+        if len(self._heap) < self._n:
+            heapq.heappush(self._heap, entry)
+        elif self._heap[0] < entry:
+            heapq.heapreplace(self._heap, entry)
+
+    def result(self) -> list:
+        """Return the kept items, sorted by (value, item)"""
+        pairs = self._heap if self._largest else [entry.key for entry in self._heap]
+        return [item for _, item in sorted(pairs)]
+
+
+def stream_analysis(info_file: str, links_file: str, analysis_dir: str, n: int = 100,
+                    metrics: Sequence[Metric] = None) -> dict[str, float]:
+    """Write the same reports as analysis, reading the info and links files row by row
+    instead of loading the graph. Only n items per metric are kept in memory, so this runs
+    in O(n) memory for any size of dump.
+
+    metrics (by default, every metric of METRICS that does not use scores) may use the
+    attributes 'last_edit' and 'char_count', read from info_file, and 'degree', the number
+    of distinct links in the row of links_file. Unlike the degree in the graph, this only
+    counts links out of the article, including those to articles that are not in the graph.
+
+    Return the time in seconds taken by the pass over each file, under 'info' and 'links'.
+
+    Raise a ValueError if a metric uses another attribute.
+    """
+    if metrics is None:
+        metrics = [metric for metric in METRICS if metric.attribute != 'score']
+
+    columns = {'char_count': 2, 'last_edit': 3}
+    if any(metric.attribute not in columns and metric.attribute != 'degree'
+           for metric in metrics):
+        raise ValueError
+
+    tops = {metric.name: _TopN(n, metric.largest) for metric in metrics}
+    info_metrics = [(tops[m.name], columns[m.attribute], m.threshold) for m in metrics
+                    if m.attribute in columns]
+    links_metrics = [(tops[m.name], m.threshold) for m in metrics if m.attribute == 'degree']
+    timings = {}
+
+    if info_metrics:
+        start = time.perf_counter()
+        with open(info_file, 'r', encoding='utf8') as f:
+            for line in f:
+                row = line.split('\t')
+                for top, column, threshold in info_metrics:
+                    value = int(row[column])
+                    if threshold is None or value <= threshold:
+                        top.push(value, row[0])
+        timings['info'] = time.perf_counter() - start
+
+    if links_metrics:
+        start = time.perf_counter()
+        with open(links_file, 'r', encoding='utf8') as f:
+            for line in f:
+                row = line.rstrip('\n').split('\t')
+                links = set(row[1:])
+                links.discard('')
+                links.discard(row[0])
+                for top, threshold in links_metrics:
+                    if threshold is None or len(links) <= threshold:
+                        top.push(len(links), row[0])
+        timings['links'] = time.perf_counter() - start
+
+    os.makedirs(analysis_dir, exist_ok=True)
+    for name, top in tops.items():
+        with open(os.path.join(analysis_dir, name + '.txt'), 'w', encoding='utf8') as f:
+            f.write('\n'.join(top.result()))
+
+    for name, seconds in timings.items():
+        print(f"{name}: {seconds:.3f}s")
+
+    return timings
 
 
 if __name__ == '__main__':
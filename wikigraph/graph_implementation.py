@@ -5,7 +5,7 @@ import fileinput
 import os
 import datetime
 from tqdm import tqdm
-from typing import Any
+from typing import Any, Iterable
 import math
 
 # Make sure you've installed the necessary Python libraries (see assignment handout
@@ -23,8 +23,8 @@ class _Vertex:
         - item: The data stored in this vertex, representing a Wikipedia article.
         - neighbours: The vertices that are adjacent to this vertex.
         - char_count: The character count of the article
-        - last_edit: Time since the date of last revision and January 1st, 2021, the day
-                     the data was collected
+        - last_edit: Time in seconds between the last revision and January 1st, 2021, the
+                     day the data was collected
 
     Representation Invariants:
         - self not in self.neighbours
@@ -169,6 +169,55 @@ class Graph:
         else:
             raise ValueError
 
+    def get_vertex_column(self, attribute: str) -> tuple[list, list]:
+        """Return a list of all vertex items in this graph, and a list of the given attribute
+        of each of them, in the same order.
+
+        attribute is 'char_count', 'last_edit', 'score' or 'degree'.
+
+        Raise a ValueError if attribute is not one of these."""
+        items, columns = self.get_vertex_columns([attribute])
+        return items, columns[attribute]
+
+    def get_vertex_columns(self, attributes: Iterable[str]) -> tuple[list, dict[str, list]]:
+        """Return a list of all vertex items in this graph, and a dict mapping each of
+        attributes to the list of that attribute of each vertex, in the same order. All the
+        columns are extracted in a single pass over the vertices.
+
+        Raise a ValueError if an attribute is not one of those of get_vertex_column."""
+        attributes = list(attributes)
+        if any(a not in ('char_count', 'last_edit', 'score', 'degree') for a in attributes):
+            raise ValueError
+
+        items = []
+        columns = {attribute: [] for attribute in attributes}
+        appends = [(columns[attribute].append, attribute) for attribute in columns]
+        for v in self._vertices.values():
+            items.append(v.item)
+            for append, attribute in appends:
+                append(len(v.neighbours) if attribute == 'degree' else getattr(v, attribute))
+
+        return items, columns
+
+    def save(self, path: str) -> None:
+        """Write this graph to a snapshot directory at path. See csr_graph.CSRGraph.save.
+
+        Preconditions:
+            - every item of this graph is a string
+        """
+        from wikigraph import csr_graph
+        csr_graph.CSRGraph.from_graph(self).save(path)
+
+    @staticmethod
+    def load(path: str):
+        """Return the graph saved in the snapshot directory at path.
+
+        The snapshot is memory-mapped as a csr_graph.CSRGraph, which has the same query
+        methods as Graph, instead of being rebuilt vertex by vertex.
+        """
+        from wikigraph import csr_graph
+        return csr_graph.CSRGraph.load(path)
+
     def to_pyvis(self, max_vertices: int = 5000) -> Network:
         """Convert this graph into a PyVis Network object.
 
@@ -194,15 +243,20 @@ class Graph:
 
 
 def load_graph(info_file: str, links_file: str) -> Graph:
-    """Return a graph corresponding to the save files."""
+    """Return a graph corresponding to the save files.
+
+    Either file can be a manifest of the shards written by the extraction workers, which are
+    then read in order without being concatenated (see shards)."""
+    from wikigraph import shards
+
     graph = Graph()
 
     # Read file line by line for ram management
-    for line in tqdm(fileinput.input([info_file])):
+    for line in tqdm(fileinput.input(shards.get_files(info_file))):
         row = line.split('\t')
         graph.add_vertex(row[0], int(row[2]), int(row[3]))
 
-    for line in tqdm(fileinput.input([links_file])):
+    for line in tqdm(fileinput.input(shards.get_files(links_file))):
         row = line.split('\t')
         item1 = row[0]
         for item2 in row[1:]:
@@ -219,15 +273,19 @@ if __name__ == '__main__':
 
     os.chdir(__file__[0:-len('wikigraph/graph_implementation.py')])
 
-    g = load_graph('data/processed/graph/wiki-info-collapsed.tsv',
-                   'data/processed/graph/wiki-links-collapsed.tsv')
+    if os.path.exists('data/processed/graph/wiki-graph/graph.bin'):
+        g = Graph.load('data/processed/graph/wiki-graph')
+    else:
+        g = load_graph('data/processed/graph/wiki-info-collapsed.tsv',
+                       'data/processed/graph/wiki-links-collapsed.tsv')
+        g.save('data/processed/graph/wiki-graph')
 
 
     for v in g.get_all_vertex_values():
         _ = v.set_score()
 
     from wikigraph.graph_analysis import analysis
-    analysis(g, 100)
+    analysis(g, 'data/processed/analysis/', 100)
 
 
     # # NOTE: These others are fine
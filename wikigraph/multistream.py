@@ -0,0 +1,113 @@
+"""Read the pages of a bz2 multistream dump without decompressing it to disk
+
+The multistream dump (enwiki-20210101-pages-articles-multistream.xml.bz2) is a concatenation
+of independent bz2 streams of about 100 pages each. Its companion index
+(enwiki-20210101-pages-articles-multistream-index.txt, optionally itself bz2 compressed) has
+one offset:page_id:title line per page, where offset is the byte offset of the stream that
+contains the page. Since each stream can be decompressed on its own, streams can be handed
+to separate processes.
+
+Specifications:
+ - read_stream_offsets('path/to/multistream-index.txt'):
+    This function returns the sorted, distinct stream offsets listed in the index.
+ - get_stream_ranges('path/to/multistream.xml.bz2', offsets):
+    This function returns the (start, end) compressed byte range of every stream.
+ - split_stream_ranges(stream_ranges, num_batches):
+    This function groups consecutive streams into batches of roughly equal compressed size.
+ - iter_stream_pages('path/to/multistream.xml.bz2', stream_ranges):
+    This generator decompresses the given streams one at a time and yields their pages.
+ - iter_stream_chunks('path/to/multistream.xml.bz2', stream_ranges):
+    This generator decompresses the given streams one at a time and yields each of them whole.
+
+Example of use:
+>>> offsets = read_stream_offsets(
+...     'data/raw/enwiki-20210101-pages-articles-multistream-index.txt')
+>>> ranges = get_stream_ranges('data/raw/enwiki-20210101-pages-articles-multistream.xml.bz2',
+...                            offsets)
+>>> for page in iter_stream_pages('data/raw/enwiki-20210101-pages-articles-multistream.xml.bz2',
+...                               ranges[:10]):
+...     print(wikitext.get_title(page))
+"""
+import os
+import bz2
+from typing import Iterator
+
+from wikigraph import dump_reader
+
+
+def read_stream_offsets(index_file: str) -> list[int]:
+    """Return the sorted list of distinct stream offsets in a multistream index file"""
+    open_index = bz2.open if index_file.endswith('.bz2') else open
+    offsets = set()
+
+    with open_index(index_file, 'rt', encoding='utf-8') as f:
+        for line in f:
+            # Titles can contain colons, but the offset never does
+            offsets.add(int(line[:line.index(':')]))
+
+    return sorted(offsets)
+
+
+def get_stream_ranges(dump_file: str, offsets: list[int]) -> list[tuple[int, int]]:
+    """Return the (start, end) compressed byte range of every stream that starts at one of
+    the sorted offsets. The last stream runs to the end of the file.
+
+    The header stream (<siteinfo>) before the first offset is not included since it contains
+    no pages.
+    """
+    ends = offsets[1:] + [os.path.getsize(dump_file)]
+    return list(zip(offsets, ends))
+
+
+def split_stream_ranges(stream_ranges: list[tuple[int, int]],
+                        num_batches: int) -> list[list[tuple[int, int]]]:
+    """Group consecutive stream ranges into at most num_batches batches of roughly equal
+    compressed size, keeping the streams in file order
+
+    >>> split_stream_ranges([(0, 10), (10, 20), (20, 25), (25, 40)], 2)
+    [[(0, 10), (10, 20)], [(20, 25), (25, 40)]]
+    """
+    if not stream_ranges:
+        return []
+
+    total = stream_ranges[-1][1] - stream_ranges[0][0]
+    batches = [[]]
+    for start, end in stream_ranges:
+        # Start a new batch once this one has reached its share of the compressed bytes
+        batch_boundary = stream_ranges[0][0] + total * len(batches) // num_batches
+        if batches[-1] and start >= batch_boundary:
+            batches.append([])
+        batches[-1].append((start, end))
+
+    return batches
+
+
+def iter_stream_pages(dump_file: str, stream_ranges: list[tuple[int, int]]) -> Iterator[str]:
+    """Decompress the given streams of dump_file one at a time and yield each of their pages
+    as a string, from its <page> tag to its </page> tag"""
+    for xml in _iter_streams(dump_file, stream_ranges):
+        for offset, length in dump_reader.iter_page_spans(xml):
+            yield xml[offset:offset + length].decode('utf-8')
+
+
+def iter_stream_chunks(dump_file: str, stream_ranges: list[tuple[int, int]]) -> Iterator[str]:
+    """Decompress the given streams of dump_file one at a time and yield the decompressed xml
+    of each of them as a string. Apart from the first and last streams of the dump, each
+    stream consists only of whole <page> elements."""
+    for xml in _iter_streams(dump_file, stream_ranges):
+        yield xml.decode('utf-8')
+
+
+def _iter_streams(dump_file: str, stream_ranges: list[tuple[int, int]]) -> Iterator[bytes]:
+    """Decompress the given streams of dump_file one at a time and yield their contents"""
+    with open(dump_file, 'rb') as f:
+        for start, end in stream_ranges:
+            f.seek(start)
+            yield bz2.decompress(f.read(end - start))
+
+
+if __name__ == '__main__':
+    os.chdir(__file__[0:-len('wikigraph/multistream.py')])
+
+    import doctest
+    doctest.testmod()
@@ -11,6 +11,20 @@ Specifications:
     This functoin writes a list of integers to a file.
  - read_index('path/to/index.txt'):
     This function reads in an index save file and returns them as a list of integers.
+ - create_byte_index('path/to/enwiki.xml'):
+    This function returns a list of (byte offset, byte length) pairs, one for every <page>
+    element in the database. See dump_reader.DumpReader for reading pages with it.
+ - write_byte_index(list[tuple[int, int]], 'path/to/new-byte-index.txt'):
+    This function writes a list of (offset, length) pairs to a file.
+ - read_byte_index('path/to/byte-index.txt'):
+    This function reads in a byte index save file and returns a list of (offset, length) pairs.
+ - write_index_binary(index, 'path/to/new-index.bin'):
+    This function writes a line index or byte index as fixed-width 64-bit integers.
+ - load_index('path/to/index'):
+    This function loads an index file of either format. Binary files are memory-mapped rather
+    than read, and can be passed to worker processes without pickling their contents.
+ - convert_index('path/to/index.txt', 'path/to/index.bin'):
+    This function converts a text index file into the binary format.
  - round_to_list(number, list[int]):
     This function rounds a number to the nearest number that is lower than it in the list.
  - get_partition_points_num(number_of_partitions, list[int]):
@@ -18,8 +32,25 @@ Specifications:
  - get_partition_points_size(size_of_partition, list[int]):
     This function returns a list of partition points based on the maximum size of partition
     requested
+ - count_lines('path/to/enwiki.xml'):
+    This function returns the number of lines in the file, to use instead of FILE_LINE_COUNT.
+ - get_line_count('path/to/enwiki.xml', list[int]):
+    This function returns the same number given the line index of the file, reading only the
+    lines after its last page.
+ - get_line_ranges('path/to/file.tsv', number_of_ranges):
+    This function splits a file into byte ranges of roughly equal size that start and end on
+    line boundaries, so that each range can be parsed by a separate process.
+ - plan_byte_partitions(byte_index, number_of_partitions):
+    This function returns page ranges that balance the bytes and page count of each partition.
+ - normalize_partition_points(list[int]):
+    This function sorts the partition points and drops the duplicate and negative ones.
+ - get_partition_stats(partition_points, index) / get_byte_partition_stats(plan, byte_index):
+    These functions return the page count and size of every partition.
+ - write_partition_stats(stats, 'path/to/partition-stats.tsv'):
+    This function writes partition statistics to a file and prints the partition skew.
  - partition('path/to/enwiki.xml', partition_points, 'path/to/output')
-    This function outputs partitions based on all the information it reieves
+    This function outputs partitions based on all the information it reieves. If it is
+    interrupted, running it again resumes from the last completed partition.
 
 Example of use:
 In this example, we will create 100 partitions of enwiki-20210101-pages-articles-multistream.xml.
@@ -45,14 +76,40 @@ We will assume that we are currently in the wikigraph directory. Modify paths as
 # This will generate the files enwiki-20210101-pages-articles-multistream-0XXX.xml, where XXX is
 # the partition number, in the directory data/processed/partitioned/
 """
+from __future__ import annotations
+
 import os
+import sys
+import mmap
+import hashlib
+import bisect
 import fileinput
+from array import array
+from collections.abc import Sequence
+from typing import BinaryIO, Union
 from tqdm import tqdm
 
 FILE_LINE_COUNT = 1218205075        # enwiki-20210101[...].xml
 # FILE_LINE_COUNT = 98727           # hundredk.xml
 # FILE_LINE_COUNT = 1000001         # muillion.xml
 
+# Binary index files start with an 8 byte header: this magic string, followed by the format
+# version and the number of integers per entry (1 for a line index, 2 for a byte index).
+# The header is followed by the entries as little-endian signed 64-bit integers.
+INDEX_MAGIC = b'WGIDX\x00'
+INDEX_VERSION = 1
+INDEX_HEADER_SIZE = 8
+
+# Size of the chunks read by count_lines
+COUNT_CHUNK_SIZE = 1 << 24
+
+# Size of the write buffer of each partition file
+WRITE_BUFFER_SIZE = 1 << 24
+
+# The fixed cost of extracting one page, measured in the time it takes to extract this many
+# bytes of page text. Used to balance partitions on both bytes and page count.
+PAGE_COST_BYTES = 2048
+
 
 def create_index(filename: str) -> list[int]:
     """Find the line number of every <page> in the file, and return it in a list"""
@@ -96,13 +153,204 @@ def read_index(index_file: str) -> list[int]:
     return line_numbers
 
 
+def create_byte_index(filename: str) -> list[tuple[int, int]]:
+    """Find the byte offset and byte length of every <page> element in the file, and return
+    them as a list of (offset, length) pairs.
+
+    The span of a page starts at its opening <page> tag and ends right after its closing
+    </page> tag, so file[offset:offset + length] is exactly one <page> element.
+    """
+    spans = []
+    offset = 0
+    page_start = -1
+
+    print("Generating Byte Index File...")
+    with tqdm(total=os.path.getsize(filename), unit='B', unit_scale=True) as progressbar:
+        # Read the file in binary so that offsets are byte offsets, not character offsets
+        with open(filename, 'rb') as f:
+            for line in f:
+                if page_start == -1:
+                    tag_index = line.find(b'<page')
+                    if tag_index != -1:
+                        page_start = offset + tag_index
+
+                if page_start != -1:
+                    tag_index = line.find(b'</page>')
+                    if tag_index != -1:
+                        page_end = offset + tag_index + len(b'</page>')
+                        spans.append((page_start, page_end - page_start))
+                        page_start = -1
+
+                offset += len(line)
+                progressbar.update(len(line))
+
+    return spans
+
+
+def write_byte_index(index: list[tuple[int, int]], filename: str) -> None:
+    """Write a list of (offset, length) pairs to a file, one tab separated pair per line"""
+    f = open(filename, 'w')
+    print("Writing Byte Index File...")
+    f.write('\n'.join([str(offset) + '\t' + str(length) for offset, length in tqdm(index)]))
+    f.close()
+
+
+def read_byte_index(index_file: str) -> list[tuple[int, int]]:
+    """Read a byte index file, one tab separated (offset, length) pair per line, into a list
+    of pairs of integers"""
+    f = open(index_file, 'r')
+    line_strings = f.readlines()
+    f.close()
+    spans = []
+
+    print("Reading Byte Index File...")
+    for s in tqdm(line_strings):
+        offset, length = s.split('\t')
+        spans.append((int(offset), int(length)))
+
+    return spans
+
+
+class BinaryIndex(Sequence):
+    """A read-only, memory-mapped view of (part of) a binary index file.
+
+    Indexing returns an int for a line index and an (offset, length) tuple for a byte index,
+    so a BinaryIndex can be used wherever the lists returned by read_index and
+    read_byte_index are. Slicing returns another view of the same memory map.
+
+    Pickling a BinaryIndex (for instance when submitting it to a ProcessPoolExecutor) only
+    sends its filename and bounds. The receiving process maps the file again, so every
+    worker shares the operating system's page cache instead of receiving a copy of it.
+
+    Instance Attributes:
+        - filename: The path of the binary index file.
+        - columns: The number of integers per entry.
+    """
+    filename: str
+    columns: int
+
+    # Private Instance Attributes:
+    #     - _start: The first entry of the file in this view.
+    #     - _stop: One past the last entry of the file in this view.
+    #     - _map: The memory map of the whole file.
+    #     - _values: The integers of the entries in this view.
+    _start: int
+    _stop: int
+    _map: mmap.mmap
+    _values: Union[memoryview, array]
+
+    def __init__(self, filename: str, start: int = 0, stop: int = None) -> None:
+        """Memory-map the binary index file at filename and view entries start to stop - 1.
+
+        Raise a ValueError if filename is not a binary index file."""
+        with open(filename, 'rb') as f:
+            header = f.read(INDEX_HEADER_SIZE)
+            if header[:len(INDEX_MAGIC)] != INDEX_MAGIC or header[6] != INDEX_VERSION:
+                raise ValueError(f'{filename} is not a binary index file')
+
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self.filename = filename
+        self.columns = header[7]
+
+        values = memoryview(self._map)[INDEX_HEADER_SIZE:].cast('q')
+        if sys.byteorder != 'little':
+            # Fall back to an in-memory copy on big-endian machines
+            values = array('q', values)
+            values.byteswap()
+
+        num_entries = len(values) // self.columns
+        self._start, self._stop, _ = slice(start, stop).indices(num_entries)
+        self._values = values[self._start * self.columns:self._stop * self.columns]
+
+    def __len__(self) -> int:
+        return self._stop - self._start
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, step = i.indices(len(self))
+            if step != 1:
+                return [self[j] for j in range(start, stop, step)]
+            return BinaryIndex(self.filename, self._start + start, self._start + max(stop, start))
+
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('index entry out of range')
+
+        if self.columns == 1:
+            return self._values[i]
+        return tuple(self._values[i * self.columns:(i + 1) * self.columns])
+
+    def __iter__(self):
+        if self.columns == 1:
+            return iter(self._values)
+        return (self[i] for i in range(len(self)))
+
+    def __reduce__(self):
+        return (BinaryIndex, (self.filename, self._start, self._stop))
+
+
+def write_index_binary(index: Sequence[Union[int, tuple[int, ...]]], filename: str) -> None:
+    """Write a line index (list of integers) or a byte index (list of (offset, length) pairs)
+    to a binary index file"""
+    columns = len(index[0]) if index and isinstance(index[0], tuple) else 1
+
+    values = array('q')
+    print("Writing Binary Index File...")
+    for entry in tqdm(index):
+        if columns == 1:
+            values.append(entry)
+        else:
+            values.extend(entry)
+
+    if sys.byteorder != 'little':
+        values.byteswap()
+
+    with open(filename, 'wb') as f:
+        f.write(INDEX_MAGIC + bytes([INDEX_VERSION, columns]))
+        values.tofile(f)
 
-def round_to_list(number: int, index: list[int]) -> int:
+
+def is_binary_index(filename: str) -> bool:
+    """Return whether filename is a binary index file (as opposed to a text index file)"""
+    with open(filename, 'rb') as f:
+        return f.read(len(INDEX_MAGIC)) == INDEX_MAGIC
+
+
+def load_index(filename: str) -> Sequence:
+    """Load a line index or byte index file in either the text or binary format.
+
+    Binary files are memory-mapped and returned as a BinaryIndex. Text files are read in full.
+    """
+    if is_binary_index(filename):
+        return BinaryIndex(filename)
+
+    with open(filename, 'r') as f:
+        is_byte_index = '\t' in f.readline()
+
+    return read_byte_index(filename) if is_byte_index else read_index(filename)
+
+
+def convert_index(text_file: str, binary_file: str) -> None:
+    """Convert an index file written by write_index or write_byte_index into a binary index
+    file
+
+    Example call:
+    >>> convert_index('../data/processed/wiki-index.txt', '../data/processed/wiki-index.bin')
+    """
+    write_index_binary(load_index(text_file), binary_file)
+
+
+def round_to_list(number: int, index: Sequence[int]) -> int:
     """Round down =number= to the nearest element less than =number= in =index=
 
     -1 signifies that the element is larger than all other elements in the list
     and thus the partition should should go to the end of the file
 
+    Preconditions:
+        - index is sorted in non-decreasing order
+
     >>> round_to_list(30, [1, 20, 23, 25, 40])
     25
     >>> round_to_list(20, [1, 20, 23, 25, 40])
@@ -110,18 +358,106 @@ def round_to_list(number: int, index: list[int]) -> int:
     >>> round_to_list(41, [1, 20, 23, 25, 40])
     -1
     """
-    for i, _ in enumerate(index):
-        if index[i] > number:
-            return index[i - 1]
+    # Binary search for the first element larger than number
+    i = bisect.bisect_right(index, number)
+    if i == len(index):
+        return -1
+
+    return index[i - 1]
+
+
+def count_lines(filename: str) -> int:
+    """Return the number of lines in the file, reading it in large binary chunks
+
+    This replaces the need to hard-code FILE_LINE_COUNT for every dataset.
+    """
+    count = 0
+    last_chunk = b''
+
+    with open(filename, 'rb') as f:
+        chunk = f.read(COUNT_CHUNK_SIZE)
+        while chunk:
+            count += chunk.count(b'\n')
+            last_chunk = chunk
+            chunk = f.read(COUNT_CHUNK_SIZE)
 
-    return -1
+    # A final line without a trailing newline is still a line
+    if last_chunk and not last_chunk.endswith(b'\n'):
+        count += 1
 
+    return count
 
-def get_partition_points_num(num_partitions: int, index: list[int]) -> list[int]:
+
+def get_line_count(filename: str, index: Sequence[int]) -> int:
+    """Return the number of lines in the file given its line index (see create_index)
+
+    Unlike count_lines, the whole file is not read: the file is read backwards from its end
+    until the line of its last <page> is found, and the lines from there are added to the
+    line number of that page.
+    """
+    if not index:
+        return count_lines(filename)
+
+    tail = b''
+    with open(filename, 'rb') as f:
+        end = os.path.getsize(filename)
+        while end > 0:
+            start = max(0, end - COUNT_CHUNK_SIZE)
+            f.seek(start)
+            tail = f.read(end - start) + tail
+            end = start
+
+            # The last <page> line is only found once the newline before it is too
+            page = tail.rfind(b'<page')
+            if page != -1 and (end == 0 or tail.rfind(b'\n', 0, page) != -1):
+                break
+
+    last_page = tail[tail.rfind(b'\n', 0, page) + 1:]
+    # A final line without a trailing newline is still a line
+    return index[-1] - 1 + last_page.count(b'\n') + (not last_page.endswith(b'\n'))
+
+
+def get_line_ranges(filename: str, num_ranges: int) -> list[tuple[int, int]]:
+    """Return a list of at most num_ranges (start, end) byte ranges that cover the file. Each
+    range starts at the beginning of a line and ends just after a newline (or at the end of
+    the file), so every line lies in exactly one range.
+
+    The ranges are found by jumping to evenly spaced offsets and reading forward to the next
+    newline, so only a few lines of the file are read.
+
+    Preconditions:
+        - num_ranges > 0
+    """
+    size = os.path.getsize(filename)
+    if size == 0:
+        return []
+    starts = [0]
+
+    with open(filename, 'rb') as f:
+        for i in range(1, num_ranges):
+            offset = size * i // num_ranges
+            if offset == 0:
+                continue
+
+            # Start at the first line that begins at or after the evenly spaced offset
+            f.seek(offset - 1)
+            f.readline()
+            start = f.tell()
+            if starts[-1] < start < size:
+                starts.append(start)
+
+    return [(starts[i], starts[i + 1] if i + 1 < len(starts) else size)
+            for i in range(len(starts))]
+
+
+def get_partition_points_num(num_partitions: int, index: Sequence[int],
+                             line_count: int = FILE_LINE_COUNT) -> list[int]:
     """Return the line numbers where the dataset will be partitioned at.
-    The length of this list will be =num_partitions="""
+    The length of this list will be =num_partitions=
+
+    line_count is the number of lines in the dataset (see get_line_count)."""
     # Get the approximate size of each partition
-    approx_partition_size = FILE_LINE_COUNT // num_partitions
+    approx_partition_size = line_count // num_partitions
     selected_partition_points = []
 
     print("Generating partition points...")
@@ -138,17 +474,20 @@ def get_partition_points_num(num_partitions: int, index: list[int]) -> list[int]
 
     # Add the last partition point
     selected_partition_points[len(
-        selected_partition_points) - 1] = FILE_LINE_COUNT + 1
+        selected_partition_points) - 1] = line_count + 1
 
     return selected_partition_points
 
 
-def get_partition_points_size(lines_per_partition: int, index: list[int]):
+def get_partition_points_size(lines_per_partition: int, index: Sequence[int],
+                              line_count: int = FILE_LINE_COUNT) -> list[int]:
     """Return the line numbers where the dataset will be partitioned at.
     The partitions will be selected such that all partitions will be less than
-    or equal to =lines_per_partition= lines long"""
+    or equal to =lines_per_partition= lines long
+
+    line_count is the number of lines in the dataset (see get_line_count)."""
     # Get the approximate number of partitions being created
-    approx_num_partitions = FILE_LINE_COUNT // lines_per_partition
+    approx_num_partitions = line_count // lines_per_partition
     selected_partition_points = []
 
     print("Generating partition points...")
@@ -162,7 +501,7 @@ def get_partition_points_size(lines_per_partition: int, index: list[int]):
                 round_to_list(lines_per_partition + selected_partition_points[-1], index))
 
     # Add the last partition point
-    selected_partition_points.append(FILE_LINE_COUNT + 1)
+    selected_partition_points.append(line_count + 1)
 
     # if (lst[-1] - lst[-2]) > lines_per_partition then we select a mid point and insert it at -1
     if selected_partition_points[-1] - selected_partition_points[-2] > lines_per_partition:
@@ -174,32 +513,214 @@ def get_partition_points_size(lines_per_partition: int, index: list[int]):
     return selected_partition_points
 
 
-def partition(filename: str, partition_points: list[int], output: str) -> None:
+def normalize_partition_points(partition_points: Sequence[int]) -> list[int]:
+    """Return the distinct =partition_points= that can split the dataset, in increasing order
+
+    get_partition_points_num and get_partition_points_size return the same point more than
+    once when partitions are smaller than pages, and -1 for points past the last page. As
+    with the line numbers, a point of 1 or less cannot split anything and is dropped.
+
+    >>> normalize_partition_points([54, 54, 9, 9, 35, -1, -1, 73])
+    [9, 35, 54, 73]
+    """
+    return sorted({point for point in partition_points if point > 1})
+
+
+def get_partition_stats(partition_points: Sequence[int],
+                        index: Sequence[int]) -> list[tuple[int, int, int, int, int]]:
+    """Return (partition, first_page, pages, start, size) for every partition described by
+    the line based =partition_points=, where start and size are measured in lines
+
+    >>> get_partition_stats([21, 41], [1, 10, 20, 23, 25, 40])
+    [(1, 0, 3, 1, 20), (2, 3, 3, 21, 20)]
+    """
+    stats = []
+    start = 1
+    for n, end in enumerate(partition_points, start=1):
+        first_page = bisect.bisect_left(index, start)
+        pages = bisect.bisect_left(index, end) - first_page
+        stats.append((n, first_page, pages, start, end - start))
+        start = end
+
+    return stats
+
+
+def plan_byte_partitions(byte_index: Sequence[tuple[int, int]], num_partitions: int,
+                         page_cost: int = PAGE_COST_BYTES) -> list[tuple[int, int]]:
+    """Return at most =num_partitions= (first_page, end_page) ranges of pages of =byte_index=
+    such that each range holds about the same amount of work
+
+    The work of a page is its length in bytes plus =page_cost=, the fixed per-page cost of
+    extraction expressed in bytes, so that partitions are balanced on both bytes and page
+    count. Partition boundaries are found by binary search over the cumulative work.
+
+    >>> plan_byte_partitions([(0, 10), (10, 10), (20, 10), (30, 10)], 2, page_cost=0)
+    [(0, 2), (2, 4)]
+    >>> plan_byte_partitions([(0, 70), (70, 10), (80, 10), (90, 10)], 2, page_cost=0)
+    [(0, 1), (1, 4)]
+    """
+    # cumulative_work[i] is the work of pages 0 to i inclusive
+    cumulative_work = array('q')
+    total = 0
+    for _, length in byte_index:
+        total += length + page_cost
+        cumulative_work.append(total)
+
+    plan = []
+    first_page = 0
+    for k in range(1, num_partitions + 1):
+        # The partition ends after the page that reaches its share of the total work
+        end_page = bisect.bisect_left(cumulative_work, total * k // num_partitions) + 1
+        end_page = min(end_page, len(byte_index))
+        if end_page > first_page:
+            plan.append((first_page, end_page))
+            first_page = end_page
+
+    return plan
+
+
+def get_byte_partition_stats(plan: Sequence[tuple[int, int]],
+                             byte_index: Sequence[tuple[int, int]]
+                             ) -> list[tuple[int, int, int, int, int]]:
+    """Return (partition, first_page, pages, start, size) for every partition of a plan from
+    plan_byte_partitions, where start and size are measured in bytes
+
+    >>> get_byte_partition_stats([(0, 1), (1, 4)], [(0, 70), (70, 10), (80, 10), (90, 10)])
+    [(1, 0, 1, 0, 70), (2, 1, 3, 70, 30)]
+    """
+    stats = []
+    for n, (first_page, end_page) in enumerate(plan, start=1):
+        start = byte_index[first_page][0]
+        last_offset, last_length = byte_index[end_page - 1]
+        stats.append((n, first_page, end_page - first_page, start,
+                      last_offset + last_length - start))
+
+    return stats
+
+
+def write_partition_stats(stats: list[tuple[int, int, int, int, int]], filename: str) -> None:
+    """Write partition statistics from get_partition_stats or get_byte_partition_stats to a
+    tsv file, and print how skewed the largest partition is compared to the mean"""
+    f = open(filename, 'w')
+    f.write('partition\tfirst_page\tpages\tstart\tsize\n')
+    f.write(''.join('\t'.join(str(i) for i in row) + '\n' for row in stats))
+    f.close()
+
+    if stats:
+        mean_pages = sum(row[2] for row in stats) / len(stats)
+        mean_size = sum(row[4] for row in stats) / len(stats)
+        print(f"Partition skew (max / mean): "
+              f"{max(row[2] for row in stats) / max(mean_pages, 1):.2f}x pages, "
+              f"{max(row[4] for row in stats) / max(mean_size, 1):.2f}x size")
+
+
+def partition(filename: str, partition_points: Sequence[int], output: str,
+              resume: bool = True) -> None:
     """Partition the dataset based on the values in =partition_points= and write the output as:
 
     output-000X.xml         , where X is the partition number
 
+    Lines are streamed straight to a buffered output file, so memory use does not depend on
+    the size of the partitions. Each partition is written to output-000X.xml.tmp and renamed
+    once complete, after which a checkpoint is saved. If =resume= is True and a checkpoint
+    from an interrupted run exists, partitioning continues after the last completed partition
+    instead of starting over. A checkpoint written for a different dataset (by path, size or
+    modification time) or different partition points is ignored (see get_checkpoint_key).
+
+    The lines are split at every distinct point of partition_points (see
+    normalize_partition_points), so there is one partition more than there are such points
+    inside the dataset.
+
     Preconditions:
         - output does not end in .xml
     """
+    points = normalize_partition_points(partition_points)
+    if points != list(partition_points):
+        print(f"Partition points are duplicated, out of order or negative, so the dataset is "
+              f"split at the {len(points)} distinct points {points} instead")
+
+    checkpoint_file = output + '-checkpoint.txt'
     count = 1
-    current_partition = []
     n = 1
+    byte_offset = 0
 
-    print("Partitioning Dataset...")
-    with tqdm(total=FILE_LINE_COUNT) as progressbar:
-        for line in fileinput.input(filename, openhook=fileinput.hook_encoded("utf-8")):
-            if count in partition_points:
-                outfile = open(output + "-%04d" % n + '.xml', 'w')
-                outfile.write(''.join(current_partition))
-                outfile.close()
+    key = get_checkpoint_key(filename, points)
+
+    if resume and os.path.exists(checkpoint_file):
+        checkpoint = read_partition_checkpoint(checkpoint_file)
+        if checkpoint[3] == key:
+            n, count, byte_offset = checkpoint[:3]
+            print(f"Resuming from partition {n} (line {count})...")
+        else:
+            print(f"Ignoring {checkpoint_file}: it was written for a different dataset or "
+                  f"different partition points")
 
+    # Skip over the partition points that have already been passed
+    next_point = bisect.bisect_right(points, count)
+
+    print("Partitioning Dataset...")
+    with open(filename, 'rb') as infile, \
+            tqdm(total=os.path.getsize(filename), initial=byte_offset,
+                 unit='B', unit_scale=True) as progressbar:
+        infile.seek(byte_offset)
+        outfile = open(output + "-%04d" % n + '.xml.tmp', 'wb', buffering=WRITE_BUFFER_SIZE)
+
+        for line in infile:
+            if next_point < len(points) and count == points[next_point]:
+                _finish_partition(outfile, output, n)
                 n += 1
-                current_partition = []
+                next_point += 1
+                write_partition_checkpoint(checkpoint_file, n, count, byte_offset, key)
+
+                outfile = open(output + "-%04d" % n + '.xml.tmp', 'wb',
+                               buffering=WRITE_BUFFER_SIZE)
 
-            current_partition.append(line)
+            outfile.write(line)
             count += 1
-            progressbar.update(1)
+            byte_offset += len(line)
+            progressbar.update(len(line))
+
+        # The lines after the last partition point make up the last partition
+        _finish_partition(outfile, output, n)
+
+    # The run is complete, so there is nothing left to resume
+    if os.path.exists(checkpoint_file):
+        os.remove(checkpoint_file)
+
+
+def _finish_partition(outfile: BinaryIO, output: str, n: int) -> None:
+    """Close the temporary file of partition n and move it to its final name"""
+    outfile.close()
+    os.replace(output + "-%04d" % n + '.xml.tmp', output + "-%04d" % n + '.xml')
+
+
+def get_checkpoint_key(filename: str, partition_points: Sequence[int]) -> str:
+    """Return what a checkpoint of partitioning the dataset at filename with
+    =partition_points= must match to be resumed: the absolute path, size and modification
+    time of the dataset and a hash of the partition points, separated by tabs"""
+    stat = os.stat(filename)
+    points_hash = hashlib.sha256(','.join(str(point) for point in partition_points)
+                                 .encode('utf-8')).hexdigest()[:16]
+    return f'{os.path.abspath(filename)}\t{stat.st_size}\t{stat.st_mtime_ns}\t{points_hash}'
+
+
+def write_partition_checkpoint(checkpoint_file: str, n: int, line: int,
+                               byte_offset: int, key: str) -> None:
+    """Atomically record that partitioning can resume at partition n, which starts on line
+    =line= of the dataset at =byte_offset= bytes, for the dataset and partition points
+    described by =key= (see get_checkpoint_key)"""
+    with open(checkpoint_file + '.tmp', 'w') as f:
+        f.write(f'{n}\t{line}\t{byte_offset}\t{key}\n')
+    os.replace(checkpoint_file + '.tmp', checkpoint_file)
+
+
+def read_partition_checkpoint(checkpoint_file: str) -> tuple[int, int, int, str]:
+    """Return the (partition number, line, byte offset, key) saved by
+    write_partition_checkpoint. The key of a checkpoint written without one is ''."""
+    with open(checkpoint_file, 'r') as f:
+        fields = f.read().rstrip('\n').split('\t', 3)
+
+    return int(fields[0]), int(fields[1]), int(fields[2]), fields[3] if len(fields) > 3 else ''
 
 
 def partition_on_num(data_file: str, index_file: str, num: int, out_partition_file: str,
@@ -213,9 +734,13 @@ def partition_on_num(data_file: str, index_file: str, num: int, out_partition_fi
     ...                  '../data/processed/partitioned/partition-index.txt',
     ...                  '../data/processed/partitioned/hundredk', )
     """
-    index = read_index(index_file)
-    p_points = get_partition_points_num(num, index)
+    index = load_index(index_file)
+    p_points = get_partition_points_num(num, index, get_line_count(data_file, index))
+    # The partition index must describe the partition files, so it is normalized too
+    p_points = normalize_partition_points(p_points)
     write_index(p_points, out_partition_file)
+    write_partition_stats(get_partition_stats(p_points, index),
+                          out_partition_file[:-4] + '-stats.tsv')
     partition(data_file, p_points, output)
 
 
@@ -229,9 +754,13 @@ def partition_on_size(data_file: str, index_file: str, size: int, out_partition_
     ...                   '../data/processed/partitioned/partition-index.txt',
     ...                   '../data/processed/partitioned/hundredk', )
     """
-    index = read_index(index_file)
-    p_points = get_partition_points_size(size, index)
+    index = load_index(index_file)
+    p_points = get_partition_points_size(size, index, get_line_count(data_file, index))
+    # The partition index must describe the partition files, so it is normalized too
+    p_points = normalize_partition_points(p_points)
     write_index(p_points, out_partition_file)
+    write_partition_stats(get_partition_stats(p_points, index),
+                          out_partition_file[:-4] + '-stats.tsv')
     partition(data_file, p_points, output)
 
 
@@ -0,0 +1,321 @@
+"""Run the stages of the processing pipeline as a graph, skipping the stages whose results
+are already up to date
+
+Specifications:
+ - Stage('name', function, args, inputs, outputs):
+    Declares one step of the pipeline: function(*args) reads the files (or directories)
+    in inputs and writes the ones in outputs.
+ - get_stage_keys(stages):
+    Returns a hash of every stage's code, arguments and inputs. The code of a stage is the
+    source of the module of its function and of every module of the same package that it
+    imports. An input made by another stage is represented by that stage's key, and any
+    other input by its size and modification time, so every key is known before anything
+    runs.
+ - run_stages(stages, 'path/to/pipeline-cache.tsv'):
+    Runs every stage whose key has changed since its last successful run, or whose outputs
+    are missing. A stage starts as soon as the stages that make its inputs are done, so
+    independent stages run concurrently.
+ - get_process_context():
+    Returns the multiprocessing context that the process pools of the stages must use.
+
+Example of use:
+>>> stages = [Stage('index', make_index, ('dump.xml', 'index.txt'), ('dump.xml',),
+...                 ('index.txt',)),
+...           Stage('count', count_pages, ('index.txt', 'count.txt'), ('index.txt',),
+...                 ('count.txt',))]
+>>> run_stages(stages, 'pipeline-cache.tsv')
+['index', 'count']
+>>> run_stages(stages, 'pipeline-cache.tsv')
+[]
+"""
+from __future__ import annotations
+
+import os
+import sys
+import types
+import hashlib
+import inspect
+import multiprocessing
+import concurrent.futures
+from typing import Callable, Iterable, NamedTuple, Sequence
+
+from wikigraph import telemetry
+
+# How the process pools of the stages start their workers. Stages run in threads, and a
+# forked worker gets a copy of every lock held by another thread at that moment (tqdm's,
+# logging's, the import lock...), which nothing will ever release. Spawned workers start
+# from a fresh interpreter, and inherit the environment (see telemetry) when they start.
+START_METHOD = 'spawn'
+
+
+class Stage(NamedTuple):
+    """One step of the pipeline.
+
+    Instance Attributes:
+        - name: The unique name of the stage
+        - function: The function that runs the stage, as function(*args)
+        - args: The arguments of function. Their repr is part of the stage key, so they
+                should be plain values such as strings and numbers.
+        - inputs: The paths of the files and directories that the stage reads
+        - outputs: The paths of the files and directories that the stage writes
+
+    Representation Invariants:
+        - self.outputs != ()
+    """
+    name: str
+    function: Callable
+    args: tuple
+    inputs: tuple[str, ...]
+    outputs: tuple[str, ...]
+
+
+def get_producers(stages: Sequence[Stage]) -> dict[str, Stage]:
+    """Return the stage that writes each output of stages.
+
+    Raise a ValueError if two stages have the same name or write the same output, or if the
+    stages depend on each other in a cycle."""
+    names = set()
+    producers = {}
+    for stage in stages:
+        if stage.name in names:
+            raise ValueError(f'there are two stages named {stage.name}')
+        names.add(stage.name)
+
+        for output in stage.outputs:
+            if output in producers:
+                raise ValueError(f'{output} is written by both {producers[output].name} and '
+                                 f'{stage.name}')
+            producers[output] = stage
+
+    # Every stage must come after the stages it depends on in some order
+    ordered = set()
+    remaining = list(stages)
+    while remaining:
+        ready = [stage for stage in remaining
+                 if all(producers[i].name in ordered for i in stage.inputs if i in producers)]
+        if not ready:
+            raise ValueError('the stages ' + ', '.join(stage.name for stage in remaining) +
+                             ' depend on each other in a cycle')
+        ordered.update(stage.name for stage in ready)
+        remaining = [stage for stage in remaining if stage.name not in ordered]
+
+    return producers
+
+
+def get_stage_keys(stages: Sequence[Stage]) -> dict[str, str]:
+    """Return the key of every stage: a hash of the source of its function and its code
+    version (see get_code_version), the repr of its arguments, and the state of its inputs.
+
+    An input written by another stage is represented by the key of that stage. Any other
+    input is represented by its size and modification time (see get_fingerprint), so no
+    input is read.
+
+    Raise a ValueError if an input is neither written by a stage nor exists."""
+    producers = get_producers(stages)
+    keys = {}
+    sources = {}
+
+    def key(stage: Stage) -> str:
+        if stage.name not in keys:
+            h = hashlib.sha256()
+            h.update(stage.name.encode('utf-8'))
+            h.update(_get_source(stage.function).encode('utf-8'))
+            h.update(get_code_version(stage.function, sources).encode('utf-8'))
+            h.update(repr(stage.args).encode('utf-8'))
+            for path in stage.inputs:
+                if path in producers:
+                    h.update(f'{path}\t{key(producers[path])}\n'.encode('utf-8'))
+                elif os.path.exists(path):
+                    h.update(f'{path}\t{get_fingerprint(path)}\n'.encode('utf-8'))
+                else:
+                    raise ValueError(f'{path} is an input of {stage.name}, but it does not '
+                                     f'exist and no stage writes it')
+            keys[stage.name] = h.hexdigest()
+        return keys[stage.name]
+
+    for stage in stages:
+        key(stage)
+
+    return keys
+
+
+def get_fingerprint(path: str) -> str:
+    """Return the size and modification time of the file at path, or of every file under
+    the directory at path, as a string"""
+    if not os.path.isdir(path):
+        stat = os.stat(path)
+        return f'{stat.st_size}:{stat.st_mtime_ns}'
+
+    h = hashlib.sha256()
+    for directory, directories, files in os.walk(path):
+        directories.sort()
+        for file in sorted(files):
+            stat = os.stat(os.path.join(directory, file))
+            h.update(f'{os.path.relpath(os.path.join(directory, file), path)}\t'
+                     f'{stat.st_size}:{stat.st_mtime_ns}\n'.encode('utf-8'))
+    return h.hexdigest()
+
+
+def get_code_version(function: Callable, sources: dict[str, str] = None) -> str:
+    """Return a hash of the source files of the module that defines function and of every
+    module of the same top level package that it imports, directly or through other modules
+    of the package. Editing the code a stage calls (e.g. wikitext.parse_page for a stage
+    that runs process_wikitext) thus changes its key.
+
+    sources caches the hash of every source file read, and may be shared between calls."""
+    if sources is None:
+        sources = {}
+
+    module = sys.modules.get(getattr(function, '__module__', None))
+    if module is None:
+        return ''
+    package = module.__name__.split('.')[0]
+
+    hashes = {}
+    seen = {module.__name__}
+    remaining = [module]
+    while remaining:
+        module = remaining.pop()
+        filename = getattr(module, '__file__', None)
+        if filename is not None and os.path.exists(filename):
+            if filename not in sources:
+                with open(filename, 'rb') as f:
+                    sources[filename] = hashlib.sha256(f.read()).hexdigest()
+            hashes[module.__name__] = sources[filename]
+
+        # A module is imported either as a module, or through a function or class it defines
+        for value in vars(module).values():
+            name = value.__name__ if isinstance(value, types.ModuleType) \
+                else getattr(value, '__module__', None)
+            if isinstance(name, str) and name not in seen and name in sys.modules and \
+                    (name == package or name.startswith(package + '.')):
+                seen.add(name)
+                remaining.append(sys.modules[name])
+
+    h = hashlib.sha256()
+    for name, source in sorted(hashes.items()):
+        h.update(f'{name}\t{source}\n'.encode('utf-8'))
+    return h.hexdigest()
+
+
+def _get_source(function: Callable) -> str:
+    """Return the source code of function, or its qualified name if the source cannot be
+    found (e.g. for builtins)"""
+    try:
+        return inspect.getsource(function)
+    except (OSError, TypeError):
+        return f'{function.__module__}.{function.__qualname__}'
+
+
+def read_cache(cache_file: str) -> dict[str, str]:
+    """Return the key of the last successful run of every stage recorded in cache_file"""
+    if not os.path.exists(cache_file):
+        return {}
+
+    with open(cache_file, 'r') as f:
+        return dict(line[:-1].split('\t') for line in f)
+
+
+def write_cache(cache: dict[str, str], cache_file: str) -> None:
+    """Atomically write the key of the last successful run of every stage to cache_file"""
+    with open(cache_file + '.tmp', 'w') as f:
+        f.write(''.join(f'{name}\t{key}\n' for name, key in sorted(cache.items())))
+    os.replace(cache_file + '.tmp', cache_file)
+
+
+def get_process_context() -> multiprocessing.context.BaseContext:
+    """Return the multiprocessing context to give the process pools that a stage may start
+    while other stages are running in other threads (see START_METHOD)"""
+    return multiprocessing.get_context(START_METHOD)
+
+
+def _run_stage(stage: Stage) -> None:
+    """Run stage, recording it in the telemetry (see telemetry.measure)"""
+    with telemetry.measure(stage.name):
+        stage.function(*stage.args)
+
+
+def run_stages(stages: Sequence[Stage], cache_file: str, max_workers: int = 4,
+               force: Iterable[str] = ()) -> list[str]:
+    """Run every stage that is not up to date, in dependency order, with up to max_workers
+    stages running at the same time, and return the names of the stages that ran in the
+    order they finished.
+
+    A stage is up to date if its key (see get_stage_keys) matches the one recorded in
+    cache_file after its last successful run and all of its outputs exist. The stages named
+    in force are run regardless.
+
+    Every stage that runs is recorded in the telemetry, if it is enabled (see telemetry).
+    Stages that start process pools must create them with get_process_context().
+
+    If a stage raises an exception, the stages that depend on it are not run, but every
+    other stage is. Raise a RuntimeError naming the stages that failed at the end.
+    """
+    producers = get_producers(stages)
+    keys = get_stage_keys(stages)
+    cache = read_cache(cache_file)
+    force = set(force)
+
+    dependencies = {stage.name: {producers[path].name for path in stage.inputs
+                                 if path in producers}
+                    for stage in stages}
+    pending = {stage.name: stage for stage in stages}
+    done = set()
+    ran = []
+    failures = {}
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        running = {}
+        while pending or running:
+            # Start or skip every stage whose dependencies are done. Skipping a stage can
+            # make others ready, so keep going until none are.
+            ready = [stage for stage in pending.values() if dependencies[stage.name] <= done]
+            while ready:
+                for stage in ready:
+                    del pending[stage.name]
+                    if stage.name not in force and cache.get(stage.name) == keys[stage.name] \
+                            and all(os.path.exists(output) for output in stage.outputs):
+                        print(f"Skipping {stage.name} (up to date)")
+                        done.add(stage.name)
+                    else:
+                        print(f"Running {stage.name}...")
+                        running[executor.submit(_run_stage, stage)] = stage
+
+                ready = [stage for stage in pending.values()
+                         if dependencies[stage.name] <= done]
+
+            if not running:
+                # Whatever is still pending depends on a failed stage
+                break
+
+            finished, _ = concurrent.futures.wait(
+                running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in finished:
+                stage = running.pop(future)
+                try:
+                    future.result()
+                except Exception as error:
+                    failures[stage.name] = error
+                    print(f"Stage {stage.name} failed: {error!r}")
+                    continue
+
+                done.add(stage.name)
+                ran.append(stage.name)
+                cache[stage.name] = keys[stage.name]
+                write_cache(cache, cache_file)
+
+    if failures:
+        failed = sorted(failures)
+        skipped = sorted(pending)
+        raise RuntimeError(f"Stages {', '.join(failed)} failed" +
+                           (f", so {', '.join(skipped)} did not run" if skipped else '')) \
+            from failures[failed[0]]
+
+    return ran
+
+
+if __name__ == '__main__':
+    os.chdir(__file__[0:-len('wikigraph/pipeline.py')])
+
+    import doctest
+    doctest.testmod()
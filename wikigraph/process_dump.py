@@ -1,58 +1,214 @@
-from wikigraph import partition_data, process_wikitext, graph_implementation
+from wikigraph import partition_data, process_wikitext, graph_implementation, title_ids, redirects
+from wikigraph import pipeline, telemetry, csr_graph
+from typing import Optional, Sequence
 import os
 
+GRAPH_DIR = 'data/processed/graph'
+PARTITIONED_DIR = 'data/processed/partitioned'
+
+# The keys of the last successful run of every stage (see pipeline.run_stages)
+PIPELINE_CACHE = 'data/processed/pipeline-cache.tsv'
+
+# The records of every stage and worker of every run (see telemetry)
+TELEMETRY_FILE = 'data/processed/telemetry.jsonl'
+
 
 def process_xml(xml_path: str = "data/raw/enwiki-20210101-pages-articles-multistream.xml",
-                partitions: int = 80) -> None:
+                partitions: int = 80, partition_free: bool = False,
+                intern_titles: bool = False, memory_budget: Optional[int] = None,
+                force: Sequence[str] = (),
+                telemetry_file: Optional[str] = TELEMETRY_FILE) -> list[str]:
     """
     Create XML index
     Create partition index
     Partition XML
 
+    Each step is a stage of a pipeline (see get_stages). A stage is skipped if neither its
+    code, its parameters nor its inputs have changed since it last completed, and stages
+    that do not depend on each other run at the same time. The stages named in force are
+    run regardless. Return the names of the stages that ran.
+
+    If partition_free is True, the dump is not copied into partitions. Instead each worker
+    parses a page aligned byte range of the dump in place. The ranges are balanced using
+    data/processed/wiki-byte-index.bin if it exists.
+
+    If xml_path is a bz2 multistream dump (ends with .xml.bz2), it is read directly using its
+    companion -index.txt file, without being decompressed to disk first.
+
+    If intern_titles is True, the title table (wiki-titles.bin) and the binary integer id
+    edge shards (edges-XXXX.bin) are written to the graph directory, and the graph is loaded
+    from them, with the redirects collapsed on the ids (see csr_graph.load_csr_graph_interned).
+    The collapsed info and links files are then not written.
+
+    Otherwise, if memory_budget is given, redirects are collapsed with sorted runs on disk,
+    keeping roughly at most memory_budget bytes of records in memory, instead of with a
+    resolver.
+
+    Unless telemetry_file is None, the time, throughput, memory and parse errors of every
+    stage and extraction worker are appended to it as JSON lines (see telemetry).
+
     Preconditions:
-        - File name ends with .xml
+        - File name ends with .xml or .xml.bz2
         - File tails with </page> and </mediawiki>
     """
-    dir_path = os.path.dirname(os.path.realpath(
-        __file__[0:-len('process_dump.py')]))
+    for directory in [PARTITIONED_DIR, GRAPH_DIR]:
+        if not os.path.exists(directory):
+            os.makedirs(directory, 0o755)
+
+    if telemetry_file is not None:
+        run = telemetry.enable(telemetry_file)
+        print(f"Recording telemetry of run {run} to {telemetry_file}")
+
+    return pipeline.run_stages(get_stages(xml_path, partitions, partition_free,
+                                          intern_titles, memory_budget),
+                               PIPELINE_CACHE, force=force)
+
+
+def get_stages(xml_path: str, partitions: int, partition_free: bool, intern_titles: bool,
+               memory_budget: Optional[int]) -> list[pipeline.Stage]:
+    """Return the stages of process_xml, from the dump at xml_path to graph.html"""
+    info_manifest = f'{GRAPH_DIR}/wiki-info.manifest'
+    links_manifest = f'{GRAPH_DIR}/wiki-links.manifest'
+    manifests = (info_manifest, links_manifest)
+    stages = []
 
-    partitioned_dir = f"{dir_path}/data/processed/partitioned"
-    graph_dir = f"{dir_path}/data/processed/graph"
+    if xml_path.endswith('.xml.bz2'):
+        index_file = xml_path[:-len('.xml.bz2')] + '-index.txt'
+        stages.append(pipeline.Stage('extract', _extract_multistream,
+                                     (xml_path, index_file, partitions),
+                                     (xml_path, index_file), manifests))
+    elif partition_free:
+        byte_index_file = 'data/processed/wiki-byte-index.bin'
+        if not os.path.exists(byte_index_file):
+            byte_index_file = None
+        stages.append(pipeline.Stage('extract', _extract_dump,
+                                     (xml_path, partitions, byte_index_file),
+                                     (xml_path,) + ((byte_index_file,) if byte_index_file else ()),
+                                     manifests))
+    else:
+        index_file = 'data/processed/wiki-index.txt'
+        partition_index_file = f'{PARTITIONED_DIR}/partition-index.txt'
+        output = f'{PARTITIONED_DIR}/{xml_path[xml_path.rindex("/") + 1:xml_path.rindex(".xml")]}'
+        # The partition files are named by the stage as it writes them, so the directory
+        # holding them is declared instead
+        stages.extend([
+            pipeline.Stage('index', _create_index, (xml_path, index_file),
+                           (xml_path,), (index_file,)),
+            pipeline.Stage('partition', partition_data.partition_on_num,
+                           (xml_path, index_file, partitions, partition_index_file, output),
+                           (xml_path, index_file), (partition_index_file, PARTITIONED_DIR)),
+            pipeline.Stage('extract', _extract_partitions, (),
+                           (index_file, partition_index_file, PARTITIONED_DIR), manifests)])
 
-    if not os.path.exists(partitioned_dir):
-        os.mkdir(partitioned_dir, 0o755)
+    snapshot = f'{GRAPH_DIR}/wiki-graph'
+    resolver = (f'{GRAPH_DIR}/redirects-titles.bin', f'{GRAPH_DIR}/redirects-targets.bin')
+    if intern_titles:
+        interned = (f'{GRAPH_DIR}/wiki-titles.bin', f'{GRAPH_DIR}/wiki-edges.manifest')
+        stages.extend([
+            pipeline.Stage('intern_titles', title_ids.intern_shards, (GRAPH_DIR,),
+                           manifests, interned),
+            pipeline.Stage('resolve_redirects', redirects.build_from_shards, (GRAPH_DIR,),
+                           manifests, resolver),
+            pipeline.Stage('load_graph', _load_interned_graph, (snapshot,),
+                           (info_manifest,) + interned + resolver, (snapshot,))])
+    else:
+        collapsed = (f'{GRAPH_DIR}/wiki-info-collapsed.tsv',
+                     f'{GRAPH_DIR}/wiki-links-collapsed.tsv')
+        if memory_budget is None:
+            stages.extend([
+                pipeline.Stage('resolve_redirects', redirects.build_from_shards, (GRAPH_DIR,),
+                               manifests, resolver),
+                pipeline.Stage('collapse_redirects', _collapse_redirects, (),
+                               manifests + resolver, collapsed)])
+        else:
+            stages.append(pipeline.Stage('collapse_redirects', _collapse_redirects_external,
+                                         (memory_budget,), manifests, collapsed))
+        stages.append(pipeline.Stage('load_graph', _load_graph, (snapshot,), collapsed,
+                                     (snapshot,)))
 
-    if not os.path.exists(graph_dir):
-        os.mkdir(graph_dir, 0o755)
+    stages.append(pipeline.Stage('visualize', _visualize, (snapshot, 'graph.html'),
+                                 (snapshot,), ('graph.html',)))
 
-    # index = partition_data.create_index(xml_path)
-    # partition_data.write_index(index, 'data/processed/wiki-index.txt')
+    return stages
 
-    partition_data.partition_on_num(xml_path,
-                                    'data/processed/wiki-index.txt',
-                                    partitions,
-                                    'data/processed/partitioned/partition-index.txt',
-                                    f"""data/processed/partitioned/
-                                    {xml_path[xml_path.rindex("/") + 1 : xml_path.rindex(".xml")]}""")
 
+def _create_index(xml_path: str, index_file: str) -> None:
+    """Write the line index of the dump at xml_path to index_file"""
+    index = partition_data.create_index(xml_path)
+    partition_data.write_index(index, index_file)
+
+
+def _extract_partitions() -> None:
+    """Extract the info, links and redirects shards of every partition, and write the
+    manifests of the shards"""
     process_wikitext.parallel_process_partition()
+    process_wikitext.write_manifests(GRAPH_DIR)
+
+
+def _extract_dump(xml_path: str, partitions: int, byte_index_file: Optional[str]) -> None:
+    """Extract the shards of page aligned byte ranges of the dump at xml_path, and write the
+    manifests of the shards"""
+    process_wikitext.parallel_process_dump(xml_path, partitions, GRAPH_DIR,
+                                           byte_index_file=byte_index_file)
+    process_wikitext.write_manifests(GRAPH_DIR)
+
+
+def _extract_multistream(xml_path: str, index_file: str, partitions: int) -> None:
+    """Extract the shards of the bz2 multistream dump at xml_path, and write the manifests
+    of the shards"""
+    process_wikitext.parallel_process_multistream(xml_path, index_file, partitions, GRAPH_DIR)
+    process_wikitext.write_manifests(GRAPH_DIR)
+
+
+def _collapse_redirects() -> None:
+    """Collapse the redirects of the shards with the resolver built from the redirect and
+    info shards"""
+    # The workers wrote the redirects of each shard as they went, so the resolver is built
+    # from those and the info shards instead of running get_redirects on wiki-info.tsv
+    process_wikitext.collapse_redirects(f'{GRAPH_DIR}/wiki-info.manifest',
+                                        f'{GRAPH_DIR}/wiki-links.manifest',
+                                        None,
+                                        f'{GRAPH_DIR}/wiki-info-collapsed.tsv',
+                                        f'{GRAPH_DIR}/wiki-links-collapsed.tsv',
+                                        redirects.RedirectResolver(f'{GRAPH_DIR}/redirects'))
+
+
+def _collapse_redirects_external(memory_budget: int) -> None:
+    """Collapse the redirects of the shards with sorted runs on disk"""
+    redirects.collapse_redirects_external(f'{GRAPH_DIR}/wiki-info.manifest',
+                                          f'{GRAPH_DIR}/wiki-links.manifest',
+                                          redirects.get_redirect_shards(GRAPH_DIR),
+                                          f'{GRAPH_DIR}/wiki-info-collapsed.tsv',
+                                          f'{GRAPH_DIR}/wiki-links-collapsed.tsv',
+                                          memory_budget)
+
+
+def _load_graph(snapshot: str) -> None:
+    """Load the graph from the collapsed files in concurrent processes and save a snapshot of
+    it to snapshot"""
+    # The vertices are numbered with a title table next to the info file, which saving
+    # copies into the snapshot once its graph file is written
+    g = csr_graph.load_csr_graph_parallel(f'{GRAPH_DIR}/wiki-info-collapsed.tsv',
+                                          f'{GRAPH_DIR}/wiki-links-collapsed.tsv')
+    g.save(snapshot)
 
-    process_wikitext.concatenate_files('data/processed/graph')
 
-    process_wikitext.get_redirects('data/processed/graph/wiki-info.tsv',
-                                   'data/processed/graph/redirects.tsv')
+def _load_interned_graph(snapshot: str) -> None:
+    """Load the graph from the interned edge shards, collapsing the redirects with the
+    resolver, and save a snapshot of it to snapshot"""
+    g = csr_graph.load_csr_graph_interned(f'{GRAPH_DIR}/wiki-info.manifest',
+                                          f'{GRAPH_DIR}/wiki-titles.bin',
+                                          f'{GRAPH_DIR}/wiki-edges.manifest',
+                                          redirects.RedirectResolver(f'{GRAPH_DIR}/redirects'),
+                                          f'{snapshot}-titles.bin')
+    g.save(snapshot)
 
-    process_wikitext.collapse_redirects('data/processed/graph/wiki-info.tsv',
-                                        'data/processed/graph/wiki-links.tsv',
-                                        'data/processed/graph/redirects.tsv',
-                                        'data/processed/graph/wiki-info-collapsed.tsv',
-                                        'data/processed/graph/wiki-links-collapsed.tsv')
 
-    g = graph_implementation.load_graph('data/processed/graph/wiki-info-collapsed.tsv', 'data/processed/graph/wiki-links-collapsed.tsv')
-    net = g.to_pyvis(10000)
-    net.show('graph.html')
+def _visualize(snapshot: str, output: str) -> None:
+    """Draw the graph saved at snapshot to output"""
+    net = graph_implementation.Graph.load(snapshot).to_pyvis(10000)
+    net.show(output)
 
 
 if __name__ == "__main__":
     process_xml("data/raw/enwiki-20210101-pages-articles-multistream.xml")
-    # process_xml("data/.processed/partitioned/enwiki-20210101-0001.xml")
@@ -1,21 +1,200 @@
 import os
 import csv
+import math
+import mmap
+import bisect
 import fileinput
 import re
-import shutil
+import time
+import zlib
 from tqdm import tqdm
 import concurrent.futures
+from typing import NamedTuple, Optional, Sequence, TextIO
 
 from wikigraph import wikitext
 from wikigraph import partition_data
+from wikigraph import dump_reader
+from wikigraph import multistream
+from wikigraph import redirects
+from wikigraph import shards
+from wikigraph import telemetry
+from wikigraph import pipeline
+from wikigraph.dump_reader import DumpReader
+
+
+def _write_page(page: str, f: TextIO, g: TextIO, r: Optional[TextIO] = None) -> None:
+    """Extract the information and links of a single page and write one row of each to
+    the info writer f and the links writer g, and a row to the redirects writer r (if given)
+    if the page is a redirect"""
+    # Get the title, redirect ("" if not a redirect), text bounds, timestamp and links
+    # of the page in one pass
+    record = wikitext.parse_page(page)
+
+    try:
+        # Get the time in seconds between the last edit and 2021-01-01
+        last_edit = wikitext.revision_age(record.timestamp)
+    except ValueError:
+        telemetry.count_error('last_revision')
+        last_edit = 0
+
+    _write_record(record, wikitext.collect_record_links(page, record), last_edit, f, g, r)
+
+
+def _write_chunk(chunk: str, f: TextIO, g: TextIO, r: Optional[TextIO] = None) -> int:
+    """Extract the information and links of every page in chunk, a string of consecutive
+    <page> elements, and write one row of each per page to the info writer f and the links
+    writer g, and a row per redirect to the redirects writer r (if given). Return the number
+    of pages written.
+
+    The links of all the pages are collected in a single pass over the chunk. Raise a
+    ValueError if a page in chunk has no </page> tag.
+    """
+    records = [wikitext.parse_page(chunk, offset, offset + length, with_links=False)
+               for offset, length in dump_reader.iter_page_spans(chunk)]
+
+    links = wikitext.collect_links_batch(chunk,
+                                         [record.text_start for record in records],
+                                         [record.text_end for record in records])
+
+    # Pages without a valid timestamp are given a last edit of 0
+    last_edits = wikitext.revision_ages([record.timestamp for record in records], default=0)
+
+    for record, record_links, last_edit in zip(records, links, last_edits):
+        _write_record(record, record_links, last_edit, f, g, r)
+
+    return len(records)
+
+
+def _write_record(record: wikitext.PageRecord, page_links: list, last_edit: int,
+                  f: TextIO, g: TextIO, r: Optional[TextIO] = None) -> None:
+    """Write the info row and links row of a page, given its record from parse_page, its
+    links and the seconds since its last edit, to the info writer f and the links writer g.
+    If the page is a redirect and r is given, also write a (title, target) row to r, in the
+    format of get_redirects."""
+    title = record.title
+    redirect = record.redirect
+
+    if not redirect:
+        # Get the number of characters in the text of the article. Pages whose text could
+        # not be found (no </text> tag) are given 0 characters
+        character_count = record.text_end - record.text_start
+        if character_count < 0:
+            telemetry.count_error('char_count')
+            character_count = 0
+
+        # Write information if not redirect
+        f.write(title + '\t' + redirect + '\t' +
+                str(character_count) + '\t' + str(last_edit) + '\n')
+
+        # Get the distinct links in order of appearance (not a set, whose order changes with
+        # the hash seed of each worker) and remove anything prefixed with 'File:' or 'file:'
+        links = dict.fromkeys(l for l in page_links if 'file:' not in l.lower())
+
+        # Write a list of edges
+        g.write(title + '\t' + '\t'.join(i.replace('\n', '\\n')
+                                         .replace('\t', '\\t')
+                                         .replace('\r', '\\r') for i in links) + '\n')
+    else:
+        # Write information if redirect
+        f.write(title + '\t' + redirect + '\t\t\n')
+
+        # Write an empty list of edges since a redirect file will have no edges
+        g.write(title + '\t\n')
+
+        if r is not None:
+            r.write(title + '\t' + redirect + '\n')
+
+
+def _open_redirects_shard(redirects_file: Optional[str], shard: str) -> Optional[TextIO]:
+    """Open the shard numbered shard (e.g. '0001') of redirects_file for writing, or return
+    None if redirects_file is None"""
+    if redirects_file is None:
+        return None
+    return open(redirects_file[:-4] + '-' + shard + '.tsv', 'w', encoding='utf8')
 
 
-def process_partition(partition_file: str, index: list[int], p_points: list[int],
-                      links_file: str, info_file: str) -> None:
+class PartitionRecord(NamedTuple):
+    """The entry of a processed partition in the completion manifest of
+    parallel_process_partition.
+
+    Instance Attributes:
+        - partition: The number of the partition, e.g. "0001"
+        - checksum: The crc32 of the partition file
+        - size: The size of the partition file in bytes
+        - mtime: The modification time of the partition file in nanoseconds
+        - pages: The number of pages of the partition, i.e. of rows of its info and links
+                 shards
+        - duration: The number of seconds it took to process the partition
+    """
+    partition: str
+    checksum: int
+    size: int
+    mtime: int
+    pages: int
+    duration: float
+
+
+def write_partition_manifest(records: Sequence[PartitionRecord], filename: str) -> None:
+    """Atomically write the completion manifest of parallel_process_partition, one tsv row
+    per record, sorted by partition"""
+    with open(filename + '.tmp', 'w') as f:
+        f.write('\t'.join(PartitionRecord._fields) + '\n')
+        for record in sorted(records):
+            f.write('\t'.join(str(value) for value in record) + '\n')
+    os.replace(filename + '.tmp', filename)
+
+
+def read_partition_manifest(filename: str) -> dict[str, PartitionRecord]:
+    """Return the records of a completion manifest by partition"""
+    records = {}
+    with open(filename, 'r') as f:
+        f.readline()
+        for line in f:
+            partition, checksum, size, mtime, pages, duration = line[:-1].split('\t')
+            records[partition] = PartitionRecord(partition, int(checksum), int(size),
+                                                 int(mtime), int(pages), float(duration))
+
+    return records
+
+
+def get_checksum(filename: str) -> int:
+    """Return the crc32 of the contents of filename"""
+    with open(filename, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return zlib.crc32(b'')
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            return zlib.crc32(buffer)
+
+
+def _is_current(record: PartitionRecord, partition_file: str, outputs: Sequence[str]) -> bool:
+    """Return whether the outputs of a partition exist and were made from the current
+    contents of partition_file. The partition is only read again if its size matches the
+    record but its modification time does not."""
+    if not all(os.path.exists(output) for output in outputs) or \
+            not os.path.exists(partition_file):
+        return False
+
+    stat = os.stat(partition_file)
+    if stat.st_size != record.size:
+        return False
+
+    return stat.st_mtime_ns == record.mtime or get_checksum(partition_file) == record.checksum
+
+
+def process_partition(partition_file: str, index: Sequence[int], p_points: Sequence[int],
+                      links_file: str, info_file: str,
+                      redirects_file: Optional[str] = None) -> PartitionRecord:
     """Process the entire enwiki database and output it to the desired file
 
     Assumes that the dataset is partitioned
 
+    If redirects_file is given, the redirects of the partition are also written to a shard
+    of it, so that get_redirects does not need to reread the info file.
+
+    The shards are written to .tmp files and renamed once complete, so a shard either holds
+    the whole partition or does not exist. Return the completion manifest entry of the
+    partition.
+
     Example Run:
     >>> index = partition_data.read_index('data/processed/wiki-index.txt')
     >>> p_points = partition_data.read_index('data/processed/partitioned/partition-index.txt')
@@ -25,132 +204,357 @@ def process_partition(partition_file: str, index: list[int], p_points: list[int]
     ...                   'data/processed/graph/wiki-links.tsv',
     ...                   'data/processed/graphs/wiki-info.tsv')
     """
+    start_time = time.perf_counter()
+    stat = os.stat(partition_file)
+
     # Get the partition number from the file number
     partition_number = int(partition_file[-8:-4])
 
-    iterator_thing = fileinput.input([partition_file])
+    # Only the index entries that fall inside this partition are needed, and since both
+    # lists are sorted they can be found by binary search instead of offsetting every entry
+    first_line = 1 if partition_number == 1 else p_points[partition_number - 2]
+    end_line = p_points[partition_number - 1] if partition_number <= len(p_points) else math.inf
+    expected_pages = bisect.bisect_left(index, end_line) - bisect.bisect_left(index, first_line)
 
-    if partition_number == 1:
-        line_offset = 45
+    # File writere paths
+    f_path = info_file[:-4] + '-' + partition_file[-8:-4] + '.tsv'
+    g_path = links_file[:-4] + '-' + partition_file[-8:-4] + '.tsv'
+    paths = [f_path, g_path]
 
-        # Getting rid of the preamble in the xml (only in the first partition)
-        chop_line_count = 0
-        for line in iterator_thing:
-            if chop_line_count == 43:
-                break
-            chop_line_count += 1
-    else:
-        line_offset = p_points[partition_number - 2]
+    # Open file writer
+    f = open(f_path + '.tmp', "w")
+    g = open(g_path + '.tmp', "w")
+    r = None
+    if redirects_file is not None:
+        r_path = redirects_file[:-4] + '-' + partition_file[-8:-4] + '.tsv'
+        paths.append(r_path)
+        r = open(r_path + '.tmp', 'w', encoding='utf8')
+
+    # Each chunk is a view of whole pages of the memory-mapped partition. The preamble of the
+    # first partition is skipped since it is not inside a page.
+    pages = 0
+    checksum = zlib.crc32(b'')
+    with telemetry.measure('process_partition', partition_file[-8:-4]) as measurement, \
+            open(partition_file, 'rb') as xml:
+        if stat.st_size > 0:
+            buffer = mmap.mmap(xml.fileno(), 0, access=mmap.ACCESS_READ)
+            checksum = zlib.crc32(buffer)
+            for chunk in dump_reader.iter_page_chunks(buffer):
+                pages += _write_chunk(str(chunk, 'utf-8'), f, g, r)
+                chunk.release()
+            buffer.close()
+        measurement.add(pages, stat.st_size)
+
+    if pages != expected_pages:
+        print(f"Warning: {partition_file} has {pages} pages but the index lists {expected_pages}")
 
-    # offset the index based on the partition number
-    offset_index = {i - line_offset for i in index}
+    # Close the files
+    f.close()
+    g.close()
+    if r is not None:
+        r.close()
 
-    count = 1
-    current_page = ''
+    for path in paths:
+        os.replace(path + '.tmp', path)
 
-    # If the file already exists, delete it to overwrite it
-    if os.path.exists(info_file[:-4] + '-' + partition_file[-8:-4] + '.tsv'):
-        os.remove(info_file[:-4] + '-' + partition_file[-8:-4] + '.tsv')
+    return PartitionRecord(partition_file[-8:-4], checksum, stat.st_size, stat.st_mtime_ns,
+                           pages, round(time.perf_counter() - start_time, 3))
 
-    # If the file already exists, delete it to overwrite it
-    if os.path.exists(links_file[:-4] + '-' + partition_file[-8:-4] + '.tsv'):
-        os.remove(links_file[:-4] + '-' + partition_file[-8:-4] + '.tsv')
 
-    # File writere paths
-    f_path = info_file[:-4] + '-' + partition_file[-8:-4] + '.tsv'
-    g_path = links_file[:-4] + '-' + partition_file[-8:-4] + '.tsv'
+def process_pages(xml_file: str, page_spans: list[tuple[int, int]], shard: int,
+                  links_file: str, info_file: str, redirects_file: Optional[str] = None) -> None:
+    """Process the pages at the given (offset, length) byte spans of xml_file and output
+    them to the shard numbered =shard= of the desired files
 
-    # Open file writer
-    f = open(f_path, "w")
-    g = open(g_path, "w")
-
-    # i = 0
-
-    for line in iterator_thing:
-        current_page += line
-        if count in offset_index:
-            # Get the title
-            title = wikitext.get_title(current_page)
-
-            # Get if the article is a redirect or not
-            # ("" if not, the article it redirects to if so)
-            redirect = wikitext.parse_redirect(current_page)
-
-            if not redirect:
-                try:
-                    # Get the number of characters in the text of the article
-                    character_count = wikitext.char_count(current_page)
-                except Exception as e:
-                    character_count = 0
-
-                try:
-                    # Get the timedelta between the last edit and 2021-01-01
-                    last_edit = wikitext.last_revision(current_page)
-                except Exception as e:
-                    last_edit = 0
-
-                # Write information if not redirect
-                f.write(title + '\t' + redirect + '\t' +
-                        str(character_count) + '\t' + str(last_edit) + '\n')
-
-                # Get a set of the links and remove anything prefixed with 'File:' or 'file:'
-                links = set(l for l in wikitext.collect_links(current_page)
-                            if 'file:' not in l.lower())
-
-                # Write a list of edges
-                g.write(title + '\t' + '\t'.join(i.replace('\n', '\\n')
-                                                 .replace('\t', '\\t')
-                                                 .replace('\r', '\\r') for i in links) + '\n')
-            else:
-                # Write information if redirect
-                f.write(title + '\t' + redirect + '\t\t\n')
-
-                # Write an empty list of edges since a redirect file will have no edges
-                g.write(title + '\t\n')
-
-            # Reset the contents of the page
-            current_page = ''
-            # Update the progress bar
-            # progressbar.update(1)
-
-        # Increment the line number
-        count += 1
+    Unlike process_partition, this does not need the dataset to be partitioned: every page
+    is sliced directly out of a memory map of the dump. As in process_partition, the
+    redirects are also written to a shard of redirects_file if it is given.
+
+    Example Run:
+    >>> byte_index = partition_data.read_byte_index('data/processed/wiki-byte-index.txt')
+    >>> process_pages('data/raw/enwiki-20210101-pages-articles-multistream.xml',
+    ...               byte_index[:1000],
+    ...               1,
+    ...               'data/processed/graph/links.tsv',
+    ...               'data/processed/graph/info.tsv')
+    """
+    f = open(info_file[:-4] + '-%04d' % shard + '.tsv', 'w')
+    g = open(links_file[:-4] + '-%04d' % shard + '.tsv', 'w')
+
+    r = _open_redirects_shard(redirects_file, '%04d' % shard)
+
+    with telemetry.measure('process_pages', '%04d' % shard) as measurement, \
+            DumpReader(xml_file, page_spans) as dump:
+        for page in dump.iter_pages():
+            _write_page(page, f, g, r)
+        measurement.add(len(page_spans), sum(length for _, length in page_spans))
 
-    # Close the files
     f.close()
     g.close()
+    if r is not None:
+        r.close()
 
 
 def parallel_process_partition(data_dir: str = "data/processed",
                                partition_rel_dir: str = "partitioned",
-                               max_workers: int = 10) -> None:
+                               max_workers: int = 10, resume: bool = True) -> None:
     """Run process_partition with councurrent processes
 
+    Besides the info and links shards, each worker writes the redirects of its partition to
+    redirects-XXXX.tsv, which redirects.build_from_shards merges into a resolver.
+
+    Every processed partition is recorded in the completion manifest
+    graph/partition-manifest.tsv (see PartitionRecord) as soon as it is done. If resume is
+    True, a partition whose shards exist and whose file has not changed since it was
+    recorded is not processed again, so a failed run can simply be rerun.
+
+    Every partition is attempted even if some fail. Raise a RuntimeError naming the
+    partitions that failed at the end.
+
     Example Run:
     >>> parallel_process_partition('data/processed', 'partitioned', max_workers=5)
     """
-    os.chdir(__file__[0:-len('wikigraph/process_wikitext.py')])
-
     partitioned_files = [partitioned_file for partitioned_file in os.listdir(
-        f"{data_dir}/{partition_rel_dir}") if ".xml" in partitioned_file]
+        f"{data_dir}/{partition_rel_dir}") if partitioned_file.endswith(".xml")]
 
-    index = partition_data.read_index(f'{data_dir}/wiki-index.txt')
-    p_points = partition_data.read_index(
-        f'{data_dir}/{partition_rel_dir}/partition-index.txt')
+    # Prefer the binary index: it is memory-mapped, and only its path is sent to the workers
+    index_file = f'{data_dir}/wiki-index.bin'
+    if not os.path.exists(index_file):
+        index_file = f'{data_dir}/wiki-index.txt'
+
+    index = partition_data.load_index(index_file)
+    # Indexes written before partition normalized its points may hold duplicates
+    p_points = partition_data.normalize_partition_points(partition_data.load_index(
+        f'{data_dir}/{partition_rel_dir}/partition-index.txt'))
 
     partitioned_files.sort()
     print(partitioned_files)
 
-    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
-        processes = [executor.submit(process_partition, f'{data_dir}/{partition_rel_dir}/{file}',
+    # Keep the records of the partitions that are still up to date, and forget the others
+    # right away so that the manifest never lists stale shards
+    manifest_file = f'{data_dir}/graph/partition-manifest.tsv'
+    records = {}
+    if resume and os.path.exists(manifest_file):
+        old_records = read_partition_manifest(manifest_file)
+        for file in partitioned_files:
+            partition = file[-8:-4]
+            outputs = [f'{data_dir}/graph/{kind}-{partition}.tsv'
+                       for kind in ['info', 'links', 'redirects']]
+            if partition in old_records and _is_current(
+                    old_records[partition], f'{data_dir}/{partition_rel_dir}/{file}', outputs):
+                records[partition] = old_records[partition]
+    write_partition_manifest(list(records.values()), manifest_file)
+
+    pending = [file for file in partitioned_files if file[-8:-4] not in records]
+    print(f"{len(records)} partitions up to date, {len(pending)} to process")
+
+    failures = {}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers,
+                                                mp_context=pipeline.get_process_context()) as executor:
+        processes = {executor.submit(process_partition, f'{data_dir}/{partition_rel_dir}/{file}',
                                      index,
                                      p_points,
                                      f'{data_dir}/graph/links.tsv',
-                                     f'{data_dir}/graph/info.tsv')
-                     for file in partitioned_files]
+                                     f'{data_dir}/graph/info.tsv',
+                                     f'{data_dir}/graph/redirects.tsv'): file[-8:-4]
+                     for file in pending}
 
         for f in concurrent.futures.as_completed(processes):
-            print(f"{f.done() and 'Done'}")
+            partition = processes[f]
+            try:
+                record = f.result()
+            except Exception as error:
+                failures[partition] = error
+                print(f"Partition {partition} failed: {error!r}")
+                continue
+
+            records[partition] = record
+            write_partition_manifest(list(records.values()), manifest_file)
+            print(f"Partition {partition} done: {record.pages} pages in {record.duration}s")
+
+    if failures:
+        failed = sorted(failures)
+        raise RuntimeError(f"Partitions {', '.join(failed)} failed; rerun to retry them") \
+            from failures[failed[0]]
+
+
+def process_byte_range(xml_file: str, start: int, end: int, shard: int,
+                       links_file: str, info_file: str,
+                       redirects_file: Optional[str] = None) -> None:
+    """Process every page of xml_file whose <page> tag starts in the byte range [start, end)
+    and output them to the shard numbered =shard= of the desired files
+
+    The range is parsed in place through a memory map, so no partition files are needed.
+    As in process_partition, the redirects are also written to a shard of redirects_file if
+    it is given.
+
+    Example Run:
+    >>> process_byte_range('data/raw/enwiki-20210101-pages-articles-multistream.xml',
+    ...                    0,
+    ...                    1000000000,
+    ...                    1,
+    ...                    'data/processed/graph/links.tsv',
+    ...                    'data/processed/graph/info.tsv')
+    """
+    f = open(info_file[:-4] + '-%04d' % shard + '.tsv', 'w')
+    g = open(links_file[:-4] + '-%04d' % shard + '.tsv', 'w')
+
+    r = _open_redirects_shard(redirects_file, '%04d' % shard)
+
+    with telemetry.measure('process_byte_range', '%04d' % shard) as measurement, \
+            open(xml_file, 'rb') as xml:
+        buffer = mmap.mmap(xml.fileno(), 0, access=mmap.ACCESS_READ)
+        for chunk in dump_reader.iter_page_chunks(buffer, start, end):
+            measurement.add(_write_chunk(str(chunk, 'utf-8'), f, g, r))
+            chunk.release()
+        buffer.close()
+        measurement.add(num_bytes=end - start)
+
+    f.close()
+    g.close()
+    if r is not None:
+        r.close()
+
+
+def parallel_process_dump(xml_file: str, num_ranges: int = 80,
+                          graph_dir: str = "data/processed/graph",
+                          max_workers: int = 10,
+                          byte_index_file: Optional[str] = None) -> None:
+    """Run process_byte_range with concurrent processes over page aligned byte ranges of the
+    unpartitioned xml_file
+
+    This produces the same info-XXXX.tsv and links-XXXX.tsv files as
+    parallel_process_partition without first writing a partitioned copy of the dump.
+
+    If byte_index_file is given, the ranges are planned with
+    partition_data.plan_byte_partitions so that they are balanced on both bytes and page
+    count, and their statistics are written to partition-stats.tsv in graph_dir. Otherwise
+    the ranges are evenly sized in bytes.
+
+    Every range is attempted even if some fail. Raise a RuntimeError naming the shards that
+    failed at the end.
+
+    Example Run:
+    >>> parallel_process_dump('data/raw/enwiki-20210101-pages-articles-multistream.xml',
+    ...                       80, 'data/processed/graph', max_workers=5,
+    ...                       byte_index_file='data/processed/wiki-byte-index.bin')
+    """
+    if byte_index_file is None:
+        byte_ranges = dump_reader.get_aligned_ranges(xml_file, num_ranges)
+    else:
+        byte_index = partition_data.load_index(byte_index_file)
+        plan = partition_data.plan_byte_partitions(byte_index, num_ranges)
+        stats = partition_data.get_byte_partition_stats(plan, byte_index)
+        partition_data.write_partition_stats(stats, f'{graph_dir}/partition-stats.tsv')
+
+        byte_ranges = [(start, start + size) for _, _, _, start, size in stats]
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers,
+                                                mp_context=pipeline.get_process_context()) as executor:
+        processes = {executor.submit(process_byte_range, xml_file,
+                                     start,
+                                     end,
+                                     shard,
+                                     f'{graph_dir}/links.tsv',
+                                     f'{graph_dir}/info.tsv',
+                                     f'{graph_dir}/redirects.tsv'): shard
+                     for shard, (start, end) in enumerate(byte_ranges, start=1)}
+
+        _wait_for_shards(processes)
+
+
+def _wait_for_shards(processes: dict[concurrent.futures.Future, int]) -> None:
+    """Wait for every future of processes, which maps each to the number of the shard it
+    writes, and print each shard as it is done.
+
+    Raise a RuntimeError naming the shards whose worker raised an exception, once every
+    shard is done, so that a missing shard never goes unnoticed."""
+    failures = {}
+    for f in concurrent.futures.as_completed(processes):
+        shard = '%04d' % processes[f]
+        try:
+            f.result()
+        except Exception as error:
+            failures[shard] = error
+            print(f"Shard {shard} failed: {error!r}")
+            continue
+
+        print(f"Shard {shard} done")
+
+    if failures:
+        failed = sorted(failures)
+        raise RuntimeError(f"Shards {', '.join(failed)} failed") from failures[failed[0]]
+
+
+def process_streams(dump_file: str, stream_ranges: list[tuple[int, int]], shard: int,
+                    links_file: str, info_file: str,
+                    redirects_file: Optional[str] = None) -> None:
+    """Decompress the given bz2 streams of a multistream dump and output their pages to the
+    shard numbered =shard= of the desired files
+
+    As in process_partition, the redirects are also written to a shard of redirects_file if
+    it is given.
+
+    Example Run:
+    >>> offsets = multistream.read_stream_offsets(
+    ...     'data/raw/enwiki-20210101-pages-articles-multistream-index.txt')
+    >>> ranges = multistream.get_stream_ranges(
+    ...     'data/raw/enwiki-20210101-pages-articles-multistream.xml.bz2', offsets)
+    >>> process_streams('data/raw/enwiki-20210101-pages-articles-multistream.xml.bz2',
+    ...                 ranges[:100],
+    ...                 1,
+    ...                 'data/processed/graph/links.tsv',
+    ...                 'data/processed/graph/info.tsv')
+    """
+    f = open(info_file[:-4] + '-%04d' % shard + '.tsv', 'w')
+    g = open(links_file[:-4] + '-%04d' % shard + '.tsv', 'w')
+
+    r = _open_redirects_shard(redirects_file, '%04d' % shard)
+
+    # The bytes counted are compressed bytes
+    with telemetry.measure('process_streams', '%04d' % shard) as measurement:
+        for chunk in multistream.iter_stream_chunks(dump_file, stream_ranges):
+            measurement.add(_write_chunk(chunk, f, g, r))
+        measurement.add(num_bytes=sum(end - start for start, end in stream_ranges))
+
+    f.close()
+    g.close()
+    if r is not None:
+        r.close()
+
+
+def parallel_process_multistream(dump_file: str, index_file: str, num_shards: int = 80,
+                                 graph_dir: str = "data/processed/graph",
+                                 max_workers: int = 10) -> None:
+    """Run process_streams with concurrent processes over the compressed multistream dump,
+    using its stream index to split it into num_shards batches of independent streams
+
+    Decompression happens in the workers, so the dump never has to be decompressed to disk.
+
+    Every batch is attempted even if some fail to decompress or parse. Raise a RuntimeError
+    naming the shards that failed at the end.
+
+    Example Run:
+    >>> parallel_process_multistream(
+    ...     'data/raw/enwiki-20210101-pages-articles-multistream.xml.bz2',
+    ...     'data/raw/enwiki-20210101-pages-articles-multistream-index.txt',
+    ...     80, 'data/processed/graph', max_workers=5)
+    """
+    offsets = multistream.read_stream_offsets(index_file)
+    batches = multistream.split_stream_ranges(
+        multistream.get_stream_ranges(dump_file, offsets), num_shards)
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers,
+                                                mp_context=pipeline.get_process_context()) as executor:
+        processes = {executor.submit(process_streams, dump_file,
+                                     batch,
+                                     shard,
+                                     f'{graph_dir}/links.tsv',
+                                     f'{graph_dir}/info.tsv',
+                                     f'{graph_dir}/redirects.tsv'): shard
+                     for shard, batch in enumerate(batches, start=1)}
+
+        _wait_for_shards(processes)
 
 
 def get_redirects(info_file: str, output: str) -> None:
@@ -160,7 +564,8 @@ def get_redirects(info_file: str, output: str) -> None:
 
     # Getting redirects from the info_file
     print("Getting redirects...")
-    for line in tqdm(fileinput.input(info_file, openhook=fileinput.hook_encoded("utf-8"))):
+    for line in tqdm(fileinput.input(shards.get_files(info_file),
+                                     openhook=fileinput.hook_encoded("utf-8"))):
         row = line.split('\t')
         if row[1] != '':
             redirect[row[0]] = row[1]
@@ -172,49 +577,64 @@ def get_redirects(info_file: str, output: str) -> None:
     redirect_w.close()
 
 
-def collapse_redirects(info_file: str, links_file: str, redirect_file: str,
-                       info_file_output: str, links_file_output: str) -> None:
+def collapse_redirects(info_file: str, links_file: str, redirect_file: Optional[str],
+                       info_file_output: str, links_file_output: str,
+                       resolver: Optional[redirects.RedirectResolver] = None) -> tuple[int, int]:
     """Get rid of redirect links in info_file
 
+    Every link to a redirect is replaced by the article at the end of its redirect chain,
+    and the rows of redirects are dropped. Return the number of links that were resolved,
+    and the number of links that lead nowhere (to a page that does not exist, or into a
+    redirect cycle), which are kept unchanged.
+
+    If resolver is None, a resolver is built from info_file and redirect_file and written
+    next to redirect_file (see redirects.RedirectResolver). Otherwise redirect_file is not
+    used, and may be None.
+
     Example Run:
     >>> collapse_redirects('data/processed/graph/wiki-info.tsv',
     ...                   'data/processed/graph/wiki-links.tsv',
-    ...                   'data/processed/graph/redirect-info.tsv'
+    ...                   'data/processed/graph/redirects.tsv',
     ...                   'data/processed/graph/wiki-info-collapsed.tsv',
     ...                   'data/processed/graph/wiki-links-collapsed.tsv')
     """
-    # Getting redirect information
-    redirect = dict()
-    print("Reading redirect information...")
-    for line in tqdm(fileinput.input(redirect_file, openhook=fileinput.hook_encoded("utf-8"))):
-        row = line.split('\t')
-        redirect[row[0]] = row[1]
+    # Resolving every redirect chain
+    if resolver is None:
+        resolver = redirects.RedirectResolver.build([info_file], [redirect_file],
+                                                    redirect_file[:-4])
 
     # Collapsing the redirects in links_w
+    resolved = 0
+    dangling = 0
     links_w = open(links_file_output, 'w', encoding='utf8')
     print("Collaping redirects in links...")
-    for line in tqdm(fileinput.input(links_file, openhook=fileinput.hook_encoded("utf-8"))):
+    for line in tqdm(fileinput.input(shards.get_files(links_file),
+                                     openhook=fileinput.hook_encoded("utf-8"))):
         row = line[:-1].split('\t')
 
-        if row[0] not in redirect:
-            for i in row[1:]:
-                if i in redirect:
-                    i = redirect[i]
+        if not resolver.is_redirect(row[0]):
+            row, row_resolved, row_dangling = redirects.collapse_links_row(row, resolver)
+            resolved += row_resolved
+            dangling += row_dangling
 
-            links_w.write('\t'.join(row) + '\n')
+            links_w.write(row[0] + '\t' + '\t'.join(row[1:]) + '\n')
 
     links_w.close()
 
     info_w = open(info_file_output, 'w', encoding='utf8')
     print("Collaping redirects in info...")
-    for line in tqdm(fileinput.input(info_file, openhook=fileinput.hook_encoded("utf-8"))):
+    for line in tqdm(fileinput.input(shards.get_files(info_file),
+                                     openhook=fileinput.hook_encoded("utf-8"))):
         row = line.split('\t')
 
-        if row[0] not in redirect:
+        if row[1] == '':
             info_w.write(line)
 
     info_w.close()
 
+    print(f"{resolved} links resolved, {dangling} links lead nowhere")
+    return resolved, dangling
+
 
 def concatenate_files(file_locations: str,
                       out_info_file: str = 'wiki-info.tsv',
@@ -222,48 +642,24 @@ def concatenate_files(file_locations: str,
                       delete_remnants: bool = False) -> None:
     """Concatenate the info and links files generated from the computation into one file each
 
+    The output files are written in file_locations. The shards are copied inside the kernel
+    where possible (see shards.concatenate). Stages that accept a manifest can skip this
+    entirely with write_manifests.
+
     Example Run
     >>> concatenate_files('data/processed/graph', 'wiki-info.tsv', 'wiki-links.tsv')
     """
-    # os.chdir(__file__[0:-len('wikigraph/process_wikitext.py')] + '/data/processed')
-
     # Get the info and links files
-    info_files = sorted([info_file
-                         for info_file in os.listdir(file_locations)
-                         if "info" in info_file])
-    links_files = sorted([links_file
-                          for links_file in os.listdir(file_locations)
-                          if "links" in links_file])
-
-    os.chdir(file_locations)
+    info_files = shards.get_shards(file_locations, 'info')
+    links_files = shards.get_shards(file_locations, 'links')
 
     # Concatenate the info files
     print("Concatenating Info Files...")
-    with tqdm(total=len(info_files)) as progressbar:
-        target_info_file_name = out_info_file
-        shutil.copy(info_files[0], target_info_file_name)
-        with open(target_info_file_name, 'a') as out_file:
-            for source_file in info_files[1:]:
-                with open(source_file, 'r') as in_file:
-                    shutil.copyfileobj(in_file, out_file)
-                    in_file.close()
-                    progressbar.update(1)
-            out_file.close()
-        progressbar.update(1)
+    shards.concatenate(tqdm(info_files), os.path.join(file_locations, out_info_file))
 
     # Concatenate the links files
     print("Concatenating Links Files...")
-    with tqdm(total=len(links_files)) as progressbar:
-        target_links_file_name = out_links_files
-        shutil.copy(links_files[0], target_links_file_name)
-        with open(target_links_file_name, 'a') as out_file:
-            for source_file in links_files[1:]:
-                with open(source_file, 'r') as in_file:
-                    shutil.copyfileobj(in_file, out_file)
-                    in_file.close()
-                    progressbar.update(1)
-            out_file.close()
-        progressbar.update(1)
+    shards.concatenate(tqdm(links_files), os.path.join(file_locations, out_links_files))
 
     if delete_remnants:
         for i in info_files:
@@ -273,6 +669,26 @@ def concatenate_files(file_locations: str,
             os.remove(i)
 
 
+def write_manifests(file_locations: str,
+                    out_info_manifest: str = 'wiki-info.manifest',
+                    out_links_manifest: str = 'wiki-links.manifest') -> None:
+    """Write manifests of the info and links files generated from the computation, which
+    get_redirects, collapse_redirects and load_graph read in place of concatenated files
+
+    Example Run
+    >>> write_manifests('data/processed/graph')
+    >>> collapse_redirects('data/processed/graph/wiki-info.manifest',
+    ...                    'data/processed/graph/wiki-links.manifest',
+    ...                    'data/processed/graph/redirects.tsv',
+    ...                    'data/processed/graph/wiki-info-collapsed.tsv',
+    ...                    'data/processed/graph/wiki-links-collapsed.tsv')
+    """
+    shards.write_manifest(file_locations, 'info',
+                          os.path.join(file_locations, out_info_manifest))
+    shards.write_manifest(file_locations, 'links',
+                          os.path.join(file_locations, out_links_manifest))
+
+
 if __name__ == '__main__':
     os.chdir(__file__[0:-len('wikigraph/process_wikitext.py')])
 
@@ -0,0 +1,565 @@
+"""Resolve links to redirect pages to the articles they finally lead to
+
+A redirect can lead to another redirect, so every redirect is followed through its whole
+chain once, up front. Chains that loop back on themselves, and chains that end at a page
+which does not exist, lead nowhere.
+
+Specifications:
+ - RedirectResolver.build(['path/to/wiki-info.tsv'], ['path/to/redirects.tsv'], 'prefix'):
+    Reads every title and redirect, resolves every chain, and writes the resolver to
+    prefix-titles.bin and prefix-targets.bin.
+ - RedirectResolver('prefix'):
+    Memory-maps a resolver. resolver.resolve(title) returns the article that title leads to.
+ - build_from_shards('data/processed/graph'):
+    Builds a resolver from the redirects-XXXX.tsv shards written by the extraction workers
+    and the titles of the info shards, without a concatenated info or redirects file.
+ - collapse_redirects_external('wiki-info.tsv', 'wiki-links.tsv', redirect_files,
+                               'wiki-info-collapsed.tsv', 'wiki-links-collapsed.tsv'):
+    Does the same as process_wikitext.collapse_redirects, but with sorted runs on disk
+    instead of any table in memory, so that its memory use stays under a budget.
+
+Example of use:
+>>> resolver = RedirectResolver.build(['data/processed/graph/wiki-info.tsv'],
+...                                   ['data/processed/graph/redirects.tsv'],
+...                                   'data/processed/graph/redirects')
+>>> resolver.resolve('AccessibleComputing')
+'Computer accessibility'
+"""
+from __future__ import annotations
+
+import os
+import sys
+import mmap
+import heapq
+import tempfile
+from array import array
+from operator import itemgetter
+from typing import Callable, Iterable, Iterator, Optional, Sequence
+
+from tqdm import tqdm
+
+from wikigraph import title_ids, shards
+
+# Targets files start with an 8 byte header (this magic string, then the format version and
+# whether the resolver knows every article), followed by the final target id of every title
+# as little-endian signed 32-bit integers.
+TARGETS_MAGIC = b'WGRDR\x00'
+TARGETS_VERSION = 1
+TARGETS_HEADER_SIZE = 8
+
+# Final targets of titles that lead nowhere: redirects whose chain loops, titles that are
+# neither articles nor redirects, and redirects whose chain ends at such a title
+CYCLE = -1
+MISSING = -2
+BROKEN = -3
+
+# Marks a title whose chain has not been followed yet while building
+_UNRESOLVED = -4
+
+# The default memory budget of collapse_redirects_external, in bytes
+MEMORY_BUDGET = 1 << 28
+
+# Approximate memory taken by one record of a sort run besides its characters: the tuple,
+# the string objects and the list slot
+_RECORD_OVERHEAD = 200
+
+
+class RedirectResolver:
+    """A read-only, memory-mapped table from every known title to the article it leads to.
+
+    Every title of the info files and every redirect and redirect target has an id in a
+    title_ids TitleTable. The final target of an article is itself, the final target of a
+    redirect is the article at the end of its chain, and titles that lead nowhere have the
+    final target CYCLE (the chain loops), MISSING (the page does not exist) or BROKEN (the
+    chain ends at a page that does not exist).
+
+    A resolver built without info files is not complete: it only knows the titles of the
+    redirects and their targets, and assumes that every other title is an article.
+
+    Pickling a RedirectResolver only sends its prefix, as with TitleTable.
+
+    Instance Attributes:
+        - prefix: The path of the resolver files, without -titles.bin or -targets.bin.
+        - table: The ids of all the titles.
+        - complete: Whether every article has an id in table.
+    """
+    prefix: str
+    table: title_ids.TitleTable
+    complete: bool
+
+    # Private Instance Attributes:
+    #     - _map: The memory map of the targets file.
+    #     - _targets: The final target id of every title.
+    _map: mmap.mmap
+    _targets: Sequence[int]
+
+    def __init__(self, prefix: str) -> None:
+        """Memory-map the resolver written to prefix-titles.bin and prefix-targets.bin.
+
+        Raise a ValueError if prefix-targets.bin is not a targets file."""
+        self.prefix = prefix
+        self.table = title_ids.TitleTable(prefix + '-titles.bin')
+
+        with open(prefix + '-targets.bin', 'rb') as f:
+            header = f.read(TARGETS_HEADER_SIZE)
+            if header[:len(TARGETS_MAGIC)] != TARGETS_MAGIC or header[6] != TARGETS_VERSION:
+                raise ValueError(f'{prefix}-targets.bin is not a redirect targets file')
+
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self.complete = bool(header[7])
+        targets = memoryview(self._map)[TARGETS_HEADER_SIZE:].cast('i')
+        if sys.byteorder != 'little':
+            # Fall back to an in-memory copy on big-endian machines
+            targets = array('i', targets)
+            targets.byteswap()
+        self._targets = targets
+
+    def __reduce__(self):
+        return (RedirectResolver, (self.prefix,))
+
+    def is_redirect(self, title: str) -> bool:
+        """Return whether title is a redirect, including redirects that lead nowhere"""
+        i = self.table.id(title)
+        return i != -1 and self._targets[i] != i and self._targets[i] != MISSING
+
+    def resolve(self, title: str) -> Optional[str]:
+        """Return the article that title leads to: title itself if it is an article, or the
+        end of its redirect chain if it is a redirect. Return None if title leads nowhere.
+
+        A title that is not in the table is not a known article if the resolver is complete,
+        so None is returned; otherwise it is assumed to be an article and returned.
+        """
+        i = self.table.id(title)
+        if i == -1:
+            return None if self.complete else title
+
+        target = self._targets[i]
+        if target < 0:
+            return None
+        return title if target == i else self.table.title(target)
+
+    @staticmethod
+    def build(info_files: Sequence[str], redirect_files: Sequence[str],
+              prefix: str) -> RedirectResolver:
+        """Write a resolver of every title of info_files and every redirect of
+        redirect_files (title, target rows as written by get_redirects) to prefix, and return
+        it.
+
+        If info_files is empty, the resolver is not complete (see RedirectResolver).
+
+        The titles are interned into integer ids first, so the chains are followed over
+        arrays rather than a dict of strings.
+        """
+        table = title_ids.TitleTable.build(_iter_titles(info_files, redirect_files),
+                                           prefix + '-titles.bin')
+        n = len(table)
+
+        # The next title in the chain of every redirect, or -1 for titles that do not redirect
+        next_ids = array('i', [-1]) * n
+        is_article = bytearray(n) if info_files else None
+        print("Reading redirects...")
+        for info_file in info_files:
+            for line in tqdm(shards.iter_lines(info_file)):
+                row = line.split('\t')
+                if row[1] == '':
+                    is_article[table.id(row[0])] = 1
+
+        for source, target in _iter_redirects(redirect_files):
+            next_ids[table.id(source)] = table.id(target)
+
+        targets = resolve_chains(next_ids, is_article)
+        if sys.byteorder != 'little':
+            targets.byteswap()
+
+        with open(prefix + '-targets.bin', 'wb') as f:
+            f.write(TARGETS_MAGIC + bytes([TARGETS_VERSION, is_article is not None]))
+            targets.tofile(f)
+
+        return RedirectResolver(prefix)
+
+
+def resolve_chains(next_ids: Sequence[int], is_article: Optional[Sequence[int]]) -> array:
+    """Return the final target of every title, given the next title in the chain of every
+    redirect (-1 for titles that are not redirects) and whether each title is an article.
+    If is_article is None, every title that is not a redirect is taken to be an article.
+
+    Each title is visited a constant number of times, so this takes O(n) time however long
+    the chains are.
+
+    >>> list(resolve_chains([1, 2, -1, 3, 5, 4, -1, 6], [0, 0, 1, 0, 0, 0, 0, 0]))
+    [2, 2, 2, -1, -1, -1, -2, -3]
+    >>> list(resolve_chains([1, 2, -1, 3, 5, 4, -1, 6], None))
+    [2, 2, 2, -1, -1, -1, 6, 6]
+    """
+    n = len(next_ids)
+    targets = array('i', [_UNRESOLVED]) * n
+    on_path = bytearray(n)
+
+    for i in range(n):
+        # Walk the chain from i until a title whose target is known, the end of the chain,
+        # or a title already on this walk (a cycle)
+        path = []
+        j = i
+        while targets[j] == _UNRESOLVED and next_ids[j] != -1 and not on_path[j]:
+            on_path[j] = 1
+            path.append(j)
+            j = next_ids[j]
+
+        if on_path[j]:
+            target = CYCLE
+        else:
+            if targets[j] == _UNRESOLVED:
+                targets[j] = j if is_article is None or is_article[j] else MISSING
+            target = BROKEN if targets[j] == MISSING else targets[j]
+
+        for k in path:
+            targets[k] = target
+            on_path[k] = 0
+
+    return targets
+
+
+def build_from_shards(graph_dir: str = "data/processed/graph") -> RedirectResolver:
+    """Build a resolver from the redirects-XXXX.tsv shards in graph_dir, written by the
+    extraction workers, and write it to graph_dir/redirects-titles.bin and
+    graph_dir/redirects-targets.bin.
+
+    The articles are read from the info shards (through graph_dir/wiki-info.manifest if it
+    exists), so the resolver is complete and links to pages that do not exist lead nowhere.
+
+    Example Run:
+    >>> resolver = build_from_shards('data/processed/graph')
+    """
+    info_manifest = f'{graph_dir}/wiki-info.manifest'
+    info_files = [info_manifest] if os.path.exists(info_manifest) \
+        else shards.get_shards(graph_dir, 'info')
+
+    return RedirectResolver.build(info_files, get_redirect_shards(graph_dir),
+                                  f'{graph_dir}/redirects')
+
+
+def get_redirect_shards(graph_dir: str = "data/processed/graph") -> list[str]:
+    """Return the paths of the redirects-XXXX.tsv shards in graph_dir, in shard order"""
+    return shards.get_shards(graph_dir, 'redirects')
+
+
+def _iter_titles(info_files: Sequence[str], redirect_files: Sequence[str]) -> Iterable[str]:
+    """Yield every title of info_files and every redirect of redirect_files"""
+    for info_file in info_files:
+        yield from title_ids.read_info_titles(info_file)
+    for source, target in _iter_redirects(redirect_files):
+        yield source
+        yield target
+
+
+def _iter_redirects(redirect_files: Sequence[str]) -> Iterable[tuple[str, str]]:
+    """Yield the (title, target) pair of every row of redirect_files"""
+    for redirect_file in redirect_files:
+        with open(redirect_file, 'r', encoding='utf8') as f:
+            for line in f:
+                row = line.rstrip('\n').split('\t')
+                yield row[0], row[1]
+
+
+def collapse_links_row(row: list[str], resolver: RedirectResolver) -> tuple[list[str], int, int]:
+    """Return the links row (title, link, link, ...) with every link to a redirect replaced
+    by the article it leads to, and the number of links that were resolved and that lead
+    nowhere. Links that lead nowhere are kept unchanged. A link that appears more than once
+    after resolving is only kept once.
+    """
+    resolved = 0
+    dangling = 0
+    links = {}
+    for link in row[1:]:
+        if link == '':
+            continue
+
+        target = resolver.resolve(link)
+        if target is None:
+            dangling += 1
+            target = link
+        elif target != link:
+            resolved += 1
+        links[target] = None
+
+    return [row[0]] + list(links), resolved, dangling
+
+
+def collapse_redirects_external(info_file: str, links_file: str,
+                                redirect_files: Sequence[str], info_file_output: str,
+                                links_file_output: str, memory_budget: int = MEMORY_BUDGET,
+                                tmp_dir: Optional[str] = None) -> tuple[int, int]:
+    """Write the same collapsed info and links files as process_wikitext.collapse_redirects
+    with the redirects of redirect_files, and return the same (resolved, dangling) counts,
+    keeping roughly at most memory_budget bytes of records in memory.
+
+    Nothing is kept in a table. The articles of info_file and the redirects are sorted into
+    runs on disk (in tmp_dir, or the system default) and the chains are followed by
+    repeatedly merge joining the redirects with themselves, doubling the number of hops
+    followed each time. Then every link target is sorted and merge joined with the resolved
+    redirects and the articles, and the changes this makes are sorted back into file order
+    and applied to the links file.
+
+    Example Run:
+    >>> collapse_redirects_external('data/processed/graph/wiki-info.tsv',
+    ...                             'data/processed/graph/wiki-links.tsv',
+    ...                             ['data/processed/graph/redirects-0001.tsv'],
+    ...                             'data/processed/graph/wiki-info-collapsed.tsv',
+    ...                             'data/processed/graph/wiki-links-collapsed.tsv')
+    """
+    with tempfile.TemporaryDirectory(dir=tmp_dir) as run_dir:
+        print("Sorting articles...")
+        articles = _write_run(_unique(_external_sort(_iter_article_records(info_file),
+                                                     itemgetter(0), memory_budget, run_dir)),
+                              run_dir)
+        finals = _resolve_chains_external(redirect_files, articles, memory_budget, run_dir)
+
+        # Every title and link, as (title, row number, position), where position -1 is the
+        # title of the row, joined with the final targets of the redirects
+        print("Joining links with redirects...")
+        changes = _external_sort(
+            _join_links(_external_sort(_iter_link_records(links_file), itemgetter(0),
+                                       memory_budget, run_dir),
+                        _read_run(finals), _read_run(articles)),
+            lambda record: (int(record[0]), int(record[1])), memory_budget, run_dir)
+
+        print("Collaping redirects in links...")
+        resolved, dangling = _apply_changes(links_file, links_file_output, changes)
+
+    with open(info_file_output, 'w', encoding='utf8') as info_w:
+        print("Collaping redirects in info...")
+        for line in tqdm(shards.iter_lines(info_file)):
+            if line.split('\t')[1] == '':
+                info_w.write(line)
+
+    print(f"{resolved} links resolved, {dangling} links lead nowhere")
+    return resolved, dangling
+
+
+def _resolve_chains_external(redirect_files: Sequence[str], articles: str,
+                             memory_budget: int, run_dir: str) -> str:
+    """Return the path of a run holding the (title, final target) of every redirect of
+    redirect_files, sorted by title. The final target is '' for redirects in or into a
+    cycle, and for redirects whose chain ends at a title that is not in the run of articles.
+
+    Each round joins the unfinished redirects (sorted by target) with all the redirects
+    (sorted by title) and the articles. A redirect whose target is finished, or not a
+    redirect, is finished; otherwise its target becomes its target's target, so every round
+    doubles the number of hops followed. A round that finishes nothing leaves only redirects
+    in or into cycles.
+    """
+    print("Resolving redirect chains...")
+    first = itemgetter(0)
+    unfinished = _write_run(_unique(_external_sort(_iter_redirects(redirect_files), first,
+                                                   memory_budget, run_dir)), run_dir)
+    finished = _write_run((), run_dir)
+
+    while os.path.getsize(unfinished) > 0:
+        # All the redirects by title, tagged with whether they are finished
+        by_title = heapq.merge(((title, target, '') for title, target in _read_run(unfinished)),
+                               ((title, final, 'f') for title, final in _read_run(finished)),
+                               key=first)
+        by_target = _external_sort(_read_run(unfinished), itemgetter(1), memory_budget,
+                                   run_dir)
+        article_titles = _read_run(articles)
+
+        newly_finished = _write_run((), run_dir)
+        still_unfinished = _write_run((), run_dir)
+        progress = False
+        with open(newly_finished, 'w', encoding='utf8') as done, \
+                open(still_unfinished, 'w', encoding='utf8') as not_done:
+            lookup = next(by_title, None)
+            article = next(article_titles, None)
+            for title, target in by_target:
+                while lookup is not None and lookup[0] < target:
+                    lookup = next(by_title, None)
+
+                if lookup is None or lookup[0] != target:
+                    # The end of the chain: an article, or a page that does not exist
+                    while article is not None and article[0] < target:
+                        article = next(article_titles, None)
+                    final = target if article is not None and article[0] == target else ''
+                    done.write(title + '\t' + final + '\n')
+                    progress = True
+                elif lookup[2] == 'f':
+                    done.write(title + '\t' + lookup[1] + '\n')
+                    progress = True
+                else:
+                    not_done.write(title + '\t' + lookup[1] + '\n')
+
+        if not progress:
+            # Only cycles are left: they lead nowhere
+            with open(newly_finished, 'w', encoding='utf8') as done:
+                for title, _ in _read_run(unfinished):
+                    done.write(title + '\t\n')
+            with open(still_unfinished, 'w', encoding='utf8'):
+                pass
+
+        merged = _write_run(heapq.merge(
+            _read_run(finished),
+            _external_sort(_read_run(newly_finished), first, memory_budget, run_dir),
+            key=first), run_dir)
+        sorted_unfinished = _write_run(_external_sort(_read_run(still_unfinished), first,
+                                                      memory_budget, run_dir), run_dir)
+
+        for run in (finished, unfinished, newly_finished, still_unfinished):
+            os.remove(run)
+        finished, unfinished = merged, sorted_unfinished
+
+    os.remove(unfinished)
+    return finished
+
+
+def _iter_article_records(info_file: str) -> Iterator[tuple[str]]:
+    """Yield a (title,) record for every row of info_file that is not a redirect"""
+    for line in shards.iter_lines(info_file):
+        row = line.split('\t', 2)
+        if row[1] == '':
+            yield (row[0],)
+
+
+def _iter_link_records(links_file: str) -> Iterator[tuple[str, str, str]]:
+    """Yield a (title, row number, -1) record for the title of every row of links_file, and
+    a (link, row number, position) record for every non-empty link in it"""
+    for row_number, line in enumerate(tqdm(shards.iter_lines(links_file))):
+        row = line[:-1].split('\t')
+        number = str(row_number)
+        yield row[0], number, '-1'
+        for position, link in enumerate(row[1:]):
+            if link:
+                yield link, number, str(position)
+
+
+def _join_links(records: Iterable[tuple[str, str, str]], finals: Iterable[tuple[str, str]],
+                articles: Iterable[tuple[str]]) -> Iterator[tuple[str, str, str]]:
+    """Merge join the link records, sorted by title, with the final targets of the
+    redirects and with the articles, both sorted by title. Yield a (row number, position,
+    final target) change for every record of a redirect, where the final target is '' if
+    the redirect leads nowhere, and a (row number, position, '') change for every link to a
+    title that is neither a redirect nor an article."""
+    finals = iter(finals)
+    articles = iter(articles)
+    final = next(finals, None)
+    article = next(articles, None)
+    for title, row_number, position in records:
+        while final is not None and final[0] < title:
+            final = next(finals, None)
+        while article is not None and article[0] < title:
+            article = next(articles, None)
+
+        if final is not None and final[0] == title:
+            yield row_number, position, final[1]
+        elif position != '-1' and (article is None or article[0] != title):
+            yield row_number, position, ''
+
+
+def _apply_changes(links_file: str, links_file_output: str,
+                   changes: Iterable[tuple[str, str, str]]) -> tuple[int, int]:
+    """Write links_file to links_file_output with the changes, sorted by row and position,
+    applied as collapse_links_row would, and drop the rows whose title is a redirect.
+    Return the number of resolved and dangling links."""
+    resolved = 0
+    dangling = 0
+    changes = iter(changes)
+    change = next(changes, None)
+
+    with open(links_file_output, 'w', encoding='utf8') as links_w:
+        for row_number, line in enumerate(tqdm(shards.iter_lines(links_file))):
+            row = line[:-1].split('\t')
+
+            # The changes of this row, by position
+            row_changes = {}
+            while change is not None and int(change[0]) == row_number:
+                row_changes[int(change[1])] = change[2]
+                change = next(changes, None)
+
+            if -1 in row_changes:
+                continue
+
+            links = {}
+            for position, link in enumerate(row[1:]):
+                if link == '':
+                    continue
+
+                target = row_changes.get(position, link)
+                if target == '':
+                    dangling += 1
+                    target = link
+                elif target != link:
+                    resolved += 1
+                links[target] = None
+
+            links_w.write(row[0] + '\t' + '\t'.join(links) + '\n')
+
+    return resolved, dangling
+
+
+def _external_sort(records: Iterable[tuple], key: Callable, memory_budget: int,
+                   run_dir: str) -> Iterator[tuple]:
+    """Yield the records (tuples of strings without tabs or newlines) sorted by key.
+
+    Records are sorted in memory in chunks of about memory_budget bytes. If there is more
+    than one chunk, each is written to a run in run_dir and the runs are merged.
+    """
+    runs = []
+    chunk = []
+    size = 0
+    for record in records:
+        chunk.append(record)
+        size += _RECORD_OVERHEAD + sum(len(field) for field in record)
+        if size >= memory_budget:
+            chunk.sort(key=key)
+            runs.append(_write_run(chunk, run_dir))
+            chunk = []
+            size = 0
+
+    chunk.sort(key=key)
+    if not runs:
+        yield from chunk
+        return
+
+    runs.append(_write_run(chunk, run_dir))
+    del chunk
+    try:
+        yield from heapq.merge(*(_read_run(run) for run in runs), key=key)
+    finally:
+        for run in runs:
+            os.remove(run)
+
+
+def _write_run(records: Iterable[tuple], run_dir: str) -> str:
+    """Write the records to a new run file in run_dir, one tab separated line each, and
+    return its path"""
+    fd, run = tempfile.mkstemp(suffix='.tsv', dir=run_dir)
+    with open(fd, 'w', encoding='utf8') as f:
+        for record in records:
+            f.write('\t'.join(record) + '\n')
+    return run
+
+
+def _read_run(run: str) -> Iterator[tuple]:
+    """Yield the records of a run file"""
+    with open(run, 'r', encoding='utf8') as f:
+        for line in f:
+            yield tuple(line[:-1].split('\t'))
+
+
+def _unique(records: Iterable[tuple]) -> Iterator[tuple]:
+    """Yield the last of every group of consecutive records with the same first field, as
+    later redirects of a title replace earlier ones in RedirectResolver.build"""
+    last = None
+    for record in records:
+        if last is not None and record[0] != last[0]:
+            yield last
+        last = record
+
+    if last is not None:
+        yield last
+
+
+if __name__ == '__main__':
+    os.chdir(__file__[0:-len('wikigraph/redirects.py')])
+
+    import doctest
+    doctest.testmod()
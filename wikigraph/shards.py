@@ -0,0 +1,199 @@
+"""Read the info-XXXX.tsv and links-XXXX.tsv shards written by the extraction workers as if
+they were one file, without concatenating them
+
+A manifest is a small text file that lists the shards of one kind in order, with their sizes.
+Every function below that takes a path accepts either a manifest (ending with .manifest) or
+an ordinary file, so downstream stages can be given either.
+
+Specifications:
+ - write_manifest('data/processed/graph', 'info', 'data/processed/graph/wiki-info.manifest'):
+    Lists the info-XXXX.tsv shards of the graph directory in a manifest.
+ - get_files('path/to/wiki-info.manifest'):
+    Returns the paths of the shards listed in a manifest, or [path] for an ordinary file.
+ - iter_lines('path/to/wiki-info.manifest'):
+    Yields every line of every shard, in order.
+ - get_line_ranges('path/to/wiki-links.manifest', number_of_ranges):
+    Splits the shards into (file, start, end) byte ranges of roughly equal size that start
+    and end on line boundaries, so that each range can be parsed by a separate process.
+ - concatenate(files, 'path/to/wiki-info.tsv'):
+    Concatenates files inside the kernel (copy_file_range or sendfile) when possible.
+
+Example of use:
+>>> write_manifest('data/processed/graph', 'links', 'data/processed/graph/wiki-links.manifest')
+>>> ranges = get_line_ranges('data/processed/graph/wiki-links.manifest', 40)
+>>> ranges[0]
+('data/processed/graph/links-0001.tsv', 0, 123456789)
+"""
+from __future__ import annotations
+
+import os
+from typing import Iterable, Iterator
+
+from wikigraph import partition_data
+
+# The first line of every manifest: this magic string and the format version
+MANIFEST_MAGIC = 'wikigraph-manifest'
+MANIFEST_VERSION = 1
+
+# The number of bytes copied by each copy_file_range or sendfile call
+_COPY_SIZE = 1 << 30
+
+
+def get_shards(graph_dir: str, kind: str, extension: str = '.tsv') -> list[str]:
+    """Return the paths of the kind-XXXX.tsv shards in graph_dir (e.g. kind='info'), in
+    shard order. Shards with another extension, such as the edges-XXXX.bin shards of
+    title_ids, are found by passing it as extension."""
+    prefix = kind + '-'
+    shards = sorted(file for file in os.listdir(graph_dir)
+                    if file.startswith(prefix) and file.endswith(extension)
+                    and file[len(prefix):-len(extension)].isdigit())
+    return [os.path.join(graph_dir, file) for file in shards]
+
+
+def write_manifest(graph_dir: str, kind: str, manifest_file: str,
+                   extension: str = '.tsv') -> list[str]:
+    """Write a manifest listing the kind-XXXX.tsv shards (or kind-XXXX + extension shards)
+    in graph_dir to manifest_file, and return their paths.
+
+    The shards are listed relative to the directory of the manifest, so the two can be moved
+    together.
+    """
+    files = get_shards(graph_dir, kind, extension)
+    manifest_dir = os.path.dirname(manifest_file) or '.'
+
+    with open(manifest_file + '.tmp', 'w', encoding='utf8') as f:
+        f.write(f'{MANIFEST_MAGIC}\t{MANIFEST_VERSION}\n')
+        for file in files:
+            f.write(os.path.relpath(file, manifest_dir) + '\t' +
+                    str(os.path.getsize(file)) + '\n')
+    os.replace(manifest_file + '.tmp', manifest_file)
+
+    return files
+
+
+def read_manifest(manifest_file: str) -> list[str]:
+    """Return the paths of the shards listed in manifest_file.
+
+    Raise a ValueError if manifest_file is not a manifest, or if a shard has changed size
+    since the manifest was written."""
+    manifest_dir = os.path.dirname(manifest_file)
+    files = []
+
+    with open(manifest_file, 'r', encoding='utf8') as f:
+        if f.readline() != f'{MANIFEST_MAGIC}\t{MANIFEST_VERSION}\n':
+            raise ValueError(f'{manifest_file} is not a manifest')
+
+        for line in f:
+            name, size = line[:-1].split('\t')
+            file = os.path.join(manifest_dir, name)
+            if os.path.getsize(file) != int(size):
+                raise ValueError(f'{file} has changed since {manifest_file} was written')
+            files.append(file)
+
+    return files
+
+
+def get_files(filename: str) -> list[str]:
+    """Return the shards listed in filename if it is a manifest, or [filename] otherwise"""
+    if filename.endswith('.manifest'):
+        return read_manifest(filename)
+    return [filename]
+
+
+def iter_lines(filename: str) -> Iterator[str]:
+    """Yield every line of every file of get_files(filename), in order"""
+    for file in get_files(filename):
+        with open(file, 'r', encoding='utf8') as f:
+            yield from f
+
+
+def get_line_ranges(filename: str, num_ranges: int) -> list[tuple[str, int, int]]:
+    """Return a list of about num_ranges (file, start, end) byte ranges that cover every
+    file of get_files(filename). As with partition_data.get_line_ranges, every line lies in
+    exactly one range.
+
+    Each file gets a share of the ranges proportional to its size, and at least one unless
+    it is empty.
+
+    Preconditions:
+        - num_ranges > 0
+    """
+    files = get_files(filename)
+    sizes = [os.path.getsize(file) for file in files]
+    total = sum(sizes)
+
+    ranges = []
+    for file, size in zip(files, sizes):
+        if size == 0:
+            continue
+        file_ranges = max(1, num_ranges * size // total)
+        ranges.extend((file, start, end)
+                      for start, end in partition_data.get_line_ranges(file, file_ranges))
+
+    return ranges
+
+
+def concatenate(files: Iterable[str], output: str) -> None:
+    """Write the concatenation of files to output.
+
+    The bytes are copied with os.copy_file_range, which lets file systems that support it
+    share blocks instead of copying them, or otherwise os.sendfile, so they never pass
+    through Python. The bytes are read and written in Python where neither works.
+
+    Raise an OSError if a file is shorter than its size when it was opened, rather than
+    writing a truncated output.
+    """
+    with open(output, 'wb') as out_file:
+        for file in files:
+            with open(file, 'rb') as in_file:
+                _copy(in_file, out_file, os.path.getsize(file))
+
+
+def _copy(in_file, out_file, size: int) -> None:
+    """Append the first size bytes of in_file to out_file, inside the kernel if possible.
+
+    Raise an OSError if in_file ends before size bytes."""
+    for copy in (getattr(os, 'copy_file_range', None), getattr(os, 'sendfile', None)):
+        if copy is None:
+            continue
+
+        copied = 0
+        try:
+            while copied < size:
+                if copy is os.sendfile:
+                    sent = os.sendfile(out_file.fileno(), in_file.fileno(), copied,
+                                       min(_COPY_SIZE, size - copied))
+                else:
+                    sent = copy(in_file.fileno(), out_file.fileno(),
+                                min(_COPY_SIZE, size - copied), copied)
+                if sent == 0:
+                    break
+                copied += sent
+        except OSError:
+            if copied:
+                # Some bytes were already appended, so the other methods cannot take over
+                raise
+            continue
+
+        if copied == size:
+            return
+        if copied:
+            raise OSError(f'{in_file.name} ended after {copied} of {size} bytes')
+        # Some file systems copy nothing without raising an error, so try the next method
+
+    copied = 0
+    while copied < size:
+        data = in_file.read(min(_COPY_SIZE, size - copied))
+        if not data:
+            raise OSError(f'{in_file.name} ended after {copied} of {size} bytes')
+        out_file.write(data)
+        copied += len(data)
+    # The next file may be appended by the kernel, after whatever is still buffered
+    out_file.flush()
+
+
+if __name__ == '__main__':
+    os.chdir(__file__[0:-len('wikigraph/shards.py')])
+
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,217 @@
+"""Record how long every stage and worker of the pipeline takes and how much it processes,
+as JSON lines that can be compared across runs
+
+Telemetry is enabled through environment variables, so the worker processes of a stage
+inherit it whether they are forked or spawned.
+
+Specifications:
+ - enable('data/processed/telemetry.jsonl'):
+    Appends a record to the file for every measured stage and worker from now on, in this
+    process and in the processes it starts.
+ - measure('process_partition', worker='0001'):
+    A context manager that times its body and writes one record with its wall time, CPU
+    time, pages and bytes processed per second, peak RSS and the number of errors that the
+    parsers recovered from (see count_error) while it ran.
+ - count_error('parse_wikilink'):
+    Counts an error that a parser recovered from instead of raising.
+ - read_records('data/processed/telemetry.jsonl'):
+    Returns the records of a telemetry file.
+ - summarize(records):
+    Totals the records of every measured name.
+
+Example of use:
+>>> enable('data/processed/telemetry.jsonl')
+>>> with measure('count_pages') as m:
+...     m.add(pages=10, num_bytes=4096)
+>>> summarize(read_records('data/processed/telemetry.jsonl'))['count_pages']['pages']
+10
+"""
+from __future__ import annotations
+
+import os
+import sys
+import json
+import time
+import uuid
+import contextlib
+from collections import Counter
+from typing import Iterator, Optional
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, where peak RSS is not recorded
+    resource = None
+
+# The environment variables holding the telemetry file and the id of the current run
+TELEMETRY_ENV = 'WIKIGRAPH_TELEMETRY'
+RUN_ENV = 'WIKIGRAPH_RUN'
+
+# The errors that the parsers recover from:
+#  - parse_wikilink: a wikilink that could not be parsed, and was dropped
+#  - char_count: a page whose text could not be found, and was given 0 characters
+#  - last_revision: a page without a valid timestamp, and was given a last edit of 0
+ERROR_NAMES = ('parse_wikilink', 'char_count', 'last_revision')
+
+# The number of errors of each name recovered from in this process
+errors = Counter()
+
+
+class Measurement:
+    """The work done in the body of a measure block.
+
+    Instance Attributes:
+        - name: What is being measured, e.g. a stage or a worker function
+        - worker: Which worker or shard is being measured, if any
+        - pages: The number of pages processed
+        - num_bytes: The number of bytes processed
+    """
+    name: str
+    worker: Optional[str]
+    pages: int
+    num_bytes: int
+
+    def __init__(self, name: str, worker: Optional[str] = None) -> None:
+        self.name = name
+        self.worker = worker
+        self.pages = 0
+        self.num_bytes = 0
+
+    def add(self, pages: int = 0, num_bytes: int = 0) -> None:
+        """Record that pages more pages and num_bytes more bytes were processed."""
+        self.pages += pages
+        self.num_bytes += num_bytes
+
+
+def enable(telemetry_file: str, run: Optional[str] = None) -> str:
+    """Append a record to telemetry_file for every measure block from now on, in this process
+    and in the processes it starts, and return the id of the run the records belong to
+    (run, or a new id if it is None)."""
+    if run is None:
+        run = time.strftime('%Y%m%dT%H%M%S') + '-' + uuid.uuid4().hex[:8]
+
+    os.environ[TELEMETRY_ENV] = os.path.abspath(telemetry_file)
+    os.environ[RUN_ENV] = run
+    return run
+
+
+def disable() -> None:
+    """Stop writing records."""
+    os.environ.pop(TELEMETRY_ENV, None)
+    os.environ.pop(RUN_ENV, None)
+
+
+def count_error(name: str) -> None:
+    """Count an error named name (one of ERROR_NAMES) that a parser recovered from"""
+    errors[name] += 1
+
+
+def get_peak_rss() -> Optional[int]:
+    """Return the peak resident set size of this process so far in bytes, or None if it
+    cannot be measured"""
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+@contextlib.contextmanager
+def measure(name: str, worker: Optional[str] = None) -> Iterator[Measurement]:
+    """Time the body of the with block, and if telemetry is enabled, append a record of it to
+    the telemetry file once it ends, even if it raises an exception.
+
+    The record holds:
+        - run, name, worker, pid and start (seconds since the epoch)
+        - wall: the elapsed seconds
+        - cpu: the CPU seconds of the calling thread
+        - child_cpu: the CPU seconds of the child processes that ended meanwhile, e.g. the
+          workers of a process pool. Those of stages running at the same time are included.
+        - pages, bytes, pages_per_s and bytes_per_s, from Measurement.add
+        - peak_rss: the peak resident set size of the process so far, in bytes
+        - errors: the number of errors of each of ERROR_NAMES recovered from in this process
+        - status: 'ok', or 'failed' if the body raised an exception
+    """
+    measurement = Measurement(name, worker)
+    errors_before = errors.copy()
+    start = time.time()
+    wall_start = time.perf_counter()
+    cpu_start = time.thread_time()
+    times_start = os.times()
+    status = 'failed'
+
+    try:
+        yield measurement
+        status = 'ok'
+    finally:
+        telemetry_file = os.environ.get(TELEMETRY_ENV)
+        if telemetry_file is not None:
+            wall = time.perf_counter() - wall_start
+            times_end = os.times()
+            record = {
+                'run': os.environ.get(RUN_ENV),
+                'name': name,
+                'worker': worker,
+                'pid': os.getpid(),
+                'start': round(start, 3),
+                'wall': round(wall, 6),
+                'cpu': round(time.thread_time() - cpu_start, 6),
+                'child_cpu': round(times_end.children_user + times_end.children_system -
+                                   times_start.children_user - times_start.children_system, 6),
+                'pages': measurement.pages,
+                'bytes': measurement.num_bytes,
+                'pages_per_s': round(measurement.pages / wall, 3) if wall > 0 else None,
+                'bytes_per_s': round(measurement.num_bytes / wall, 3) if wall > 0 else None,
+                'peak_rss': get_peak_rss(),
+                'errors': {error: errors[error] - errors_before[error] for error in ERROR_NAMES},
+                'status': status
+            }
+            _append(telemetry_file, json.dumps(record) + '\n')
+
+
+def _append(telemetry_file: str, line: str) -> None:
+    """Append line to telemetry_file with a single write, so that the lines of processes
+    writing at the same time are not interleaved"""
+    fd = os.open(telemetry_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line.encode('utf-8'))
+    finally:
+        os.close(fd)
+
+
+def read_records(telemetry_file: str, run: Optional[str] = None) -> list[dict]:
+    """Return the records of telemetry_file, or only those of run if it is given"""
+    with open(telemetry_file, 'r', encoding='utf-8') as f:
+        records = [json.loads(line) for line in f if line.strip()]
+
+    return [record for record in records if run is None or record['run'] == run]
+
+
+def summarize(records: list[dict]) -> dict[str, dict]:
+    """Return the totals of the records of every name: their count, total wall, cpu and
+    child_cpu seconds, pages, bytes and errors, the largest peak_rss, and the number that
+    failed"""
+    summary = {}
+    for record in records:
+        totals = summary.setdefault(record['name'], {
+            'records': 0, 'wall': 0.0, 'cpu': 0.0, 'child_cpu': 0.0, 'pages': 0, 'bytes': 0,
+            'peak_rss': None, 'errors': dict.fromkeys(ERROR_NAMES, 0), 'failed': 0})
+
+        totals['records'] += 1
+        for field in ['wall', 'cpu', 'child_cpu', 'pages', 'bytes']:
+            totals[field] += record[field]
+        if record['peak_rss'] is not None:
+            totals['peak_rss'] = max(totals['peak_rss'] or 0, record['peak_rss'])
+        for error, count in record['errors'].items():
+            totals['errors'][error] = totals['errors'].get(error, 0) + count
+        totals['failed'] += record['status'] != 'ok'
+
+    return summary
+
+
+if __name__ == '__main__':
+    os.chdir(__file__[0:-len('wikigraph/telemetry.py')])
+
+    import doctest
+    doctest.testmod()
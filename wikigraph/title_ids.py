@@ -0,0 +1,272 @@
+"""Assign a dense integer id to every article title, and rewrite the links shards as binary
+lists of (source id, target id) edges
+
+Specifications:
+ - TitleTable.build(titles, 'path/to/wiki-titles.bin'):
+    Sorts the distinct titles, numbers them 0, 1, 2, ... in that order and writes the id <-> title
+    table to a file.
+ - TitleTable('path/to/wiki-titles.bin'):
+    Memory-maps a title table. Titles are looked up by id by slicing, and ids by title through a
+    hash table stored in the same file, so every process can share one copy of the table.
+ - encode_links('path/to/links-0001.tsv', table, 'path/to/edges-0001.bin'):
+    Rewrites a links shard as pairs of unsigned 32-bit ids.
+ - intern_shards('data/processed/graph'):
+    Builds the title table from the info shards, encodes every links shard in parallel and
+    lists the edge shards in wiki-edges.manifest, which csr_graph.load_csr_graph_interned
+    reads.
+
+Example of use:
+>>> intern_shards('data/processed/graph', max_workers=5)
+>>> table = TitleTable('data/processed/graph/wiki-titles.bin')
+>>> table.title(table.id('Anarchism'))
+'Anarchism'
+>>> edges = read_edges('data/processed/graph/edges-0001.bin')
+>>> table.title(edges[0]), table.title(edges[1])
+# The titles of the first edge of the first shard
+"""
+from __future__ import annotations
+
+import os
+import sys
+import mmap
+import zlib
+import concurrent.futures
+from array import array
+from typing import Iterable
+
+from tqdm import tqdm
+
+from wikigraph import shards, pipeline
+
+# Title table files start with an 8 byte header (this magic string, then the format version
+# and a padding byte) followed by the number of titles and the number of hash slots as 64-bit
+# integers. Then come the n + 1 title offsets, the hash slots and the utf-8 title bytes.
+TITLE_TABLE_MAGIC = b'WGTTL\x00'
+TITLE_TABLE_VERSION = 1
+TITLE_TABLE_HEADER_SIZE = 24
+
+
+class TitleTable:
+    """A read-only, memory-mapped table between article titles and their integer ids.
+
+    Ids are dense (0 to len(table) - 1) and follow the sorted order of the titles.
+
+    Pickling a TitleTable only sends its filename, so it can be given to worker processes
+    cheaply; each worker maps the same file.
+
+    Instance Attributes:
+        - filename: The path of the title table file.
+    """
+    filename: str
+
+    # Private Instance Attributes:
+    #     - _map: The memory map of the whole file.
+    #     - _offsets: The byte offset of every title in _titles, plus the end of the last one.
+    #     - _slots: An open addressing hash table holding id + 1 of each title, or 0 if empty.
+    #     - _titles: The utf-8 bytes of all the titles, concatenated in id order.
+    _map: mmap.mmap
+    _offsets: memoryview
+    _slots: memoryview
+    _titles: memoryview
+
+    def __init__(self, filename: str) -> None:
+        """Memory-map the title table file at filename.
+
+        Raise a ValueError if filename is not a title table file."""
+        with open(filename, 'rb') as f:
+            header = f.read(8)
+            if header[:len(TITLE_TABLE_MAGIC)] != TITLE_TABLE_MAGIC or \
+                    header[6] != TITLE_TABLE_VERSION:
+                raise ValueError(f'{filename} is not a title table file')
+
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self.filename = filename
+        view = memoryview(self._map)
+        num_titles = int.from_bytes(view[8:16], 'little')
+        num_slots = int.from_bytes(view[16:TITLE_TABLE_HEADER_SIZE], 'little')
+
+        offsets_end = TITLE_TABLE_HEADER_SIZE + 8 * (num_titles + 1)
+        slots_end = offsets_end + 8 * num_slots
+        self._offsets = _little_endian(view[TITLE_TABLE_HEADER_SIZE:offsets_end].cast('q'))
+        self._slots = _little_endian(view[offsets_end:slots_end].cast('q'))
+        self._titles = view[slots_end:]
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __contains__(self, title: str) -> bool:
+        return self.id(title) != -1
+
+    def __reduce__(self):
+        return (TitleTable, (self.filename,))
+
+    def title(self, i: int) -> str:
+        """Return the title with id i.
+
+        Raise an IndexError if i is not a valid id."""
+        if not 0 <= i < len(self):
+            raise IndexError('title id out of range')
+        return str(self._titles[self._offsets[i]:self._offsets[i + 1]], 'utf-8')
+
+    def id(self, title: str) -> int:
+        """Return the id of title, or -1 if it is not in the table."""
+        key = title.encode('utf-8')
+        mask = len(self._slots) - 1
+        slot = zlib.crc32(key) & mask
+
+        # Linear probing: look at consecutive slots until the title or an empty slot is found
+        while self._slots[slot]:
+            i = self._slots[slot] - 1
+            if self._titles[self._offsets[i]:self._offsets[i + 1]] == key:
+                return i
+            slot = (slot + 1) & mask
+
+        return -1
+
+    def titles(self) -> Iterable[str]:
+        """Yield every title, in id order."""
+        for i in range(len(self)):
+            yield self.title(i)
+
+    @staticmethod
+    def build(titles: Iterable[str], filename: str) -> TitleTable:
+        """Write a title table holding the distinct titles in titles to filename, and return
+        it"""
+        keys = sorted({title.encode('utf-8') for title in titles})
+
+        offsets = array('q', [0])
+        for key in keys:
+            offsets.append(offsets[-1] + len(key))
+
+        # Keep the hash table at most half full so that probes stay short
+        num_slots = 1
+        while num_slots < 2 * len(keys):
+            num_slots *= 2
+        mask = num_slots - 1
+
+        slots = array('q', bytes(8 * num_slots))
+        print("Building Title Table...")
+        for i, key in enumerate(tqdm(keys)):
+            slot = zlib.crc32(key) & mask
+            while slots[slot]:
+                slot = (slot + 1) & mask
+            slots[slot] = i + 1
+
+        if sys.byteorder != 'little':
+            offsets.byteswap()
+            slots.byteswap()
+
+        with open(filename, 'wb') as f:
+            f.write(TITLE_TABLE_MAGIC + bytes([TITLE_TABLE_VERSION, 0]))
+            f.write(len(keys).to_bytes(8, 'little') + num_slots.to_bytes(8, 'little'))
+            offsets.tofile(f)
+            slots.tofile(f)
+            for key in keys:
+                f.write(key)
+
+        return TitleTable(filename)
+
+
+def _little_endian(values: memoryview):
+    """Return values, copied and byteswapped on big-endian machines"""
+    if sys.byteorder == 'little':
+        return values
+
+    swapped = array(values.format, values)
+    swapped.byteswap()
+    return swapped
+
+
+def read_info_titles(info_file: str) -> Iterable[str]:
+    """Yield the title (first column) of every row of an info file, or of the shards listed
+    in an info manifest"""
+    for line in shards.iter_lines(info_file):
+        yield line[:line.index('\t')]
+
+
+def encode_links(links_file: str, table: TitleTable, output: str) -> tuple[int, int]:
+    """Write the edges of links_file to output as consecutive (source id, target id) pairs of
+    little-endian unsigned 32-bit integers, and return (edges written, links dropped).
+
+    Links whose target is not in the table (red links and other namespaces) are dropped.
+    """
+    edges = array('I')
+    dropped = 0
+
+    with open(links_file, 'r') as f:
+        for line in f:
+            row = line[:-1].split('\t')
+            source = table.id(row[0])
+            if source == -1:
+                dropped += len(row) - 1
+                continue
+
+            for target_title in row[1:]:
+                if not target_title:
+                    continue
+                target = table.id(target_title)
+                if target == -1:
+                    dropped += 1
+                else:
+                    edges.append(source)
+                    edges.append(target)
+
+    if sys.byteorder != 'little':
+        edges.byteswap()
+
+    with open(output, 'wb') as f:
+        edges.tofile(f)
+
+    return len(edges) // 2, dropped
+
+
+def read_edges(edges_file: str) -> array:
+    """Return the ids of an edges file written by encode_links, as a flat array of
+    source, target, source, target, ..."""
+    edges = array('I')
+    with open(edges_file, 'rb') as f:
+        edges.frombytes(f.read())
+
+    if sys.byteorder != 'little':
+        edges.byteswap()
+
+    return edges
+
+
+def intern_shards(graph_dir: str = "data/processed/graph", max_workers: int = 10) -> TitleTable:
+    """Build wiki-titles.bin from the info-XXXX.tsv shards in graph_dir, then encode every
+    links-XXXX.tsv shard into edges-XXXX.bin with concurrent processes and list them in
+    wiki-edges.manifest (see shards). Return the table.
+
+    Example Run:
+    >>> intern_shards('data/processed/graph', max_workers=5)
+    """
+    info_files = sorted(file for file in os.listdir(graph_dir)
+                        if file.startswith('info-') and file.endswith('.tsv'))
+    links_files = sorted(file for file in os.listdir(graph_dir)
+                         if file.startswith('links-') and file.endswith('.tsv'))
+
+    table = TitleTable.build((title for file in info_files
+                              for title in read_info_titles(f'{graph_dir}/{file}')),
+                             f'{graph_dir}/wiki-titles.bin')
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers,
+                                                mp_context=pipeline.get_process_context()) as executor:
+        processes = {executor.submit(encode_links, f'{graph_dir}/{file}', table,
+                                     f'{graph_dir}/edges-{file[len("links-"):-4]}.bin'): file
+                     for file in links_files}
+
+        for f in concurrent.futures.as_completed(processes):
+            edges, dropped = f.result()
+            print(f"{processes[f]}: {edges} edges, {dropped} links to unknown titles")
+
+    shards.write_manifest(graph_dir, 'edges', f'{graph_dir}/wiki-edges.manifest', '.bin')
+    return table
+
+
+if __name__ == '__main__':
+    os.chdir(__file__[0:-len('wikigraph/title_ids.py')])
+
+    import doctest
+    doctest.testmod()
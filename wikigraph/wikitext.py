@@ -1,8 +1,15 @@
 import re
 import os
+import bisect
 import wikitextparser as wtp
 import timeit
 from datetime import datetime
+from typing import Iterable, NamedTuple, Optional, Sequence
+
+from wikigraph import telemetry
+
+# Same matches as "\[\[[\S\s]*?\]\]", but "." with DOTALL is matched faster than [\S\s]
+link_regex = re.compile(r"\[\[.*?\]\]", re.DOTALL)
 
 
 def collect_links(wikitext: str) -> list:
@@ -29,8 +36,7 @@ def collect_links(wikitext: str) -> list:
     True
     """
     wikilinks = list()
-    pattern = re.compile("\[\[[\S\s]*?\]\]")
-    items = pattern.findall(wikitext)  # NOTE: Ignore style suggestions here.
+    items = link_regex.findall(wikitext)  # NOTE: Ignore style suggestions here.
     # items = re.findall("\[\[(.*?)\]\]", wikitext)
     # wikilinks = [parse_wikilink(wikilink) or '' for wikilink in items]
     for wikilink in items:
@@ -39,6 +45,57 @@ def collect_links(wikitext: str) -> list:
     return wikilinks
 
 
+def collect_links_batch(wikitext: str, starts: Sequence[int],
+                        ends: Sequence[int]) -> list[list]:
+    """Collect the links of many regions of wikitext (usually the texts of many pages) in a
+    single pass over it, instead of searching each region separately.
+
+    Region i is wikitext[starts[i]:ends[i]]. Every link found is attributed to its region by
+    binary search over starts, and the same links as collect_links on each region are
+    returned, one list per region. Each distinct wikilink is parsed only once per call.
+
+    Preconditions:
+        - len(starts) == len(ends)
+        - the regions are sorted and do not overlap
+
+    >>> text = "[[a]] [[b|B]] | [[c]] [[d#e]] | [[a]] [[unclosed | [[f]]"
+    >>> collect_links_batch(text, [0, 16, 32], [15, 31, len(text)])
+    [['a', 'b'], ['c', 'd'], ['a', 'unclosed ']]
+    >>> collect_links_batch(text, [0, 32], [15, 45])
+    [['a', 'b'], ['a']]
+    """
+    links = [[] for _ in starts]
+    parsed = {}
+    end = ends[-1] if ends else 0
+
+    region = 0
+    position = starts[0] if starts else 0
+    while region < len(starts):
+        for match in link_regex.finditer(wikitext, position, end):
+            link_start, link_end = match.span()
+            if link_start >= ends[region]:
+                region = bisect.bisect_right(starts, link_start, region) - 1
+
+            if link_end > ends[region]:
+                # The match starts between regions, or runs past the end of its region. In
+                # the latter case no later [[ of the region can be closed inside it either,
+                # so the region has no more links. Search again from the next region.
+                region += 1
+                if region < len(starts):
+                    position = starts[region]
+                break
+
+            wikilink = wikitext[link_start + 2:link_end - 2]
+            targets = parsed.get(wikilink)
+            if targets is None:
+                targets = parsed[wikilink] = parse_wikilink(wikilink) or []
+            links[region] += targets
+        else:
+            break
+
+    return links
+
+
 def parse_wikilink(wikilink: str) -> list:
     """Return the linked article.
 
@@ -80,8 +137,9 @@ def parse_wikilink(wikilink: str) -> list:
 
         # ...not renamed
         return [wikilink]
-    except Exception as e:
-        pass  # 
+    except Exception:
+        # Recorded so that links lost this way show up in the telemetry
+        telemetry.count_error('parse_wikilink')
 
 
 text_regex = re.compile("<text.*>")
@@ -102,15 +160,150 @@ def extract_content(wikitext: str) -> int:
     return wikitext[text_start_tag_end_index:len(wikitext) - 84]
 
 
-def last_revision(wikitext: str) -> int:
-    """Return last revision between <timestamp> tags GIVEN <page> ELEMENT
+def last_revision(wikitext: str, reference: int = None) -> int:
+    """Return the number of seconds between the last revision of a <page> ELEMENT (between its
+    <timestamp> tags) and the reference time, in seconds since the epoch. The reference
+    defaults to REFERENCE_TIMESTAMP, 2021-01-01T00:00:01Z.
+
+    Raise a ValueError if the page has no valid timestamp.
     """
     revision_start_index = wikitext.find("<timestamp>")
     revision_end_index = wikitext.find("</timestamp", revision_start_index)
-    # time zone agnostic
-    return (datetime.fromisoformat("2021-01-01T00:00:01+00:00").replace(tzinfo=None) -
-            datetime.fromisoformat(
-            wikitext[revision_start_index + 11:revision_end_index - 1].replace("Z", "+00:00")).replace(tzinfo=None)).seconds
+    return revision_age(wikitext[revision_start_index + 11:revision_end_index], reference)
+
+
+def last_revisions(pages: Iterable[str], reference: int = None,
+                   default: Optional[int] = None) -> list[int]:
+    """Return last_revision for each of the given pages.
+
+    If default is not None, pages without a valid timestamp get default instead of raising a
+    ValueError.
+    """
+    timestamps = []
+    for page in pages:
+        revision_start_index = page.find("<timestamp>")
+        revision_end_index = page.find("</timestamp", revision_start_index)
+        timestamps.append(page[revision_start_index + 11:revision_end_index])
+
+    return revision_ages(timestamps, reference, default)
+
+
+def revision_age(timestamp: str, reference: int = None) -> int:
+    """Return the number of seconds between a revision timestamp such as
+    "2020-12-31T00:00:00Z" and the reference time, in seconds since the epoch. The reference
+    defaults to REFERENCE_TIMESTAMP, 2021-01-01T00:00:01Z.
+
+    Raise a ValueError if timestamp is not in the YYYY-MM-DDTHH:MM:SSZ layout.
+
+    >>> revision_age("2020-12-31T00:00:00Z")
+    86401
+    >>> revision_age("2019-12-31T00:00:01Z")
+    31708800
+    >>> revision_age("2021-01-01T00:00:00Z", parse_timestamp("2021-01-02T00:00:00Z"))
+    86400
+    """
+    return (REFERENCE_EPOCH if reference is None else reference) - parse_timestamp(timestamp)
+
+
+def revision_ages(timestamps: Iterable[str], reference: int = None,
+                  default: Optional[int] = None) -> list[int]:
+    """Return revision_age for each of the given timestamps.
+
+    If default is not None, invalid timestamps get default instead of raising a ValueError.
+
+    >>> revision_ages(["2020-12-31T00:00:00Z", "", "2021-01-01T00:00:00Z"], default=0)
+    [86401, 0, 1]
+    """
+    if reference is None:
+        reference = REFERENCE_EPOCH
+
+    ages = []
+    for timestamp in timestamps:
+        try:
+            ages.append(reference - parse_timestamp(timestamp))
+        except ValueError:
+            if default is None:
+                raise
+            telemetry.count_error('last_revision')
+            ages.append(default)
+
+    return ages
+
+
+def parse_timestamp(timestamp: str) -> int:
+    """Return a timestamp in the fixed YYYY-MM-DDTHH:MM:SSZ layout used by the dumps as a
+    number of seconds since 1970-01-01T00:00:00Z.
+
+    This is much faster than going through datetime since the layout never changes, and the
+    days since the epoch of each date are cached.
+
+    Raise a ValueError if timestamp is not in that layout, or is not a real date and time
+    of day (such as "2021-02-31T00:00:00Z" or "2021-01-01T24:00:00Z").
+
+    >>> parse_timestamp("1970-01-01T00:00:00Z")
+    0
+    >>> parse_timestamp("2021-01-01T00:00:01Z")
+    1609459201
+    >>> parse_timestamp("2000-02-29T23:59:59Z")
+    951868799
+    """
+    if len(timestamp) != 20 or timestamp[10] != "T" or timestamp[13] != ":" \
+            or timestamp[16] != ":" or timestamp[19] != "Z":
+        raise ValueError(f"invalid timestamp: {timestamp!r}")
+
+    days = _days_since_epoch.get(timestamp[:10])
+    if days is None:
+        days = _days_since_epoch[timestamp[:10]] = _date_to_days(timestamp[:10])
+
+    hours, minutes, seconds = int(timestamp[11:13]), int(timestamp[14:16]), int(timestamp[17:19])
+    if not 0 <= hours < 24 or not 0 <= minutes < 60 or not 0 <= seconds < 60:
+        raise ValueError(f"invalid timestamp: {timestamp!r}")
+
+    return days * 86400 + hours * 3600 + minutes * 60 + seconds
+
+
+def _date_to_days(date: str) -> int:
+    """Return the number of days between 1970-01-01 and a YYYY-MM-DD date in the proleptic
+    Gregorian calendar
+
+    Raise a ValueError if date is not in that layout, or the day is not in the month.
+
+    >>> _date_to_days("2000-02-29")
+    11016
+    >>> _date_to_days("1900-02-29")
+    Traceback (most recent call last):
+    ...
+    ValueError: invalid date: '1900-02-29'
+    """
+    if date[4] != "-" or date[7] != "-":
+        raise ValueError(f"invalid date: {date!r}")
+    year, month, day = int(date[:4]), int(date[5:7]), int(date[8:10])
+    if not 1 <= month <= 12 or not 1 <= day <= _days_in_month(year, month):
+        raise ValueError(f"invalid date: {date!r}")
+
+    # Count years from March so that the leap day is the last day of the year
+    if month <= 2:
+        year -= 1
+    era = year // 400
+    year_of_era = year - era * 400
+    day_of_year = (153 * (month + (-3 if month > 2 else 9)) + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+
+    # 719468 is the number of days from 0000-03-01 to 1970-01-01
+    return era * 146097 + day_of_era - 719468
+
+
+def _days_in_month(year: int, month: int) -> int:
+    """Return the number of days in a month of the proleptic Gregorian calendar"""
+    if month == 2:
+        return 29 if year % 4 == 0 and (year % 100 != 0 or year % 400 == 0) else 28
+    return 30 if month in (4, 6, 9, 11) else 31
+
+
+# The time that revision ages are measured from by default: when the dump was collected
+REFERENCE_TIMESTAMP = "2021-01-01T00:00:01Z"
+_days_since_epoch = {}
+REFERENCE_EPOCH = parse_timestamp(REFERENCE_TIMESTAMP)
 
 
 def parse_redirect(wikitext: str) -> str:
@@ -129,6 +322,104 @@ def parse_redirect(wikitext: str) -> str:
     return wikitext[redirect_start_index + 17: redirect_end_index - 4]
 
 
+class PageRecord(NamedTuple):
+    """Everything extracted from a <page> element in a single pass by parse_page.
+
+    Offsets are string indices into the page that was parsed.
+
+    Instance Attributes:
+        - title: The title of the page
+        - redirect: The page this page redirects to, or "" if it is not a redirect
+        - text_start: The index of the first character of the text of the page
+        - text_end: The index just past the last character of the text of the page
+        - timestamp: The timestamp of the last revision, e.g. "2021-01-01T00:00:01Z"
+        - link_spans: The (start, end) indices of the contents of every [[wikilink]] in the
+                      text of the page, without the brackets
+    """
+    title: str
+    redirect: str
+    text_start: int
+    text_end: int
+    timestamp: str
+    link_spans: list[tuple[int, int]]
+
+
+def parse_page(wikitext: str, start: int = 0, end: int = None,
+               with_links: bool = True) -> PageRecord:
+    """Return the title, redirect, text bounds, last revision timestamp and link spans of a
+    <page> element, walking it once from start to end.
+
+    The page is wikitext[start:end], and every offset in the record is an index into
+    wikitext, so a page inside a larger buffer can be parsed without copying it out. If
+    with_links is False, link_spans is left empty (see collect_links_batch).
+
+    Each get_title, parse_redirect, char_count, last_revision and collect_links call scans
+    the page from its start; this finds every tag after the previous one instead, and only
+    searches the text for links. Unlike collect_links on the whole page, links in the
+    <comment> of the revision (its edit summary) are therefore not collected, since they
+    are not links of the article.
+
+    >>> page = ('<page>\\n<title>A</title>\\n<revision>\\n<timestamp>2020-12-31T00:00:00Z'
+    ...         '</timestamp>\\n<text bytes="9">[[B|b]] [[C]]</text>\\n</revision>\\n</page>')
+    >>> record = parse_page(page)
+    >>> record.title, record.redirect, record.timestamp
+    ('A', '', '2020-12-31T00:00:00Z')
+    >>> page[record.text_start:record.text_end]
+    '[[B|b]] [[C]]'
+    >>> [page[start:end] for start, end in record.link_spans]
+    ['B|b', 'C']
+    """
+    if end is None:
+        end = len(wikitext)
+
+    # <title> is 7 characters
+    title_start = wikitext.find("<title>", start, end) + 7
+    title_end = wikitext.find("</title>", title_start)
+
+    # The redirect tag, if any, comes before the revision
+    revision_start = wikitext.find("<revision>", title_end)
+    redirect_start = wikitext.find("<redirect", title_end, revision_start)
+    if redirect_start == -1:
+        redirect = ""
+    else:
+        # `<redirect title="` is 17 characters
+        redirect = wikitext[redirect_start + 17:wikitext.find('"', redirect_start + 17)]
+
+    # <timestamp> is 11 characters
+    timestamp_start = wikitext.find("<timestamp>", revision_start) + 11
+    timestamp_end = wikitext.find("</timestamp>", timestamp_start)
+
+    # The text starts after the > of its opening tag, not at the last > of that line
+    text_tag_start = wikitext.find("<text", timestamp_end)
+    text_start = wikitext.find(">", text_tag_start) + 1
+    if wikitext[text_start - 2] == "/":
+        # Empty text: <text bytes="0" />
+        text_end = text_start
+    else:
+        text_end = wikitext.rfind("</text>", text_start, end)
+
+    if with_links:
+        link_spans = [(match.start() + 2, match.end() - 2)
+                      for match in link_regex.finditer(wikitext, text_start, text_end)]
+    else:
+        link_spans = []
+
+    return PageRecord(wikitext[title_start:title_end], redirect, text_start, text_end,
+                      wikitext[timestamp_start:timestamp_end], link_spans)
+
+
+def collect_record_links(wikitext: str, record: PageRecord) -> list:
+    """Return the linked articles of a page given its record from parse_page.
+    Equivalent to collect_links on the text of the page, so links in the edit summary are
+    left out.
+    """
+    wikilinks = list()
+    for start, end in record.link_spans:
+        wikilinks += parse_wikilink(wikitext[start:end]) or ''
+
+    return wikilinks
+
+
 def get_title(wikitext: str) -> str:
     """Return title of <page>
     """
@@ -157,10 +448,8 @@ if __name__ == "__main__":
 
     # print((last_revision(wikitext) - datetime(2021, 1, 1)).seconds)
 
-    # Code for comparing the time taken between wikitextparser and our solution
-    # versus_wtp.time_versus("collect_links(wikitext)",
-    #                        "wtp.parse(wikitext)",
-    #                        {"times": 2}, globals())
+    # To time the extractors against wikitextparser, run the benchmark suite instead:
+    # python -m wikigraph.experiments.benchmark
 
     # Code for comparing the output of wikitextparser and our solution
     # versus_wtp.diff_lists([item for item in collect_links(wikitext) if item],